@@ -0,0 +1,138 @@
+"""Benchmark of file serving: the /files static mount against /downloads.
+
+Serves a generated recording from a temporary directory with uvicorn and
+reports the throughput of full downloads and the latency of random range
+requests for both routes, and writes the results to a JSON file.
+
+    python benchmarks/downloads.py --size-mb 512 --output downloads.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+import uvicorn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+ROUTES = ["files", "downloads"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def full_download(client: httpx.Client, url: str, repeats: int) -> dict:
+    durations = []
+    size = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with client.stream("GET", url) as response:
+            size = sum(len(chunk) for chunk in response.iter_raw())
+        durations.append(time.perf_counter() - start)
+    best = min(durations)
+    return {"bytes": size, "best_s": best, "megabytes_per_second": size / best / 1e6}
+
+
+def range_requests(
+    client: httpx.Client, url: str, file_size: int, range_size: int, count: int
+) -> dict:
+    rng = random.Random(0)
+    latencies = np.zeros(count)
+    for i in range(count):
+        start = rng.randrange(0, file_size - range_size)
+        headers = {"Range": f"bytes={start}-{start + range_size - 1}"}
+        began = time.perf_counter()
+        response = client.get(url, headers=headers)
+        latencies[i] = time.perf_counter() - began
+        assert response.status_code == 206 and len(response.content) == range_size
+    return {
+        "count": count,
+        "range_bytes": range_size,
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1e3),
+        "latency_p99_ms": float(np.percentile(latencies, 99) * 1e3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--range-kb", type=int, default=256)
+    parser.add_argument("--range-count", type=int, default=200)
+    parser.add_argument("--output", default="downloads.json")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # the server serves RECORDINGS_DIR relative to the working directory
+        os.chdir(directory)
+        import fastapi_http_server
+        from recorder import RECORDINGS_DIR
+
+        file_size = args.size_mb * 1024 * 1024
+        with open(os.path.join(RECORDINGS_DIR, "bench.mp4"), "wb") as video_file:
+            video_file.write(os.urandom(file_size))
+
+        port = free_port()
+        server = start_server(fastapi_http_server.app, port)
+        results = []
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            for route in ROUTES:
+                url = f"/{route}/bench.mp4"
+                result = {
+                    "route": route,
+                    "full": full_download(client, url, args.repeats),
+                    "ranges": range_requests(
+                        client,
+                        url,
+                        file_size,
+                        args.range_kb * 1024,
+                        args.range_count,
+                    ),
+                }
+                print(
+                    f"/{route}: {result['full']['megabytes_per_second']:.0f} MB/s, "
+                    f"range p50 {result['ranges']['latency_p50_ms']:.2f} ms, "
+                    f"p99 {result['ranges']['latency_p99_ms']:.2f} ms"
+                )
+                results.append(result)
+        server.should_exit = True
+        fastapi_http_server.recordings.close()
+
+    report = {
+        "benchmark": "downloads",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "results": results,
+    }
+    with open(output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""Benchmark of the end-to-end record path driven by the simulated camera.
+
+Reports sustained frames/s, per-frame write latency (p50/p99), drop counts,
+encoder capacity and CPU use, and start/stop wall time for every combination
+of resolution and container format (including the ffmpeg engine's codecs),
+and writes the results to a JSON file for comparison between releases.
+
+    python benchmarks/record_path.py --duration 5 --output record_path.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import imagingcontrol4 as ic4  # noqa: E402
+from ffmpeg_writer import (  # noqa: E402
+    FFMPEG_CODECS,
+    FfmpegVideoWriter,
+    ffmpeg_available,
+)
+from frame_writer import OverflowPolicy  # noqa: E402
+from raw_recording import RawVideoWriter  # noqa: E402
+from recorder import RECORDINGS_DIR, EncoderEngine  # noqa: E402
+from simulated_recorder import NullVideoWriter, SimulatedRecorder  # noqa: E402
+
+IC4_WRITER_TYPES = {
+    "mp4-h264": ic4.VideoWriterType.MP4_H264,
+    "mp4-h265": ic4.VideoWriterType.MP4_H265,
+}
+# ffmpeg-h264, ffmpeg-ffv1, ...
+FFMPEG_PREFIX = "ffmpeg-"
+
+
+class Ic4CopyingWriter:
+    """Feeds simulated frames to a native ic4 writer via an ic4 buffer pool."""
+
+    def __init__(self, writer_type: ic4.VideoWriterType):
+        self.writer = ic4.VideoWriter(writer_type)
+        self.pool = ic4.BufferPool()
+
+    def begin_file(self, path, image_type, frame_rate):
+        self.buffer = self.pool.get_buffer(image_type)
+        self.writer.begin_file(path, image_type, frame_rate)
+
+    def add_frame(self, buf):
+        np.copyto(self.buffer.numpy_wrap(), buf.numpy_wrap())
+        self.writer.add_frame(self.buffer)
+
+    def finish_file(self):
+        self.writer.finish_file()
+
+
+class TimedWriter:
+    """Records the wall time of every add_frame call of the wrapped writer."""
+
+    def __init__(self, writer, max_frames: int):
+        self.writer = writer
+        self.latencies_ns = np.zeros(max_frames, dtype=np.int64)
+        self.frames = 0
+
+    def begin_file(self, path, image_type, frame_rate):
+        self.frames = 0
+        self.writer.begin_file(path, image_type, frame_rate)
+
+    def add_frame(self, buf):
+        start = time.perf_counter_ns()
+        self.writer.add_frame(buf)
+        if self.frames < len(self.latencies_ns):
+            self.latencies_ns[self.frames] = time.perf_counter_ns() - start
+        self.frames += 1
+
+    def finish_file(self):
+        self.writer.finish_file()
+
+
+def create_writer(args, container: str, max_frames: int):
+    if container == "null":
+        return NullVideoWriter(encode_time=args.encode_time)
+    if container == "raw":
+        return RawVideoWriter(max_frames)
+    if container.startswith(FFMPEG_PREFIX):
+        return FfmpegVideoWriter(
+            container[len(FFMPEG_PREFIX) :], args.preset, args.threads
+        )
+    return Ic4CopyingWriter(IC4_WRITER_TYPES[container])
+
+
+def file_extension(container: str) -> str:
+    if container == "raw":
+        return ".raw"
+    if container.startswith(FFMPEG_PREFIX):
+        return FFMPEG_CODECS[container[len(FFMPEG_PREFIX) :]].extension
+    return ".mp4"
+
+
+def run_case(args, width: int, height: int, container: str) -> dict:
+    max_frames = int(args.duration * args.frame_rate * 2) + 1000
+    encoder = create_writer(args, container, max_frames)
+    writer = TimedWriter(encoder, max_frames)
+    recorder = SimulatedRecorder(
+        width=width,
+        height=height,
+        pixel_format=args.pixel_format,
+        frame_rate=args.frame_rate,
+        video_writer=writer,
+        writer_queue_depth=args.queue_depth,
+        writer_overflow_policy=OverflowPolicy(args.overflow_policy),
+    )
+    file_name = f"benchmark_{width}x{height}{file_extension(container)}"
+    recorder.start_streaming()
+    time.sleep(args.warmup)
+
+    try:
+        stats_at_start = recorder.grabber.stream_statistics
+        recording_start = time.perf_counter()
+        recorder.start_recording(file_name)
+        start_recording_s = time.perf_counter() - recording_start
+
+        time.sleep(args.duration)
+
+        stats_at_stop = recorder.grabber.stream_statistics
+        start = time.perf_counter()
+        recorder.stop_recording()
+        stop_recording_s = time.perf_counter() - start
+        recorded_s = time.perf_counter() - recording_start
+    finally:
+        recorder.stop_streaming()
+
+    writer_stats = recorder.get_writer_statistics()
+    encoder_stats = recorder.encoder_statistics
+    if isinstance(encoder, FfmpegVideoWriter):
+        encoder_stats.engine = EncoderEngine.FFMPEG.value
+        encoder_stats.process_cpu_s = encoder.cpu_seconds
+        encoder_stats.file_flushed(encoder.flushed_ns)
+    latencies_us = writer.latencies_ns[: min(writer.frames, max_frames)] / 1e3
+    if container != "null":
+        path = os.path.join(RECORDINGS_DIR, file_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    return {
+        "width": width,
+        "height": height,
+        "pixel_format": args.pixel_format,
+        "container": container,
+        "target_frame_rate": args.frame_rate,
+        "frames_written": writer_stats.frames_written,
+        "frames_per_second": writer_stats.frames_written / recorded_s,
+        "write_latency_p50_us": (
+            float(np.percentile(latencies_us, 50)) if len(latencies_us) else None
+        ),
+        "write_latency_p99_us": (
+            float(np.percentile(latencies_us, 99)) if len(latencies_us) else None
+        ),
+        "encoder_frames_per_second": encoder_stats.frames_per_second,
+        "encoder_cpu_percent": encoder_stats.cpu_percent,
+        "writer_dropped": writer_stats.frames_dropped,
+        "writer_max_queue_depth": writer_stats.max_queue_depth,
+        "sink_underrun": stats_at_stop.sink_underrun - stats_at_start.sink_underrun,
+        "start_recording_ms": start_recording_s * 1e3,
+        "stop_recording_ms": stop_recording_s * 1e3,
+    }
+
+
+def format_us(latency_us: float | None) -> str:
+    # no latencies when no frame was written
+    return "n/a" if latency_us is None else f"{latency_us:.0f} us"
+
+
+def available_containers(requested: list[str]) -> list[str]:
+    containers = []
+    for container in requested:
+        if container in ("null", "raw"):
+            containers.append(container)
+            continue
+        if container.startswith(FFMPEG_PREFIX):
+            if ffmpeg_available():
+                containers.append(container)
+            else:
+                print(f"Skipping {container}: ffmpeg not found", file=sys.stderr)
+            continue
+        try:
+            ic4.VideoWriter(IC4_WRITER_TYPES[container])
+            containers.append(container)
+        except ic4.IC4Exception as e:
+            print(f"Skipping {container}: {e}", file=sys.stderr)
+    return containers
+
+
+def parse_resolution(text: str) -> tuple[int, int]:
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--warmup", type=float, default=0.5)
+    parser.add_argument("--frame-rate", type=float, default=100.0)
+    parser.add_argument("--pixel-format", default="Mono8")
+    parser.add_argument(
+        "--resolutions", default="720x484,1440x1080", help="comma separated WxH"
+    )
+    parser.add_argument(
+        "--containers",
+        default="null,raw,mp4-h264,mp4-h265,ffmpeg-h264,ffmpeg-ffv1,ffmpeg-mjpeg",
+        help="comma separated, from null,raw,"
+        + ",".join([*IC4_WRITER_TYPES, *(FFMPEG_PREFIX + c for c in FFMPEG_CODECS)]),
+    )
+    parser.add_argument(
+        "--encode-time",
+        type=float,
+        default=0.0,
+        help="seconds the null writer spends per frame",
+    )
+    parser.add_argument(
+        "--preset", default="veryfast", help="x264 preset of ffmpeg-h264"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=0, help="ffmpeg encoder threads, 0 for auto"
+    )
+    parser.add_argument("--queue-depth", type=int, default=16)
+    parser.add_argument(
+        "--overflow-policy",
+        default=OverflowPolicy.BLOCK.value,
+        choices=[p.value for p in OverflowPolicy],
+    )
+    parser.add_argument("--output", default="record_path.json")
+    args = parser.parse_args()
+
+    results = []
+    with ic4.Library.init_context():
+        os.makedirs(RECORDINGS_DIR, exist_ok=True)
+        containers = available_containers(args.containers.split(","))
+        for resolution in args.resolutions.split(","):
+            width, height = parse_resolution(resolution)
+            for container in containers:
+                result = run_case(args, width, height, container)
+                print(
+                    f"{width}x{height} {container}: "
+                    f"{result['frames_per_second']:.1f} fps, "
+                    f"p50 {format_us(result['write_latency_p50_us'])}, "
+                    f"p99 {format_us(result['write_latency_p99_us'])}, "
+                    f"encoder {result['encoder_frames_per_second']:.0f} fps "
+                    f"at {result['encoder_cpu_percent'] or 0:.0f}% CPU, "
+                    f"dropped {result['writer_dropped']}/{result['sink_underrun']}, "
+                    f"start {result['start_recording_ms']:.2f} ms, "
+                    f"stop {result['stop_recording_ms']:.2f} ms"
+                )
+                results.append(result)
+
+    report = {
+        "benchmark": "record_path",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Benchmark of the cold start of the REST server.
+
+Reports the import time of the server's modules (`python -X importtime`,
+slowest imports first) and the time from launching a server process to its
+first answered request, with a recordings directory of a given size, and
+writes the results to a JSON file for comparison between releases.
+
+    python benchmarks/startup.py --recordings 1000 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# run in a fresh interpreter in the recordings' parent directory
+SERVER_CODE = """
+import sys
+import uvicorn
+from fastapi_http_server import ServerConfig, create_app
+
+port = int(sys.argv[1])
+uvicorn.run(create_app(ServerConfig(port=port)), port=port, log_level="warning")
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def python_env() -> dict:
+    return {**os.environ, "PYTHONPATH": SRC_DIR}
+
+
+def import_times(module: str, top: int) -> dict:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=python_env(),
+    )
+    wall_s = time.perf_counter() - started
+    if result.returncode != 0:
+        return {"module": module, "error": result.stderr.strip().splitlines()[-1]}
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        imports.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    # the module itself is reported last, its direct imports are indented once
+    total_us = imports[-1][2]
+    direct = [i for i in imports if i[0].startswith("   ") and i[0][3] != " "]
+    direct.sort(key=lambda i: i[2], reverse=True)
+    return {
+        "module": module,
+        "import_ms": total_us / 1e3,
+        "interpreter_wall_ms": wall_s * 1e3,
+        "slowest_imports": [
+            {"module": name.strip(), "cumulative_ms": cumulative_us / 1e3}
+            for name, _, cumulative_us in direct[:top]
+        ],
+    }
+
+
+def time_to_first_request(directory: str, timeout_s: float = 30.0) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-c", SERVER_CODE, str(port)], cwd=directory, env=python_env()
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            while time.perf_counter() - started < timeout_s:
+                try:
+                    if client.get("/recordings", params={"limit": 1}).is_success:
+                        return time.perf_counter() - started
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+        raise TimeoutError("The server did not answer")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--modules",
+        default="fastapi_http_server,headless",
+        help="comma separated modules to measure the import time of",
+    )
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--recordings", type=int, default=1000, help="recordings on disk at start"
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default="startup.json")
+    args = parser.parse_args()
+
+    imports = []
+    for module in args.modules.split(","):
+        result = import_times(module, args.top)
+        imports.append(result)
+        if "error" in result:
+            print(f"import {module}: {result['error']}")
+            continue
+        print(f"import {module}: {result['import_ms']:.0f} ms")
+        for slow in result["slowest_imports"][:3]:
+            print(f"  {slow['module']}: {slow['cumulative_ms']:.0f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        recordings_dir = os.path.join(directory, "recordings")
+        os.makedirs(recordings_dir)
+        for i in range(args.recordings):
+            with open(os.path.join(recordings_dir, f"rec{i:06d}.mp4"), "wb") as f:
+                f.write(b"\0" * 1024)
+        durations = [time_to_first_request(directory) for _ in range(args.repeats)]
+    first_request = {
+        "recordings": args.recordings,
+        # the first start also builds the catalog's index
+        "first_start_ms": durations[0] * 1e3,
+        "median_ms": statistics.median(durations) * 1e3,
+        "best_ms": min(durations) * 1e3,
+    }
+    print(
+        f"first request: {first_request['median_ms']:.0f} ms median, "
+        f"{first_request['first_start_ms']:.0f} ms on first start"
+    )
+
+    report = {
+        "benchmark": "startup",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "imports": imports,
+        "first_request": first_request,
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from threading import Lock
+from typing import Any, Callable, Iterable
+
+# camera of commands that do not name one
+DEFAULT_CAMERA = "default"
+
+
+class CommandStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class Command:
+    command_id: str
+    name: str
+    status: CommandStatus = CommandStatus.PENDING
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    error: str | None = None
+    # cameras the command drives, see RecorderCommandQueue
+    cameras: tuple[str, ...] = ()
+    future: Future | None = field(default=None, repr=False)
+    _run: Callable[[], None] | None = field(default=None, repr=False)
+
+
+class RecorderCommandQueue:
+    """Runs recorder commands on worker threads, one at a time per camera.
+
+    Camera and encoder calls (opening files, finalising MP4s) can take a long
+    time. Submitting them here keeps them off the event loop; handlers either
+    `wait` for the command without blocking the loop or hand out the command
+    id so clients can poll it. Every command names the cameras it drives:
+    commands of one camera run in the order they were submitted, commands of
+    different cameras run in parallel, and a command of several cameras
+    waits until it is next on each of them.
+    """
+
+    def __init__(self, max_history: int = 1000, max_workers: int = 16):
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="recorder-commands"
+        )
+        self._commands: OrderedDict[str, Command] = OrderedDict()
+        # commands waiting for or running on each camera, in submission order
+        self._cameras: dict[str, deque[Command]] = {}
+        self._ids = itertools.count(1)
+        self._lock = Lock()
+
+    def submit(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        *args,
+        on_done: Callable[[Command], None] | None = None,
+        cameras: Iterable[str] = (DEFAULT_CAMERA,),
+    ) -> Command:
+        command = Command(
+            command_id="", name=name, cameras=tuple(cameras), future=Future()
+        )
+
+        def run():
+            command.status = CommandStatus.RUNNING
+            command.started_at = time.time()
+            try:
+                result = func(*args)
+                command.status = CommandStatus.DONE
+            except Exception as e:
+                command.error = str(e)
+                command.status = CommandStatus.FAILED
+                result = e
+            command.finished_at = time.time()
+            try:
+                if on_done is not None:
+                    on_done(command)
+            finally:
+                self._finished(command)
+                if command.status == CommandStatus.FAILED:
+                    command.future.set_exception(result)
+                else:
+                    command.future.set_result(result)
+
+        command._run = run
+        with self._lock:
+            command.command_id = str(next(self._ids))
+            self._commands[command.command_id] = command
+            while len(self._commands) > self.max_history:
+                self._commands.popitem(last=False)
+            for camera in command.cameras:
+                self._cameras.setdefault(camera, deque()).append(command)
+            self._start_if_next(command)
+        return command
+
+    def get(self, command_id: str) -> Command | None:
+        with self._lock:
+            return self._commands.get(command_id)
+
+    async def wait(self, command: Command) -> Any:
+        return await asyncio.wrap_future(command.future)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _start_if_next(self, command: Command):
+        # called with the lock held
+        if command._run is None:
+            return
+        if all(self._cameras[camera][0] is command for camera in command.cameras):
+            run, command._run = command._run, None
+            self._executor.submit(run)
+
+    def _finished(self, command: Command):
+        with self._lock:
+            for camera in command.cameras:
+                waiting = self._cameras[camera]
+                waiting.popleft()
+                if waiting:
+                    self._start_if_next(waiting[0])
+                else:
+                    del self._cameras[camera]
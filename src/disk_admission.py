@@ -0,0 +1,228 @@
+"""Admission of recordings against the bandwidth and free space of the disk.
+
+Before a recording starts, the data rate it needs, estimated from frame size,
+frame rate and encoder, is compared with the sequential write throughput of
+the recordings' disk and with its free space. The throughput is measured once
+per file system and cached, since measuring it writes a few hundred MB. While
+recordings run, the free space is checked against the same rates, so that
+they can be stopped while there is still room to finish their files.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field
+from threading import Lock
+
+from recorder import EncoderEngine, RecorderSettings, RecordingMode
+
+# bytes written per byte of raw frames; upper bounds, noisy scenes compress worse
+COMPRESSION_RATIOS = {
+    RecordingMode.RAW.value: 1.0,
+    "ffv1": 0.6,
+    "mjpeg": 0.2,
+    "h264": 0.1,
+    EncoderEngine.IC4.value: 0.1,
+}
+
+# size of the write benchmark and of its writes
+BENCHMARK_BYTES = 256 * 2**20
+BENCHMARK_BLOCK_BYTES = 4 * 2**20
+# cached throughputs older than this are measured again
+BENCHMARK_MAX_AGE_S = 7 * 24 * 3600.0
+
+# free space never used by recordings, e.g. for sidecars and the catalog
+DEFAULT_RESERVE_BYTES = 1_000_000_000
+# recordings that would fill the disk sooner are refused, sooner than
+# WARN_SECONDS they are admitted with a warning
+MIN_SECONDS = 60.0
+WARN_SECONDS = 600.0
+# running recordings are stopped this long before they would reach the reserve
+STOP_MARGIN_S = 10.0
+# share of the measured throughput recordings may use without a warning
+HEADROOM = 0.8
+
+
+def compression_ratio(settings: RecorderSettings | None = None) -> float:
+    settings = settings or RecorderSettings()
+    if settings.mode == RecordingMode.RAW:
+        return COMPRESSION_RATIOS[RecordingMode.RAW.value]
+    if settings.encoder == EncoderEngine.FFMPEG:
+        return COMPRESSION_RATIOS.get(settings.codec, 1.0)
+    return COMPRESSION_RATIOS[EncoderEngine.IC4.value]
+
+
+def estimate_bytes_per_second(
+    frame_nbytes: int, frame_rate: float, settings: RecorderSettings | None = None
+) -> float:
+    """Data rate of a recording, from the size of its raw frames."""
+    return frame_nbytes * frame_rate * compression_ratio(settings)
+
+
+def measure_write_throughput(
+    directory: str,
+    size_bytes: int = BENCHMARK_BYTES,
+    block_bytes: int = BENCHMARK_BLOCK_BYTES,
+) -> float:
+    """Sequential write throughput into `directory` in bytes per second,
+    including flushing the data to the disk."""
+    # random data, so that compressing file systems report their real speed
+    block = os.urandom(block_bytes)
+    fd, path = tempfile.mkstemp(dir=directory, prefix=".write-benchmark-")
+    try:
+        started = time.perf_counter()
+        with os.fdopen(fd, "wb", buffering=0) as benchmark_file:
+            written = 0
+            while written < size_bytes:
+                written += benchmark_file.write(block)
+            os.fsync(benchmark_file.fileno())
+        elapsed_s = time.perf_counter() - started
+    finally:
+        os.remove(path)
+    return written / elapsed_s
+
+
+class ThroughputCache:
+    """Measured write throughputs per file system, in a JSON file."""
+
+    def __init__(self, path: str, max_age_s: float = BENCHMARK_MAX_AGE_S):
+        self.path = path
+        self.max_age_s = max_age_s
+
+    @staticmethod
+    def _key(directory: str) -> str:
+        return str(os.stat(directory).st_dev)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, directory: str) -> float | None:
+        entry = self._load().get(self._key(directory))
+        if entry is None or time.time() - entry["measured_at"] > self.max_age_s:
+            return None
+        return entry["bytes_per_second"]
+
+    def put(self, directory: str, bytes_per_second: float):
+        entries = self._load()
+        entries[self._key(directory)] = {
+            "bytes_per_second": bytes_per_second,
+            "measured_at": time.time(),
+        }
+        with open(f"{self.path}.tmp", "w") as cache_file:
+            json.dump(entries, cache_file)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+@dataclass
+class Preflight:
+    # of the new recordings and of those already running
+    required_bytes_per_second: float
+    write_bytes_per_second: float
+    free_bytes: int
+    # recording time until the free space reaches the reserve; None at no rate
+    seconds_left: float | None
+    warnings: list[str] = field(default_factory=list)
+    # why the recordings would fail, None if they are admitted
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _mb(n: float) -> str:
+    return f"{n / 1e6:.0f} MB"
+
+
+class DiskAdmission:
+    """Decides whether recordings fit the disk of `directory`."""
+
+    def __init__(
+        self,
+        directory: str,
+        reserve_bytes: int = DEFAULT_RESERVE_BYTES,
+        min_seconds: float = MIN_SECONDS,
+        warn_seconds: float = WARN_SECONDS,
+        stop_margin_s: float = STOP_MARGIN_S,
+        headroom: float = HEADROOM,
+        benchmark_bytes: int = BENCHMARK_BYTES,
+        cache_path: str | None = None,
+    ):
+        self.directory = directory
+        self.reserve_bytes = reserve_bytes
+        self.min_seconds = min_seconds
+        self.warn_seconds = warn_seconds
+        self.stop_margin_s = stop_margin_s
+        self.headroom = headroom
+        self.benchmark_bytes = benchmark_bytes
+        # kept next to the recordings directory, like the catalog
+        self.cache = ThroughputCache(cache_path or f"{directory}-disk.json")
+        self._write_bytes_per_second: float | None = None
+        self._measure_lock = Lock()
+
+    def free_bytes(self) -> int:
+        return shutil.disk_usage(self.directory).free
+
+    def write_bytes_per_second(self) -> float:
+        """The disk's cached write throughput; measured if there is none."""
+        with self._measure_lock:
+            if self._write_bytes_per_second is None:
+                throughput = self.cache.get(self.directory)
+                if throughput is None:
+                    throughput = measure_write_throughput(
+                        self.directory, self.benchmark_bytes
+                    )
+                    self.cache.put(self.directory, throughput)
+                self._write_bytes_per_second = throughput
+            return self._write_bytes_per_second
+
+    def preflight(
+        self, bytes_per_second: float, running_bytes_per_second: float = 0.0
+    ) -> Preflight:
+        """Check recordings writing `bytes_per_second` in addition to those
+        already running."""
+        required = bytes_per_second + running_bytes_per_second
+        throughput = self.write_bytes_per_second()
+        free = self.free_bytes()
+        usable = free - self.reserve_bytes
+        seconds_left = max(usable, 0) / required if required > 0 else None
+        preflight = Preflight(required, throughput, free, seconds_left)
+
+        if usable <= 0:
+            preflight.error = (
+                f"Only {_mb(free)} free on disk, {_mb(self.reserve_bytes)} are reserved"
+            )
+        elif seconds_left is not None and seconds_left < self.min_seconds:
+            preflight.error = (
+                f"The disk is full after {seconds_left:.0f} s "
+                f"at {_mb(required)}/s, {self.min_seconds:.0f} s are required"
+            )
+        elif seconds_left is not None and seconds_left < self.warn_seconds:
+            preflight.warnings.append(f"The disk is full after {seconds_left:.0f} s")
+
+        if required > throughput:
+            preflight.error = preflight.error or (
+                f"Recording needs {_mb(required)}/s, "
+                f"the disk writes {_mb(throughput)}/s"
+            )
+        elif required > self.headroom * throughput:
+            preflight.warnings.append(
+                f"Recording needs {_mb(required)}/s, "
+                f"{required / throughput:.0%} of the disk's write throughput"
+            )
+        return preflight
+
+    def should_stop(
+        self, bytes_per_second: float, free_bytes: int | None = None
+    ) -> bool:
+        """Whether recordings writing `bytes_per_second` have to stop now to
+        keep the reserve."""
+        if free_bytes is None:
+            free_bytes = self.free_bytes()
+        return free_bytes - self.reserve_bytes < bytes_per_second * self.stop_margin_s
@@ -0,0 +1,179 @@
+"""Serving of recorded files with range, conditional and compressed responses.
+
+Finished files are sent by Starlette's FileResponse, which handles ranges and
+uses the server's zero-copy path send where available. Files of a recording
+in progress are still growing: they are served up to their current length,
+without an ETag and with an unknown total length in Content-Range.
+"""
+
+import gzip
+import mimetypes
+import os
+from functools import lru_cache
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1024 * 1024
+# sidecars that are worth compressing; videos and binary logs are not
+COMPRESSIBLE_SUFFIXES = (".json",)
+
+
+class LargeChunkFileResponse(FileResponse):
+    chunk_size = CHUNK_SIZE
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in tags
+
+
+def parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+    """Content codings of an Accept-Encoding header and their q-values."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    # an invalid q-value does not accept the coding
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """The accepted compression with the highest q-value, zstd over gzip on ties."""
+    qualities = parse_accept_encoding(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    candidates = ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+@lru_cache(maxsize=128)
+def compressed_file(path: str, mtime_ns: int, size: int, encoding: str) -> bytes:
+    # mtime and size are part of the cache key, so changed files are compressed again
+    with open(path, "rb") as source:
+        data = source.read()
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """First and last byte of a single `bytes=` range, or None to ignore it.
+
+    Raises ValueError if the range cannot be satisfied.
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    first, separator, last = ranges.strip().partition("-")
+    if not separator:
+        return None
+    try:
+        if not first:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, end
+
+
+def iter_file(path: str, start: int, end: int, chunk_size: int = CHUNK_SIZE):
+    with open(path, "rb") as source:
+        source.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = source.read(min(chunk_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(
+    path: str, request_headers: Headers, growing: bool = False
+) -> Response:
+    stat_result = os.stat(path)
+    if growing:
+        return _growing_file_response(path, stat_result.st_size, request_headers)
+
+    etag = file_etag(stat_result)
+    encoding = None
+    if path.endswith(COMPRESSIBLE_SUFFIXES) and "range" not in request_headers:
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+    if encoding is not None:
+        etag = f'{etag[:-1]}-{encoding}"'
+
+    if etag_matches(request_headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    if encoding is not None:
+        return Response(
+            compressed_file(
+                path, stat_result.st_mtime_ns, stat_result.st_size, encoding
+            ),
+            media_type="application/json",
+            headers={
+                "ETag": etag,
+                "Content-Encoding": encoding,
+                "Vary": "Accept-Encoding",
+            },
+        )
+    headers = {"ETag": etag}
+    if path.endswith(COMPRESSIBLE_SUFFIXES):
+        headers["Vary"] = "Accept-Encoding"
+    return LargeChunkFileResponse(path, headers=headers, stat_result=stat_result)
+
+
+def _growing_file_response(path: str, size: int, request_headers: Headers):
+    byte_range = None
+    if "range" in request_headers:
+        try:
+            byte_range = parse_range(request_headers["range"], size)
+        except ValueError:
+            return Response(
+                status_code=416, headers={"Content-Range": f"bytes */{size}"}
+            )
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "no-store"}
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        # the file is still being written, so its final length is unknown
+        headers["Content-Range"] = f"bytes {start}-{end}/*"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file(path, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+    )
@@ -0,0 +1,97 @@
+"""Publishing of recorder events to server-sent event streams.
+
+Events are published from any thread (command queue, camera callbacks) and
+delivered to subscribers on their event loop. Every subscriber has a bounded
+queue; a subscriber that falls behind loses its oldest events rather than
+slowing down the publisher, and can catch up on the recent ones by
+reconnecting with the id of the last event it received.
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Lock
+
+
+@dataclass
+class Event:
+    event_id: int
+    type: str
+    data: dict
+    timestamp: float = field(default_factory=time.time)
+
+
+def format_sse(event: Event) -> str:
+    data = json.dumps({**event.data, "timestamp": event.timestamp})
+    return f"id: {event.event_id}\nevent: {event.type}\ndata: {data}\n\n"
+
+
+class Subscription:
+    def __init__(
+        self, loop: asyncio.AbstractEventLoop, types: set[str] | None, size: int
+    ):
+        self.loop = loop
+        # event types to deliver, all if None
+        self.types = types
+        self.events_dropped = 0
+        self._queue: asyncio.Queue[Event] = asyncio.Queue(size)
+
+    async def get(self) -> Event:
+        return await self._queue.get()
+
+    def _offer(self, event: Event):
+        # runs on the subscriber's loop
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.events_dropped += 1
+        self._queue.put_nowait(event)
+
+
+class EventBus:
+    def __init__(self, history: int = 256, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._history: deque[Event] = deque(maxlen=history)
+        self._subscriptions: set[Subscription] = set()
+        self._next_id = 1
+        self._lock = Lock()
+
+    def publish(self, type: str, data: dict) -> Event:
+        with self._lock:
+            event = Event(self._next_id, type, data)
+            self._next_id += 1
+            self._history.append(event)
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.types is not None and type not in subscription.types:
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._offer, event)
+            except RuntimeError:
+                # the subscriber's loop is closed
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribe(
+        self, types: set[str] | None = None, last_event_id: int | None = None
+    ) -> Subscription:
+        """Subscribe on the running loop, replaying events after `last_event_id`."""
+        subscription = Subscription(asyncio.get_running_loop(), types, self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            missed = []
+            if last_event_id is not None:
+                missed = [e for e in self._history if e.event_id > last_event_id]
+        for event in missed:
+            if types is None or event.type in types:
+                subscription._offer(event)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def has_subscribers(self) -> bool:
+        with self._lock:
+            return bool(self._subscriptions)
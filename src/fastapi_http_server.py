@@ -1,14 +1,77 @@
+import asyncio
+import contextlib
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from enum import Enum
+import functools
 import json
-from fastapi import FastAPI, HTTPException
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Callable, Dict
+from typing import Any, Callable, Dict, Literal
 from fastapi.staticfiles import StaticFiles
-from recorder import RECORDINGS_DIR
+from recorder import RECORDINGS_DIR, RecorderSettings, RecordingMode
+from frame_log import FRAME_LOG_SUFFIX
+from raw_recording import RAW_EXTENSION, raw_filename
+from frame_index import frame_index_filename
+from frame_reader import (
+    DecoderUnavailable,
+    FrameCache,
+    RecordingFrames,
+    encode_png,
+    load_frame_index,
+)
+from command_queue import DEFAULT_CAMERA, Command, CommandStatus, RecorderCommandQueue
+from recorder_manager import FIRE_ALL_LEAD_NS, RecorderManager, file_name_for_camera
+from recordings_catalog import CatalogQuery, RecordingsCatalog
+from disk_admission import DiskAdmission, Preflight
+from downloads import file_response
+from segmented_recording import SEGMENT_PATTERN
+from offload import Offloader, OffloadJob
+from metrics import RecorderStatus, format_prometheus
+from events import EventBus, format_sse
+from metadata_writer import EVENTS_SUFFIX, METADATA_SUFFIX, MetadataWriter
+import io
+import math
+import glob
 import os
+import time
+import numpy as np
 
 PORT = 8000
 HOST = "localhost"
+# how often the catalog checks the recordings directory for changes
+RECONCILE_INTERVAL_S = 30.0
+# rows fetched from the catalog at a time by GET /recordings/stream
+STREAM_PAGE_SIZE = 500
+# camera id of the recorder behind status_func in /status and /metrics
+DEFAULT_CAMERA_ID = DEFAULT_CAMERA
+# how often GET /events reports the progress of running recordings
+PROGRESS_INTERVAL_S = 1.0
+# comment lines keep idle event streams open through proxies
+HEARTBEAT_INTERVAL_S = 15.0
+# longest delay before a metadata update is written to disk
+METADATA_FLUSH_INTERVAL_S = 0.5
+# longest wait of a stopped recording for its metadata to be written
+METADATA_WRITE_TIMEOUT_S = 10.0
+# how often running recordings are checked for a full file or disk
+WATCH_INTERVAL_S = 1.0
+# most frames returned by one GET /recordings/{recording_id}/frames
+MAX_FRAMES_PER_REQUEST = 100
+# files that make up recordings: MP4s and raw recordings
+VIDEO_EXTENSIONS = (".mp4", RAW_EXTENSION)
 
 
 def url_from_filename(filename: str) -> str:
@@ -18,23 +81,83 @@ def url_from_filename(filename: str) -> str:
 
 
 def metadata_filename_from_recording_id(recording_id: str) -> str:
-    return f"{recording_id}.metadata.json"
+    return f"{recording_id}{METADATA_SUFFIX}"
+
+
+def events_filename_from_recording_id(recording_id: str) -> str:
+    return f"{recording_id}{EVENTS_SUFFIX}"
+
+
+def frames_filename_from_recording_id(recording_id: str) -> str:
+    return f"{recording_id}{FRAME_LOG_SUFFIX}"
 
 
 def recording_id_from_video_filename(filename: str) -> str:
-    return filename[:-4]
+    return os.path.splitext(filename)[0]
+
+
+def recording_id_from_disk_filename(filename: str) -> str | None:
+    # a segmented recording is represented by its first segment
+    match = SEGMENT_PATTERN.match(filename)
+    if match is None:
+        return recording_id_from_video_filename(filename)
+    if int(match["index"]) != 0:
+        return None
+    return match["recording"]
+
+
+def segment_filenames(recording_id: str) -> list[str]:
+    pattern = os.path.join(RECORDINGS_DIR, f"{glob.escape(recording_id)}.seg*")
+    segments = []
+    for path in glob.glob(pattern):
+        match = SEGMENT_PATTERN.match(os.path.basename(path))
+        if (
+            match is not None
+            and match["recording"] == recording_id
+            and match["ext"] in VIDEO_EXTENSIONS
+        ):
+            segments.append((int(match["index"]), os.path.basename(path)))
+    return [filename for _, filename in sorted(segments)]
 
 
 class RecordingStatus(Enum):
     STOPPED = "stopped"
     RECORDING = "recording"
+    STARTING = "starting"
+    STOPPING = "stopping"
+    FAILED = "failed"
+    # prepared by POST /recordings/arm, capturing starts with .../fire
+    ARMED = "armed"
+
+
+# recordings that occupy their camera
+ACTIVE_STATUSES = (
+    RecordingStatus.STARTING,
+    RecordingStatus.ARMED,
+    RecordingStatus.RECORDING,
+)
+FINISHED_STATUSES = (RecordingStatus.STOPPED, RecordingStatus.FAILED)
 
 
-# Ensure the recordings directory exists
-if not os.path.exists(RECORDINGS_DIR):
-    os.makedirs(RECORDINGS_DIR)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+    recordings.start_reconciling(RECONCILE_INTERVAL_S)
+    progress = asyncio.create_task(_publish_progress_periodically())
+    watch = asyncio.create_task(_watch_recordings())
+    yield
+    progress.cancel()
+    watch.cancel()
+    # stopped recordings still being finished wait for the loop to write
+    await asyncio.wrap_future(finishing.submit(lambda: None))
+    await metadata_writer.flush()
+    event_loop = None
+    recordings.stop_reconciling()
 
-app = FastAPI()
+
+# routes of the app built by create_app
+router = APIRouter()
 
 
 class Recording(BaseModel):
@@ -45,47 +168,113 @@ class Recording(BaseModel):
     status: RecordingStatus
     video_url: str
     metadata_url: str | None = None
+    frames_url: str | None = None
+    # annotations appended with PATCH /recordings/{recording_id}/metadata
+    events_url: str | None = None
+    # last start/stop command for this recording, see GET /commands/{command_id}
+    command_id: str | None = None
+    error: str | None = None
+    # set for recordings started through the /cameras endpoints
+    camera_id: str | None = None
+    # files of a segmented recording in order; video_filename is the first one
+    segments: list[str] = []
+    segment_urls: list[str] = []
+    # estimated data rate, and warnings of the disk's admission check
+    estimated_bytes_per_second: float | None = None
+    warnings: list[str] = []
 
 
-# Populate recordings with existing mp4 files in the recordings directory
-def update_recordings_from_disk() -> Dict[str, Recording]:
-    recordings: Dict[str, Recording] = {}
-    for filename in os.listdir(RECORDINGS_DIR):
-        if filename.endswith(".mp4"):
-            recording_id = recording_id_from_video_filename(filename)
-            metadata_filename = metadata_filename_from_recording_id(recording_id)
-            metadata = {}
-            if os.path.exists(os.path.join(RECORDINGS_DIR, metadata_filename)):
-                try:
-                    with open(
-                        os.path.join(RECORDINGS_DIR, metadata_filename)
-                    ) as metadata_file:
-                        metadata = json.load(metadata_file)
-                except Exception as e:
-                    msg = f"Failed to load metadata for {filename}: {e}"
-                    metadata = {"error": msg}
-
-            recordings[recording_id] = Recording(
-                recording_id=recording_id,
-                video_filename=filename,
-                metadata=metadata,
-                status=RecordingStatus.STOPPED,
-                video_url=url_from_filename(filename),
-                metadata_filename=metadata_filename,
-                metadata_url=url_from_filename(metadata_filename)
-                if os.path.exists(os.path.join(RECORDINGS_DIR, metadata_filename))
-                else None,
-            )
-    return recordings
+def attach_segments(recording: Recording):
+    segments = segment_filenames(recording.recording_id)
+    if segments:
+        recording.segments = segments
+        recording.segment_urls = [url_from_filename(segment) for segment in segments]
+        recording.video_filename = segments[0]
+        recording.video_url = recording.segment_urls[0]
 
 
-recordings: Dict[str, Recording] = update_recordings_from_disk()
+# Build the catalog entry of an mp4 file found in the recordings directory
+def recording_from_disk(filename: str) -> Recording:
+    recording_id = recording_id_from_disk_filename(filename)
+    metadata_filename = metadata_filename_from_recording_id(recording_id)
+    frames_filename = frames_filename_from_recording_id(recording_id)
+    events_filename = events_filename_from_recording_id(recording_id)
+    metadata = {}
+    if os.path.exists(os.path.join(RECORDINGS_DIR, metadata_filename)):
+        try:
+            with open(os.path.join(RECORDINGS_DIR, metadata_filename)) as metadata_file:
+                metadata = json.load(metadata_file)
+        except Exception as e:
+            msg = f"Failed to load metadata for {filename}: {e}"
+            metadata = {"error": msg}
+
+    recording = Recording(
+        recording_id=recording_id,
+        video_filename=filename,
+        metadata=metadata,
+        status=RecordingStatus.STOPPED,
+        video_url=url_from_filename(filename),
+        metadata_filename=metadata_filename,
+        metadata_url=(
+            url_from_filename(metadata_filename)
+            if os.path.exists(os.path.join(RECORDINGS_DIR, metadata_filename))
+            else None
+        ),
+        frames_url=(
+            url_from_filename(frames_filename)
+            if os.path.exists(os.path.join(RECORDINGS_DIR, frames_filename))
+            else None
+        ),
+        events_url=(
+            url_from_filename(events_filename)
+            if os.path.exists(os.path.join(RECORDINGS_DIR, events_filename))
+            else None
+        ),
+    )
+    if SEGMENT_PATTERN.match(filename):
+        attach_segments(recording)
+    return recording
+
+
+# Finished recordings are read from the catalog's index, recordings in
+# progress are kept in memory. Store entries again after changing them.
+# Opened by create_app.
+recordings: RecordingsCatalog[Recording]
 
 
 # Data models
 class StartRecordingRequest(BaseModel):
     filename: str
     metadata: Dict[str, str] = {}
+    # split the recording into files of at most this many frames, seconds or bytes
+    segment_frames: int | None = None
+    segment_seconds: float | None = None
+    segment_bytes: int | None = None
+    # record on external triggers; frame_rate is the nominal trigger rate
+    # written to the file, the frame log has the actual timestamps
+    triggered: bool = False
+    frame_rate: float | None = None
+    # write placeholders for missing frames, see RecorderSettings.fill_gaps
+    fill_gaps: bool = False
+    # raw recordings hold max_frames frames, or max_duration_s seconds at the
+    # recording frame rate, and are stopped once they are full
+    mode: RecordingMode = RecordingMode.ENCODED
+    max_frames: int | None = None
+    max_duration_s: float | None = None
+    # start even if the disk's admission check refuses the recording
+    force: bool = False
+
+    def settings(self) -> RecorderSettings | None:
+        settings = RecorderSettings(
+            segment_frames=self.segment_frames,
+            segment_seconds=self.segment_seconds,
+            segment_bytes=self.segment_bytes,
+            fill_gaps=self.fill_gaps,
+            mode=self.mode,
+            max_frames=self.max_frames,
+            max_duration_s=self.max_duration_s,
+        )
+        return None if settings == RecorderSettings() else settings
 
 
 class StopRecordingRequest(BaseModel):
@@ -102,10 +291,124 @@ class AddMetadataRequest(BaseModel):
     metadata: Dict[str, str]
 
 
+class FireRequest(BaseModel):
+    # start with the first frame received at or after this host time
+    # (ns since the epoch), or with the first frame with at least this
+    # device frame number; with neither, start with the next frame
+    at_ns: int | None = None
+    at_frame: int | None = None
+
+
+class FireAllResponse(BaseModel):
+    recordings: Dict[str, Recording]
+    # host time from which the cameras capture
+    at_ns: int
+    command_id: str
+
+
 class MetadataResponse(BaseModel):
     message: str
 
 
+class MetadataPatch(BaseModel):
+    # keys to add or overwrite, and keys to remove
+    metadata: Dict[str, str] = {}
+    remove: list[str] = []
+    # appended to the recording's events file, one line each
+    events: list[Dict[str, Any]] = []
+
+
+class MetadataPatchResponse(BaseModel):
+    metadata: Dict[str, str]
+    events_appended: int
+
+
+class CommandResponse(BaseModel):
+    command_id: str
+    name: str
+    status: CommandStatus
+    submitted_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    error: str | None = None
+
+
+class CameraResponse(BaseModel):
+    camera_id: str
+    streaming: bool
+    recording: bool
+    recording_id: str | None = None
+
+
+class StartAllResponse(BaseModel):
+    recordings: Dict[str, Recording]
+    # spread of the cameras' capture start times, once the start has finished
+    start_skew_ms: float | None = None
+    command_id: str
+
+
+class StopAllResponse(BaseModel):
+    message: str
+    recordings: Dict[str, Recording]
+    command_id: str
+
+
+class PreflightResponse(BaseModel):
+    ok: bool
+    # of the requested recordings and of those already running
+    required_bytes_per_second: float
+    write_bytes_per_second: float
+    free_bytes: int
+    seconds_left: float | None
+    warnings: list[str]
+    error: str | None
+
+
+class OffloadResponse(BaseModel):
+    # number of queued files by status (pending, running, done, failed)
+    files: Dict[str, int]
+
+
+class StageStatus(BaseModel):
+    count: int
+    # None until the stage has seen a frame
+    mean_ms: float | None = None
+    p50_ms: float | None = None
+    p99_ms: float | None = None
+    max_ms: float | None = None
+
+
+class CameraStatus(BaseModel):
+    streaming: bool
+    recording: bool
+    frames_delivered: int
+    frames_dropped: Dict[str, int]
+    writer_queue_depth: int
+    # over the last few seconds, and since the stream started
+    frames_per_second: float
+    average_frames_per_second: float
+    drops_per_second: float
+    armed: bool
+    # the current raw recording has no room left and is being stopped
+    recording_full: bool
+    # time arm took and delay of the first frame after fire, see FireStatistics
+    arm_duration_ms: float | None
+    first_frame_latency_ms: float | None
+    # of the current or last recording
+    encoder: str | None
+    encoder_frames_per_second: float
+    encoder_cpu_percent: float | None
+    frames_missing: int
+    missed_triggers: int
+    placeholder_frames: int
+    frames_written: int
+    stages: Dict[str, StageStatus]
+
+
+class StatusResponse(BaseModel):
+    cameras: Dict[str, CameraStatus]
+
+
 class RecordingResponse(BaseModel):
     recording_id: str
     filename: str
@@ -113,7 +416,12 @@ class RecordingResponse(BaseModel):
     file_url: str
 
 
-def start_recording_func(filename: str) -> None:
+def start_recording_func(
+    filename: str,
+    frame_rate: float | None = None,
+    triggered_mode: bool = False,
+    settings: RecorderSettings | None = None,
+) -> None:
     return None
 
 
@@ -121,104 +429,1278 @@ def stop_recording_func() -> None:
     return None
 
 
-# Endpoints
-@app.post("/recordings/start", response_model=Recording)
-async def start_recording(request: StartRecordingRequest):
+def arm_recording_func(
+    filename: str,
+    frame_rate: float | None = None,
+    triggered_mode: bool = False,
+    settings: RecorderSettings | None = None,
+) -> None:
+    return None
+
+
+def fire_recording_func(at_ns: int | None = None, at_frame: int | None = None) -> None:
+    return None
+
+
+status_func: Callable[[], RecorderStatus] | None = None
+
+# data rate of a recording of the single-recording endpoints, see
+# ImagingSourceRecorder.estimate_bytes_per_second
+estimate_func: Callable[..., float] | None = None
+
+# set by run_http_server to refuse recordings the disk cannot keep up with
+disk_admission: DiskAdmission | None = None
+
+
+# Recorder calls block on camera and encoder I/O, so they run on the command
+# queue's threads instead of on the event loop, one at a time per camera
+command_queue = RecorderCommandQueue()
+
+# set by run_http_server when more than one camera is attached
+recorder_manager: RecorderManager | None = None
+
+# camera driven by the single-recording endpoints; one of recorder_manager's
+# camera ids if that camera can also be driven through /cameras
+default_camera_id = DEFAULT_CAMERA_ID
+
+# set by run_http_server to ship finished recordings to archive storage
+offloader: Offloader | None = None
+
+# writes metadata sidecars without blocking the event loop
+metadata_writer = MetadataWriter(RECORDINGS_DIR, METADATA_FLUSH_INTERVAL_S)
+
+# loop of the running app, set by its lifespan; None outside of it
+event_loop: asyncio.AbstractEventLoop | None = None
+
+# builds the frame indexes of stopped recordings and offloads them, so that
+# the command queue is free for the camera's next start
+finishing = ThreadPoolExecutor(max_workers=1, thread_name_prefix="finishing")
+
+# frames decoded for GET /recordings/{recording_id}/frames, shared by all recordings
+frame_cache = FrameCache()
+
+# recording state changes, progress and device events for GET /events
+events = EventBus()
+RECORDING_EVENTS = {
+    RecordingStatus.STARTING: "recording_starting",
+    RecordingStatus.RECORDING: "recording_started",
+    RecordingStatus.STOPPING: "recording_stopping",
+    # the files are complete once a recording is stopped
+    RecordingStatus.STOPPED: "recording_stopped",
+    RecordingStatus.FAILED: "recording_failed",
+    RecordingStatus.ARMED: "recording_armed",
+}
+
+
+def recording_files(recording: Recording) -> list[str]:
+    videos = list(recording.segments) or [recording.video_filename]
+    files = list(videos)
+    for sidecar in (
+        *(frame_index_filename(video) for video in videos),
+        recording.metadata_filename,
+        frames_filename_from_recording_id(recording.recording_id),
+        events_filename_from_recording_id(recording.recording_id),
+    ):
+        if os.path.exists(os.path.join(RECORDINGS_DIR, sidecar)):
+            files.append(sidecar)
+    return files
+
+
+def _recording_stopped(recording: Recording):
+    attach_segments(recording)
+    status = _camera_statuses().get(_camera_key(recording))
+    if status is not None:
+        accounting = {
+            "frames_missing": str(status.frames_missing),
+            "missed_triggers": str(status.missed_triggers),
+            "placeholder_frames": str(status.placeholder_frames),
+        }
+        if status.first_frame_latency_ms is not None:
+            accounting["first_frame_latency_ms"] = (
+                f"{status.first_frame_latency_ms:.3f}"
+            )
+        loop = event_loop
+        if loop is not None and loop.is_running():
+            # only merged here, the write is left to _finish_recording
+            asyncio.run_coroutine_threadsafe(
+                _add_accounting(recording, accounting), loop
+            ).result(METADATA_WRITE_TIMEOUT_S)
+        else:
+            # no app is running, so no other writes are pending
+            recording.metadata.update(accounting)
+            metadata_writer.write_blocking(recording.recording_id, recording.metadata)
+    finishing.submit(_finish_recording, recording)
+
+
+async def _add_accounting(recording: Recording, accounting: Dict[str, str]):
+    # on the event loop, like PATCH .../metadata, and written after its
+    # pending writes instead of being overwritten by them
+    recording.metadata.update(accounting)
+    metadata_writer.update(recording.recording_id, recording.metadata)
+
+
+def _finish_recording(recording: Recording):
+    loop = event_loop
+    if loop is not None and loop.is_running():
+        # so that the sidecar is offloaded with the accounting in it; a failed
+        # write is logged and stays pending
+        with contextlib.suppress(concurrent.futures.TimeoutError):
+            asyncio.run_coroutine_threadsafe(
+                metadata_writer.flush(recording.recording_id), loop
+            ).result(METADATA_WRITE_TIMEOUT_S)
+    for video in recording.segments or [recording.video_filename]:
+        try:
+            load_frame_index(os.path.join(RECORDINGS_DIR, video))
+        except (OSError, ValueError):
+            # built on first use instead, see GET /recordings/{recording_id}/frames
+            pass
+    if offloader is not None:
+        offloader.enqueue(recording.recording_id, recording_files(recording))
+
+
+def offloaded_file_deleted(job: OffloadJob):
+    """Drop a recording from the catalog once its video was offloaded and deleted."""
+    try:
+        recording = recordings[job.recording_id]
+    except KeyError:
+        return
+    # a new recording with the same name may have started meanwhile
+    if recording.status not in FINISHED_STATUSES:
+        return
+    if job.filename in (recording.segments or [recording.video_filename]):
+        with contextlib.suppress(KeyError):
+            del recordings[job.recording_id]
+
+
+def _publish_recording(recording: Recording):
+    events.publish(
+        RECORDING_EVENTS[recording.status], recording.model_dump(mode="json")
+    )
+
+
+def publish_progress(last_dropped: Dict[str, int]):
+    """Publish progress of the running recordings and new drops of every camera."""
+    statuses = _camera_statuses()
+    for camera_id, status in statuses.items():
+        dropped = sum(status.frames_dropped.values())
+        if dropped > last_dropped.get(camera_id, dropped):
+            events.publish(
+                "frames_dropped",
+                {
+                    "camera_id": camera_id,
+                    "new": dropped - last_dropped[camera_id],
+                    "frames_dropped": status.frames_dropped,
+                },
+            )
+        last_dropped[camera_id] = dropped
+    for recording in recordings.live():
+        status = statuses.get(_camera_key(recording))
+        if recording.status != RecordingStatus.RECORDING or status is None:
+            continue
+        events.publish(
+            "recording_progress",
+            {
+                "recording_id": recording.recording_id,
+                "camera_id": recording.camera_id,
+                "frames_written": status.frames_written,
+                "frames_dropped": sum(status.frames_dropped.values()),
+                "frames_per_second": status.frames_per_second,
+            },
+        )
+
+
+async def _publish_progress_periodically():
+    last_dropped: Dict[str, int] = {}
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL_S)
+        if events.has_subscribers():
+            await run_in_threadpool(publish_progress, last_dropped)
+
+
+def _update_status_when_done(recording: Recording, status: RecordingStatus):
+    def on_done(command: Command):
+        if command.status == CommandStatus.FAILED:
+            recording.status = RecordingStatus.FAILED
+            recording.error = command.error
+        else:
+            recording.status = status
+        if recording.status == RecordingStatus.STOPPED:
+            _recording_stopped(recording)
+        recordings[recording.recording_id] = recording
+        _publish_recording(recording)
+
+    return on_done
+
+
+async def _wait_for_command(command: Command):
+    try:
+        return await command_queue.wait(command)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"{command.name} failed: {e}")
+
+
+def _camera_key(recording: Recording) -> str:
+    """The camera a recording occupies."""
+    return recording.camera_id or default_camera_id
+
+
+def _check_not_recording(camera_id: str | None = None):
+    camera_id = camera_id or default_camera_id
     if any(
-        recording.status == RecordingStatus.RECORDING
-        for recording in recordings.values()
+        recording.status in ACTIVE_STATUSES and _camera_key(recording) == camera_id
+        for recording in recordings.live()
     ):
         raise HTTPException(
             status_code=400, detail="A recording is already in progress"
         )
 
+
+def _video_filename(filename: str, settings: RecorderSettings | None = None) -> str:
     # if filename has no extension add .mp4
-    if "." not in request.filename:
-        request.filename += ".mp4"
+    if "." not in filename:
+        filename += ".mp4"
+
+    # make sure filename is a valid video file
+    if not filename.endswith(VIDEO_EXTENSIONS):
+        raise HTTPException(
+            status_code=400, detail="Filename must end with .mp4 or .raw"
+        )
+    # the recorder names the file by the recording mode
+    if settings is not None and settings.mode == RecordingMode.RAW:
+        if settings.fill_gaps:
+            raise HTTPException(
+                status_code=400, detail="Raw recordings cannot fill gaps"
+            )
+        return raw_filename(filename)
+    if filename.endswith(RAW_EXTENSION):
+        raise HTTPException(status_code=400, detail="Only raw recordings end with .raw")
+    return filename
 
-    # make sure filename is a valid mp4 file
-    if not request.filename.endswith(".mp4"):
-        raise HTTPException(status_code=400, detail="Filename must end with .mp4")
 
-    recording_id = recording_id_from_video_filename(request.filename)
+async def _add_recording(
+    filename: str,
+    metadata: Dict[str, str],
+    camera_id: str | None = None,
+    estimated_bytes_per_second: float | None = None,
+    warnings: list[str] | None = None,
+) -> Recording:
+    recording_id = recording_id_from_video_filename(filename)
     metadata_filename = metadata_filename_from_recording_id(recording_id)
-    with open(os.path.join(RECORDINGS_DIR, metadata_filename), "w") as metadata_file:
-        json.dump(request.metadata, metadata_file)
+    await metadata_writer.write(recording_id, metadata)
 
     recordings[recording_id] = Recording(
         recording_id=recording_id,
-        video_filename=request.filename,
-        metadata=request.metadata,
+        video_filename=filename,
+        metadata=metadata,
         metadata_filename=metadata_filename,
-        status=RecordingStatus.RECORDING,
-        video_url=url_from_filename(request.filename),
-        metadata_url=url_from_filename(
-            metadata_filename_from_recording_id(recording_id)
+        status=RecordingStatus.STARTING,
+        video_url=url_from_filename(filename),
+        metadata_url=url_from_filename(metadata_filename),
+        frames_url=url_from_filename(frames_filename_from_recording_id(recording_id)),
+        camera_id=camera_id,
+        estimated_bytes_per_second=estimated_bytes_per_second,
+        warnings=warnings or [],
+    )
+    _publish_recording(recordings[recording_id])
+    return recordings[recording_id]
+
+
+async def _estimate(
+    request: StartRecordingRequest, camera_ids: list[str] | None = None
+) -> Dict[str | None, float]:
+    """Data rate by camera of recordings with `request`'s settings; the
+    single-recording endpoints' recorder is camera None."""
+    settings = request.settings()
+    cameras = camera_ids or [default_camera_id]
+    if camera_ids is None:
+        if estimate_func is None:
+            return {}
+
+        def estimate():
+            return {None: estimate_func(request.frame_rate, settings)}
+
+    else:
+        manager = _get_manager()
+
+        def estimate():
+            return {
+                camera_id: manager.get(camera_id).estimate_bytes_per_second(
+                    request.frame_rate, settings
+                )
+                for camera_id in camera_ids
+            }
+
+    # may start streaming to learn the image type
+    command = command_queue.submit(
+        "estimate_bytes_per_second", estimate, cameras=cameras
+    )
+    return await _wait_for_command(command)
+
+
+def _running_bytes_per_second() -> float:
+    return sum(
+        recording.estimated_bytes_per_second or 0.0
+        for recording in recordings.live()
+        if recording.status in ACTIVE_STATUSES
+    )
+
+
+async def _preflight(
+    request: StartRecordingRequest, camera_ids: list[str] | None = None
+) -> tuple[Dict[str | None, float], Preflight]:
+    if disk_admission is None:
+        raise HTTPException(status_code=404, detail="Disk admission is not configured")
+    rates = await _estimate(request, camera_ids)
+    preflight = await run_in_threadpool(
+        disk_admission.preflight,
+        sum(rates.values()),
+        _running_bytes_per_second(),
+    )
+    return rates, preflight
+
+
+async def _admit(
+    request: StartRecordingRequest, camera_ids: list[str] | None = None
+) -> tuple[Dict[str | None, float], list[str]]:
+    """Estimated data rates and warnings of recordings the disk can take;
+    raises 507 for the others, unless the request forces them."""
+    if disk_admission is None:
+        return {}, []
+    rates, preflight = await _preflight(request, camera_ids)
+    if preflight.error is None:
+        return rates, preflight.warnings
+    if not request.force:
+        raise HTTPException(status_code=507, detail=preflight.error)
+    return rates, preflight.warnings + [preflight.error]
+
+
+async def _stop(recording: Recording, name: str, func: Callable[[], None]) -> Command:
+    await metadata_writer.flush(recording.recording_id)
+    recording.status = RecordingStatus.STOPPING
+    recordings[recording.recording_id] = recording
+    _publish_recording(recording)
+    command = command_queue.submit(
+        name,
+        func,
+        on_done=_update_status_when_done(recording, RecordingStatus.STOPPED),
+        cameras=[_camera_key(recording)],
+    )
+    recording.command_id = command.command_id
+    return command
+
+
+async def stop_if_disk_full():
+    """Stop all recordings once the disk is about to fill up."""
+    active = [r for r in recordings.live() if r.status in ACTIVE_STATUSES]
+    if not active:
+        return
+    rate = _running_bytes_per_second()
+    try:
+        free = await run_in_threadpool(disk_admission.free_bytes)
+    except OSError:
+        return
+    if not disk_admission.should_stop(rate, free):
+        return
+    events.publish(
+        "disk_full",
+        {
+            "free_bytes": free,
+            "reserve_bytes": disk_admission.reserve_bytes,
+            "recordings": [recording.recording_id for recording in active],
+        },
+    )
+    for recording in active:
+        recording.warnings = recording.warnings + ["Stopped, the disk is almost full"]
+        await _stop_live(recording)
+
+
+async def stop_full_recordings():
+    """Stop raw recordings that have no room left for further frames."""
+    active = [r for r in recordings.live() if r.status == RecordingStatus.RECORDING]
+    if not active:
+        return
+    statuses = await run_in_threadpool(_camera_statuses)
+    for recording in active:
+        status = statuses.get(_camera_key(recording))
+        if status is None or not status.recording_full:
+            continue
+        events.publish(
+            "recording_full",
+            {"recording_id": recording.recording_id, "camera_id": recording.camera_id},
+        )
+        recording.warnings = recording.warnings + ["Stopped, the recording is full"]
+        await _stop_live(recording)
+
+
+async def _stop_live(recording: Recording) -> Command:
+    if recording.camera_id is None:
+        return await _stop(recording, "stop_recording", stop_recording_func)
+    return await _stop(
+        recording,
+        f"stop_recording[{recording.camera_id}]",
+        recorder_manager.get(recording.camera_id).stop_recording,
+    )
+
+
+async def _watch_recordings():
+    if disk_admission is not None:
+        # measured in the background, so that the first start does not wait for it
+        try:
+            await run_in_threadpool(disk_admission.write_bytes_per_second)
+        except OSError:
+            pass
+    while True:
+        await asyncio.sleep(WATCH_INTERVAL_S)
+        await stop_full_recordings()
+        if disk_admission is not None:
+            await stop_if_disk_full()
+
+
+def _get_manager() -> RecorderManager:
+    if recorder_manager is None:
+        raise HTTPException(status_code=404, detail="No cameras configured")
+    return recorder_manager
+
+
+def _get_camera(camera_id: str):
+    manager = _get_manager()
+    if camera_id not in manager.recorders:
+        raise HTTPException(status_code=404, detail="Camera ID not found")
+    return manager.get(camera_id)
+
+
+def _camera_recordings(statuses: tuple[RecordingStatus, ...]) -> Dict[str, Recording]:
+    """Recordings on the manager's cameras by camera, including those of the
+    single-recording endpoints if they drive one of them."""
+    if recorder_manager is None:
+        return {}
+    return {
+        _camera_key(recording): recording
+        for recording in recordings.live()
+        if _camera_key(recording) in recorder_manager.recorders
+        and recording.status in statuses
+    }
+
+
+def _start_arguments(request: StartRecordingRequest) -> Dict[str, Any]:
+    # keyword arguments of the start and arm functions besides the file name
+    return {
+        "frame_rate": request.frame_rate,
+        "triggered_mode": request.triggered,
+        "settings": request.settings(),
+    }
+
+
+# Endpoints
+@router.post("/recordings/start", response_model=Recording)
+async def start_recording(request: StartRecordingRequest, wait: bool = True):
+    _check_not_recording()
+    request.filename = _video_filename(request.filename, request.settings())
+    rates, warnings = await _admit(request)
+    recording = await _add_recording(
+        request.filename, request.metadata, None, rates.get(None), warnings
+    )
+    command = command_queue.submit(
+        "start_recording",
+        functools.partial(
+            start_recording_func, request.filename, **_start_arguments(request)
         ),
+        on_done=_update_status_when_done(recording, RecordingStatus.RECORDING),
+        cameras=[default_camera_id],
     )
-    start_recording_func(request.filename)
+    recording.command_id = command.command_id
+    if wait:
+        await _wait_for_command(command)
 
-    return recordings[recording_id]
+    return recording
 
 
-@app.post("/recordings/stop", response_model=StopRecordingResponse)
-async def stop_recording(request: StopRecordingRequest):
+@router.post("/recordings/stop", response_model=StopRecordingResponse)
+async def stop_recording(request: StopRecordingRequest, wait: bool = True):
     if request.recording_id not in recordings:
         raise HTTPException(status_code=404, detail="Recording ID not found")
-    recordings[request.recording_id].status = RecordingStatus.STOPPED
+    recording = recordings[request.recording_id]
+    if recording.status not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=400, detail="Recording is not running")
+    command = await _stop_live(recording)
+    if not wait:
+        return {"message": "Recording stopping", "recording": recording}
 
-    stop_recording_func()
+    await _wait_for_command(command)
+    return {"message": "Recording stopped", "recording": recording}
 
-    return {
-        "message": "Recording stopped",
-        "recording": recordings[request.recording_id],
+
+@router.post("/recordings/arm", response_model=Recording)
+async def arm_recording(request: StartRecordingRequest, wait: bool = True):
+    """Prepare a recording so that a later fire starts it within a frame."""
+    _check_not_recording()
+    request.filename = _video_filename(request.filename, request.settings())
+    rates, warnings = await _admit(request)
+    recording = await _add_recording(
+        request.filename, request.metadata, None, rates.get(None), warnings
+    )
+    command = command_queue.submit(
+        "arm_recording",
+        functools.partial(
+            arm_recording_func, request.filename, **_start_arguments(request)
+        ),
+        on_done=_update_status_when_done(recording, RecordingStatus.ARMED),
+        cameras=[default_camera_id],
+    )
+    recording.command_id = command.command_id
+    if wait:
+        await _wait_for_command(command)
+    return recording
+
+
+@router.post("/recordings/{recording_id}/fire", response_model=Recording)
+async def fire_recording(
+    recording_id: str, request: FireRequest = FireRequest(), wait: bool = True
+):
+    armed = [r for r in recordings.live() if r.recording_id == recording_id]
+    if not armed:
+        raise HTTPException(status_code=404, detail="Recording ID not found")
+    recording = armed[0]
+    if recording.status != RecordingStatus.ARMED:
+        raise HTTPException(status_code=400, detail="Recording is not armed")
+    fire = fire_recording_func
+    if recording.camera_id is not None:
+        # armed through /cameras/arm, fires only its own camera
+        fire = _get_manager().get(recording.camera_id).fire
+    command = command_queue.submit(
+        "fire_recording",
+        functools.partial(fire, at_ns=request.at_ns, at_frame=request.at_frame),
+        on_done=_update_status_when_done(recording, RecordingStatus.RECORDING),
+        cameras=[_camera_key(recording)],
+    )
+    recording.command_id = command.command_id
+    if wait:
+        await _wait_for_command(command)
+    return recording
+
+
+def _preflight_response(preflight: Preflight) -> PreflightResponse:
+    return PreflightResponse(
+        ok=preflight.ok,
+        required_bytes_per_second=preflight.required_bytes_per_second,
+        write_bytes_per_second=preflight.write_bytes_per_second,
+        free_bytes=preflight.free_bytes,
+        seconds_left=preflight.seconds_left,
+        warnings=preflight.warnings,
+        error=preflight.error,
+    )
+
+
+@router.post("/recordings/preflight", response_model=PreflightResponse)
+async def preflight_recording(request: StartRecordingRequest):
+    """Check whether the disk can take a recording, without starting it."""
+    _, preflight = await _preflight(request)
+    return _preflight_response(preflight)
+
+
+@router.post("/cameras/preflight", response_model=PreflightResponse)
+async def preflight_all_cameras(request: StartRecordingRequest):
+    _, preflight = await _preflight(request, list(_get_manager().recorders))
+    return _preflight_response(preflight)
+
+
+@router.get("/cameras", response_model=list[CameraResponse])
+async def list_cameras():
+    manager = _get_manager()
+    active = _camera_recordings((RecordingStatus.STARTING, RecordingStatus.RECORDING))
+    return [
+        CameraResponse(
+            camera_id=camera_id,
+            streaming=recorder.is_streaming(),
+            recording=recorder.is_recording(),
+            recording_id=(
+                active[camera_id].recording_id if camera_id in active else None
+            ),
+        )
+        for camera_id, recorder in manager.recorders.items()
+    ]
+
+
+async def _add_camera_recordings(
+    manager: RecorderManager, request: StartRecordingRequest
+) -> tuple[str, Dict[str, Recording]]:
+    for camera_id in manager.recorders:
+        _check_not_recording(camera_id)
+    filename = _video_filename(request.filename, request.settings())
+    rates, warnings = await _admit(request, list(manager.recorders))
+    added = {
+        camera_id: await _add_recording(
+            file_name_for_camera(filename, camera_id),
+            request.metadata,
+            camera_id,
+            rates.get(camera_id),
+            warnings,
+        )
+        for camera_id in manager.recorders
     }
+    return filename, added
+
+
+def _update_camera_statuses_when_done(
+    manager: RecorderManager, added: Dict[str, Recording], status: RecordingStatus
+):
+    def on_done(command: Command):
+        result = manager.last_start
+        for camera_id, recording in added.items():
+            camera = result.cameras.get(camera_id) if result else None
+            if command.status == CommandStatus.FAILED:
+                recording.status = RecordingStatus.FAILED
+                recording.error = command.error
+            elif camera is None or camera.error is not None:
+                recording.status = RecordingStatus.FAILED
+                recording.error = camera.error if camera else "Camera did not start"
+            else:
+                recording.status = status
+            recordings[recording.recording_id] = recording
+            _publish_recording(recording)
+
+    return on_done
+
+
+@router.post("/cameras/start", response_model=StartAllResponse)
+async def start_all_cameras(request: StartRecordingRequest, wait: bool = True):
+    manager = _get_manager()
+    filename, started = await _add_camera_recordings(manager, request)
+    command = command_queue.submit(
+        "start_all",
+        functools.partial(manager.start_all, filename, **_start_arguments(request)),
+        on_done=_update_camera_statuses_when_done(
+            manager, started, RecordingStatus.RECORDING
+        ),
+        cameras=manager.recorders,
+    )
+    for recording in started.values():
+        recording.command_id = command.command_id
+    start_skew_ms = None
+    if wait:
+        result = await _wait_for_command(command)
+        start_skew_ms = result.start_skew_ms
+    return StartAllResponse(
+        recordings=started, start_skew_ms=start_skew_ms, command_id=command.command_id
+    )
+
+
+@router.post("/cameras/arm", response_model=StartAllResponse)
+async def arm_all_cameras(request: StartRecordingRequest, wait: bool = True):
+    """Prepare recordings on all cameras, see /status for the time arming took."""
+    manager = _get_manager()
+    filename, armed = await _add_camera_recordings(manager, request)
+    command = command_queue.submit(
+        "arm_all",
+        functools.partial(manager.arm_all, filename, **_start_arguments(request)),
+        on_done=_update_camera_statuses_when_done(
+            manager, armed, RecordingStatus.ARMED
+        ),
+        cameras=manager.recorders,
+    )
+    for recording in armed.values():
+        recording.command_id = command.command_id
+    if wait:
+        await _wait_for_command(command)
+    return StartAllResponse(recordings=armed, command_id=command.command_id)
+
+
+@router.post("/cameras/fire", response_model=FireAllResponse)
+async def fire_all_cameras(request: FireRequest = FireRequest(), wait: bool = True):
+    """Start all armed cameras with the first frame at or after a common host time."""
+    manager = _get_manager()
+    if request.at_frame is not None:
+        # frame numbers are counted per camera
+        raise HTTPException(
+            status_code=400, detail="at_frame is only supported for single recordings"
+        )
+    armed = _camera_recordings((RecordingStatus.ARMED,))
+    if not armed:
+        raise HTTPException(status_code=400, detail="No camera is armed")
+
+    def on_done(command: Command):
+        for recording in armed.values():
+            if command.status == CommandStatus.FAILED:
+                recording.status = RecordingStatus.FAILED
+                recording.error = command.error
+            else:
+                recording.status = RecordingStatus.RECORDING
+            recordings[recording.recording_id] = recording
+            _publish_recording(recording)
+
+    at_ns = request.at_ns
+    if at_ns is None:
+        at_ns = time.time_ns() + FIRE_ALL_LEAD_NS
+    command = command_queue.submit(
+        "fire_all", manager.fire_all, at_ns, on_done=on_done, cameras=manager.recorders
+    )
+    for recording in armed.values():
+        recording.command_id = command.command_id
+    if wait:
+        await _wait_for_command(command)
+    return FireAllResponse(recordings=armed, at_ns=at_ns, command_id=command.command_id)
+
+
+@router.post("/cameras/stop", response_model=StopAllResponse)
+async def stop_all_cameras(wait: bool = True):
+    manager = _get_manager()
+    stopping = _camera_recordings(ACTIVE_STATUSES)
+    for recording in stopping.values():
+        await metadata_writer.flush(recording.recording_id)
+        recording.status = RecordingStatus.STOPPING
+        _publish_recording(recording)
+
+    errors: Dict[str, str | None] = {}
+
+    def stop_all():
+        errors.update(manager.stop_all())
+
+    def on_done(command: Command):
+        for camera_id, recording in stopping.items():
+            error = command.error or errors.get(camera_id)
+            if error is not None:
+                recording.status = RecordingStatus.FAILED
+                recording.error = error
+            else:
+                recording.status = RecordingStatus.STOPPED
+                _recording_stopped(recording)
+            recordings[recording.recording_id] = recording
+            _publish_recording(recording)
+
+    command = command_queue.submit(
+        "stop_all", stop_all, on_done=on_done, cameras=manager.recorders
+    )
+    for recording in stopping.values():
+        recording.command_id = command.command_id
+    if not wait:
+        return StopAllResponse(
+            message="Recordings stopping",
+            recordings=stopping,
+            command_id=command.command_id,
+        )
+    await _wait_for_command(command)
+    return StopAllResponse(
+        message="Recordings stopped", recordings=stopping, command_id=command.command_id
+    )
+
+
+@router.post("/cameras/{camera_id}/start", response_model=Recording)
+async def start_camera(
+    camera_id: str, request: StartRecordingRequest, wait: bool = True
+):
+    recorder = _get_camera(camera_id)
+    _check_not_recording(camera_id)
+    filename = _video_filename(request.filename, request.settings())
+    rates, warnings = await _admit(request, [camera_id])
+    recording = await _add_recording(
+        filename, request.metadata, camera_id, rates.get(camera_id), warnings
+    )
+    command = command_queue.submit(
+        f"start_recording[{camera_id}]",
+        functools.partial(
+            recorder.start_recording, filename, **_start_arguments(request)
+        ),
+        on_done=_update_status_when_done(recording, RecordingStatus.RECORDING),
+        cameras=[camera_id],
+    )
+    recording.command_id = command.command_id
+    if wait:
+        await _wait_for_command(command)
+    return recording
+
+
+@router.post("/cameras/{camera_id}/stop", response_model=StopRecordingResponse)
+async def stop_camera(camera_id: str, wait: bool = True):
+    recorder = _get_camera(camera_id)
+    recording = _camera_recordings(ACTIVE_STATUSES).get(camera_id)
+    if recording is None:
+        raise HTTPException(status_code=400, detail="Camera is not recording")
+    command = await _stop(
+        recording, f"stop_recording[{camera_id}]", recorder.stop_recording
+    )
+    if not wait:
+        return {"message": "Recording stopping", "recording": recording}
+    await _wait_for_command(command)
+    return {"message": "Recording stopped", "recording": recording}
+
+
+@router.get("/offload", response_model=OffloadResponse)
+def get_offload_status():
+    if offloader is None:
+        raise HTTPException(status_code=404, detail="Offloading is not configured")
+    return OffloadResponse(files=offloader.queue.counts())
+
+
+def _camera_statuses() -> Dict[str, RecorderStatus]:
+    if recorder_manager is not None:
+        return {
+            camera_id: recorder.get_status()
+            for camera_id, recorder in recorder_manager.recorders.items()
+        }
+    if status_func is not None:
+        return {default_camera_id: status_func()}
+    return {}
+
 
+def _milliseconds(seconds: float) -> float | None:
+    return None if math.isnan(seconds) else seconds * 1e3
 
-@app.post("/recordings/metadata", response_model=MetadataResponse)
+
+@router.get("/status", response_model=StatusResponse)
+def get_status():
+    cameras = {}
+    for camera_id, status in _camera_statuses().items():
+        cameras[camera_id] = CameraStatus(
+            streaming=status.streaming,
+            recording=status.recording,
+            frames_delivered=status.frames_delivered,
+            frames_dropped=status.frames_dropped,
+            writer_queue_depth=status.writer_queue_depth,
+            frames_per_second=status.frames_per_second,
+            average_frames_per_second=status.average_frames_per_second,
+            drops_per_second=status.drops_per_second,
+            armed=status.armed,
+            recording_full=status.recording_full,
+            frames_written=status.frames_written,
+            arm_duration_ms=status.arm_duration_ms,
+            first_frame_latency_ms=status.first_frame_latency_ms,
+            encoder=status.encoder,
+            encoder_frames_per_second=status.encoder_frames_per_second,
+            encoder_cpu_percent=status.encoder_cpu_percent,
+            frames_missing=status.frames_missing,
+            missed_triggers=status.missed_triggers,
+            placeholder_frames=status.placeholder_frames,
+            stages={
+                stage: StageStatus(
+                    count=histogram.count,
+                    mean_ms=_milliseconds(histogram.mean_s),
+                    p50_ms=_milliseconds(histogram.quantile(0.5)),
+                    p99_ms=_milliseconds(histogram.quantile(0.99)),
+                    max_ms=_milliseconds(histogram.max_s) if histogram.count else None,
+                )
+                for stage, histogram in status.stages.items()
+            },
+        )
+    return StatusResponse(cameras=cameras)
+
+
+@router.get("/metrics")
+def get_metrics():
+    return Response(
+        format_prometheus(_camera_statuses()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@router.get("/events")
+async def stream_events(
+    types: list[str] | None = Query(None),
+    last_event_id: int | None = Header(None),
+):
+    """Server-sent events: recording state changes, progress, drops and lost devices."""
+    subscription = events.subscribe(set(types) if types else None, last_event_id)
+
+    async def generate():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(), HEARTBEAT_INTERVAL_S
+                    )
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/commands/{command_id}", response_model=CommandResponse)
+async def get_command(command_id: str, wait: bool = False):
+    command = command_queue.get(command_id)
+    if command is None:
+        raise HTTPException(status_code=404, detail="Command ID not found")
+    if wait:
+        try:
+            await command_queue.wait(command)
+        except Exception:
+            pass
+    return CommandResponse(
+        command_id=command.command_id,
+        name=command.name,
+        status=command.status,
+        submitted_at=command.submitted_at,
+        started_at=command.started_at,
+        finished_at=command.finished_at,
+        error=command.error,
+    )
+
+
+@router.post("/recordings/metadata", response_model=MetadataResponse)
 async def add_metadata(request: AddMetadataRequest):
     if request.recording_id not in recordings:
         raise HTTPException(status_code=404, detail="Recording ID not found")
-    recordings[request.recording_id].metadata = request.metadata
-    metadata_filename = metadata_filename_from_recording_id(request.recording_id)
-    with open(os.path.join(RECORDINGS_DIR, metadata_filename), "w") as metadata_file:
-        json.dump(request.metadata, metadata_file)
+    recording = recordings[request.recording_id]
+    recording.metadata = request.metadata
+    recordings[request.recording_id] = recording
+    await metadata_writer.write(request.recording_id, request.metadata)
     return {"message": "Metadata added"}
 
 
-@app.get("/recordings/{recording_id}", response_model=Recording)
+@router.patch(
+    "/recordings/{recording_id}/metadata", response_model=MetadataPatchResponse
+)
+async def patch_metadata(recording_id: str, patch: MetadataPatch, flush: bool = False):
+    """Merge metadata and append events; written within a flush interval."""
+    if recording_id not in recordings:
+        raise HTTPException(status_code=404, detail="Recording ID not found")
+    recording = recordings[recording_id]
+    recording.metadata.update(patch.metadata)
+    for key in patch.remove:
+        recording.metadata.pop(key, None)
+    if patch.events:
+        recording.events_url = url_from_filename(
+            events_filename_from_recording_id(recording_id)
+        )
+    recordings[recording_id] = recording
+    metadata_writer.update(
+        recording_id,
+        recording.metadata if patch.metadata or patch.remove else None,
+        patch.events,
+    )
+    if flush and not await metadata_writer.flush(recording_id):
+        raise HTTPException(
+            status_code=500,
+            detail="Writing the metadata failed, it is retried with the next update",
+        )
+    return MetadataPatchResponse(
+        metadata=recording.metadata, events_appended=len(patch.events)
+    )
+
+
+def recording_query(
+    metadata: list[str] = Query(
+        [], description="'key:value' to match a value, 'key' to require a key"
+    ),
+    modified_after: float | None = Query(
+        None, description="Unix time; only recordings modified at or after it"
+    ),
+    modified_before: float | None = Query(
+        None, description="Unix time; only recordings modified before it"
+    ),
+    sort: Literal["recording_id", "modified"] = "recording_id",
+    order: Literal["asc", "desc"] = "asc",
+) -> CatalogQuery:
+    query = CatalogQuery(sort=sort, descending=order == "desc")
+    for item in metadata:
+        key, separator, value = item.partition(":")
+        query.metadata[key] = value if separator else None
+    if modified_after is not None:
+        query.modified_after_ns = int(modified_after * 1e9)
+    if modified_before is not None:
+        query.modified_before_ns = int(modified_before * 1e9)
+    return query
+
+
+def _projection(fields: str | None) -> set[str] | None:
+    if fields is None:
+        return None
+    projection = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = projection - Recording.model_fields.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return projection
+
+
+def _project(data: str, projection: set[str] | None) -> str:
+    # the catalog stores serialised recordings, only parse them to project
+    if projection is None:
+        return data
+    recording = json.loads(data)
+    return json.dumps({key: recording[key] for key in projection if key in recording})
+
+
+def _page(query: CatalogQuery, cursor: str | None, limit: int | None):
+    try:
+        return recordings.page(query, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/recordings/stream")
+def stream_recordings(
+    query: CatalogQuery = Depends(recording_query),
+    fields: str | None = None,
+    cursor: str | None = None,
+):
+    """Finished recordings as newline-delimited JSON, one recording per line."""
+    projection = _projection(fields)
+    rows, cursor = _page(query, cursor, STREAM_PAGE_SIZE)
+
+    def lines():
+        nonlocal rows, cursor
+        while True:
+            for _, data in rows:
+                yield _project(data, projection) + "\n"
+            if cursor is None:
+                return
+            rows, cursor = recordings.page(query, cursor, STREAM_PAGE_SIZE)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/recordings/{recording_id}", response_model=Recording)
 async def get_recording(recording_id: str):
     if recording_id not in recordings:
         raise HTTPException(status_code=404, detail="Recording ID not found")
     recording = recordings[recording_id]
     if recording.status != RecordingStatus.STOPPED:
         raise HTTPException(status_code=400, detail="Recording is not yet stopped")
-    return recordings[recording_id]
+    return recording
+
+
+def _recording_frames(recording_id: str) -> RecordingFrames:
+    if recording_id not in recordings:
+        raise HTTPException(status_code=404, detail="Recording ID not found")
+    recording = recordings[recording_id]
+    if recording.status != RecordingStatus.STOPPED:
+        raise HTTPException(status_code=400, detail="Recording is not yet stopped")
+    videos = recording.segments or [recording.video_filename]
+    try:
+        return RecordingFrames(
+            [os.path.join(RECORDINGS_DIR, video) for video in videos], frame_cache
+        )
+    except OSError:
+        raise HTTPException(status_code=404, detail="Video file not found")
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=f"Cannot index video: {e}")
 
 
-@app.get("/recordings", response_model=Dict[str, Recording])
-async def list_recordings():
-    available_recordings = {}
-    # update_recordings_from_disk()
+def _decode_frames(frames: RecordingFrames, first: int, count: int) -> list[np.ndarray]:
+    try:
+        return frames.frames(first, count)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DecoderUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    for recording_id, recording in recordings.items():
-        if recording.status == RecordingStatus.STOPPED:
-            available_recordings[recording_id] = recording
 
-    return available_recordings
+def _npy_response(array: np.ndarray, headers: Dict[str, str]) -> Response:
+    npy = io.BytesIO()
+    np.save(npy, array)
+    return Response(
+        npy.getvalue(), media_type="application/octet-stream", headers=headers
+    )
+
+
+@router.get("/recordings/{recording_id}/frames/{frame_number}")
+def get_frame(
+    recording_id: str, frame_number: int, format: Literal["png", "npy"] = "png"
+):
+    """One frame as RGB, decoded from the nearest keyframe before it."""
+    frames = _recording_frames(recording_id)
+    frame = _decode_frames(frames, frame_number, 1)[0]
+    headers = {
+        "X-Frame-Count": str(frames.frame_count),
+        "X-Frame-Timestamp-Ns": str(frames.timestamp_ns(frame_number)),
+    }
+    if format == "npy":
+        return _npy_response(frame, headers)
+    return Response(encode_png(frame), media_type="image/png", headers=headers)
+
 
+@router.get("/recordings/{recording_id}/frames")
+def get_frames(
+    recording_id: str,
+    start: int = 0,
+    count: int = Query(1, ge=1, le=MAX_FRAMES_PER_REQUEST),
+):
+    """Consecutive frames as a count x height x width x 3 array in .npy format."""
+    frames = _recording_frames(recording_id)
+    decoded = _decode_frames(frames, start, count)
+    return _npy_response(np.stack(decoded), {"X-Frame-Count": str(frames.frame_count)})
 
-# Mount static files route
-app.mount("/files", StaticFiles(directory=RECORDINGS_DIR), name="files")
 
+# returns the stored JSON as is, so the model only documents the response
+@router.get(
+    "/recordings",
+    response_class=Response,
+    responses={
+        200: {
+            "model": Dict[str, Recording],
+            "description": "Finished recordings by id, only with `fields` if given",
+        }
+    },
+)
+def list_recordings(
+    query: CatalogQuery = Depends(recording_query),
+    fields: str | None = Query(
+        None, description="Comma separated fields to return for each recording"
+    ),
+    limit: int | None = Query(None, ge=1, le=10000),
+    cursor: str | None = Query(
+        None, description="X-Next-Cursor header of the previous page"
+    ),
+):
+    # only finished recordings are stored in the catalog's index
+    projection = _projection(fields)
+    rows, next_cursor = _page(query, cursor, limit)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+    # build the body from the stored JSON instead of validating every recording
+    body = ",".join(
+        f"{json.dumps(recording_id)}:{_project(data, projection)}"
+        for recording_id, data in rows
+    )
+    return Response("{" + body + "}", media_type="application/json", headers=headers)
+
+
+@router.api_route("/downloads/{filename}", methods=["GET", "HEAD"])
+def download_file(filename: str, request: Request):
+    """Recorded files with byte ranges, ETags and compressed JSON sidecars.
+
+    Files of a recording in progress can be fetched up to their current length.
+    """
+    path = os.path.join(RECORDINGS_DIR, filename)
+    if os.path.basename(filename) != filename or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    growing = any(
+        filename.startswith(recording.recording_id + ".")
+        for recording in recordings.live()
+        if recording.status not in FINISHED_STATUSES
+    )
+    return file_response(path, request.headers, growing)
+
+
+@dataclass
+class ServerConfig:
+    recordings_dir: str = RECORDINGS_DIR
+    # SQLite index of the finished recordings, next to recordings_dir by default
+    catalog_path: str | None = None
+    host: str = HOST
+    port: int = PORT
+    # recorder calls behind the single-recording endpoints; no-ops if None
+    start_func: Callable[..., None] | None = None
+    stop_func: Callable[[], None] | None = None
+    arm_func: Callable[..., None] | None = None
+    fire_func: Callable[..., None] | None = None
+    status: Callable[[], RecorderStatus] | None = None
+    # enables the /cameras endpoints
+    manager: RecorderManager | None = None
+    # see default_camera_id
+    default_camera_id: str = DEFAULT_CAMERA_ID
+    offload: Offloader | None = None
+    # see estimate_func and disk_admission
+    estimate_func: Callable[..., float] | None = None
+    disk_admission: DiskAdmission | None = None
+
+
+def create_app(config: ServerConfig | None = None) -> FastAPI:
+    """Build the app for `config`.
 
-def run_http_server(start_func: Callable[[str], None], stop_func: Callable[[], None]):
-    global start_recording_func, stop_recording_func
-    start_recording_func = start_func
-    stop_recording_func = stop_func
+    Importing this module has no side effects; the recordings directory is
+    created and the catalog opened here, and the catalog is brought up to
+    date with the directory in the background once the app starts.
+
+    The configuration is kept in this module's globals, so there is one app
+    per process: creating another one reconfigures the first. The recorders
+    behind the start functions must write to `config.recordings_dir`.
+    """
+    global app, recordings, RECORDINGS_DIR, HOST, PORT
+    global start_recording_func, stop_recording_func, arm_recording_func
+    global fire_recording_func, status_func, recorder_manager, offloader
+    global estimate_func, disk_admission, default_camera_id
+    config = config or ServerConfig()
+    RECORDINGS_DIR = config.recordings_dir
+    # file URLs handed out by the API point at this server
+    HOST = config.host
+    PORT = config.port
+    if config.start_func is not None:
+        start_recording_func = config.start_func
+    if config.stop_func is not None:
+        stop_recording_func = config.stop_func
+    if config.arm_func is not None:
+        arm_recording_func = config.arm_func
+    if config.fire_func is not None:
+        fire_recording_func = config.fire_func
+    status_func = config.status
+    recorder_manager = config.manager
+    default_camera_id = config.default_camera_id
+    offloader = config.offload
+    if offloader is not None and offloader.on_deleted is None:
+        offloader.on_deleted = offloaded_file_deleted
+    estimate_func = config.estimate_func
+    disk_admission = config.disk_admission
+
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+    recordings = RecordingsCatalog(
+        config.catalog_path or f"{RECORDINGS_DIR}.sqlite",
+        RECORDINGS_DIR,
+        Recording,
+        recording_from_disk,
+        # failed recordings are kept until their video file is found missing
+        is_persistent=lambda recording: recording.status in FINISHED_STATUSES,
+        extension=VIDEO_EXTENSIONS,
+        key_func=recording_id_from_disk_filename,
+    )
+    metadata_writer.directory = RECORDINGS_DIR
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    app.mount("/files", StaticFiles(directory=RECORDINGS_DIR), name="files")
+    return app
+
+
+def __getattr__(name: str):
+    # `app` and `recordings` of the default configuration, created on first use
+    if name in ("app", "recordings"):
+        create_app()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def run_http_server(
+    start_func: Callable[[str], None],
+    stop_func: Callable[[], None],
+    manager: RecorderManager | None = None,
+    host: str = HOST,
+    port: int = PORT,
+    offload: Offloader | None = None,
+    status: Callable[[], RecorderStatus] | None = None,
+    arm_func: Callable[..., None] | None = None,
+    fire_func: Callable[..., None] | None = None,
+    estimate_func: Callable[..., float] | None = None,
+    disk_admission: DiskAdmission | None = None,
+    default_camera_id: str = DEFAULT_CAMERA_ID,
+    recordings_dir: str = RECORDINGS_DIR,
+):
     import uvicorn
 
-    uvicorn.run(app, host=HOST, port=PORT)
+    config = ServerConfig(
+        recordings_dir=recordings_dir,
+        host=host,
+        port=port,
+        start_func=start_func,
+        stop_func=stop_func,
+        arm_func=arm_func,
+        fire_func=fire_func,
+        status=status,
+        manager=manager,
+        default_camera_id=default_camera_id,
+        offload=offload,
+        estimate_func=estimate_func,
+        disk_admission=disk_admission or DiskAdmission(recordings_dir),
+    )
+    uvicorn.run(create_app(config), host=host, port=port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+"""Software encoding by piping raw frames to a local ffmpeg process.
+
+ffmpeg runs as its own process, so its (multithreaded) encoders neither hold
+the GIL nor share the writer thread; writing a frame only copies it into the
+pipe, which blocks once ffmpeg falls behind, just like a slow in-process
+encoder would.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from recorder import EncoderStatistics
+
+# ffmpeg input pixel formats of the camera pixel formats, see raw_recording.PIXEL_FORMATS
+FFMPEG_PIXEL_FORMATS = {
+    "Mono8": "gray",
+    "Mono16": "gray16le",
+    "BayerBG8": "bayer_bggr8",
+    "BayerGB8": "bayer_gbrg8",
+    "BayerGR8": "bayer_grbg8",
+    "BayerRG8": "bayer_rggb8",
+    "BayerBG16": "bayer_bggr16le",
+    "BayerGB16": "bayer_gbrg16le",
+    "BayerGR16": "bayer_grbg16le",
+    "BayerRG16": "bayer_rggb16le",
+    "BGR8": "bgr24",
+    "BGRa8": "bgra",
+    "BGRa16": "bgra64le",
+}
+
+# how often the CPU time of the ffmpeg process is sampled, in frames
+CPU_SAMPLE_INTERVAL = 32
+
+
+@dataclass(frozen=True)
+class FfmpegCodec:
+    args: tuple[str, ...]
+    extension: str
+    # whether the x264 preset applies
+    has_preset: bool = False
+
+
+FFMPEG_CODECS = {
+    "h264": FfmpegCodec(
+        ("-c:v", "libx264", "-crf", "18", "-pix_fmt", "yuv420p"),
+        ".mp4",
+        has_preset=True,
+    ),
+    # lossless, with one slice per thread and checksums per slice
+    "ffv1": FfmpegCodec(
+        ("-c:v", "ffv1", "-level", "3", "-slices", "16", "-slicecrc", "1"), ".mkv"
+    ),
+    "mjpeg": FfmpegCodec(("-c:v", "mjpeg", "-q:v", "3"), ".mkv"),
+}
+
+
+def ffmpeg_available(ffmpeg: str = "ffmpeg") -> bool:
+    return shutil.which(ffmpeg) is not None
+
+
+def ffmpeg_filename(file_name: str, codec: str) -> str:
+    """`file_name` with the extension of the codec's container."""
+    return os.path.splitext(file_name)[0] + FFMPEG_CODECS[codec].extension
+
+
+def process_cpu_seconds(pid: int) -> float | None:
+    """User and system CPU time of a process; None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            # the fields after the command name, which may contain spaces
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class FfmpegVideoWriter:
+    """Encodes frames with ffmpeg; same interface as `ic4.VideoWriter`.
+
+    The CPU time of the ffmpeg process, and when it has flushed a file, are
+    added to `statistics`, if given.
+    """
+
+    def __init__(
+        self,
+        codec: str = "h264",
+        preset: str = "veryfast",
+        threads: int = 0,
+        statistics: EncoderStatistics | None = None,
+        ffmpeg: str = "ffmpeg",
+    ):
+        if codec not in FFMPEG_CODECS:
+            raise ValueError(
+                f"Unknown codec {codec}, one of {', '.join(FFMPEG_CODECS)}"
+            )
+        self.codec = codec
+        self.preset = preset
+        self.threads = threads
+        self.statistics = statistics
+        self.ffmpeg = ffmpeg
+        self.frame_count = 0
+        self._process: subprocess.Popen | None = None
+        # of the ffmpeg process of the current or last file
+        self.cpu_seconds = 0.0
+        # perf_counter_ns at which ffmpeg had flushed the last file
+        self.flushed_ns: int | None = None
+
+    def command(self, path: str, image_type, frame_rate: float) -> list[str]:
+        pixel_format = image_type.pixel_format.name
+        if pixel_format not in FFMPEG_PIXEL_FORMATS:
+            raise ValueError(f"Pixel format {pixel_format} is not supported")
+        codec = FFMPEG_CODECS[self.codec]
+        command = [
+            self.ffmpeg,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            FFMPEG_PIXEL_FORMATS[pixel_format],
+            "-video_size",
+            f"{image_type.width}x{image_type.height}",
+            "-framerate",
+            repr(frame_rate),
+            "-i",
+            "pipe:0",
+            *codec.args,
+        ]
+        if codec.has_preset:
+            command += ["-preset", self.preset]
+        command += ["-threads", str(self.threads), "-y", path]
+        return command
+
+    def begin_file(self, path: str, image_type, frame_rate: float):
+        command = self.command(path, image_type, frame_rate)
+        # a file instead of a pipe, so that ffmpeg never blocks on its errors
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stderr=self._stderr
+        )
+        self.frame_count = 0
+        self.cpu_seconds = 0.0
+
+    def add_frame(self, buf):
+        try:
+            self._process.stdin.write(np.ascontiguousarray(buf.numpy_wrap()).data)
+        except BrokenPipeError:
+            self._process.wait()
+            raise RuntimeError(f"ffmpeg failed: {self._errors()}") from None
+        self.frame_count += 1
+        if self.frame_count % CPU_SAMPLE_INTERVAL == 0:
+            self._sample_cpu()
+
+    def finish_file(self):
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        # sampled until ffmpeg exits, to include flushing the encoder
+        while process.poll() is None:
+            self._sample_cpu(process)
+            time.sleep(0.01)
+        self.flushed_ns = time.perf_counter_ns()
+        if self.statistics is not None:
+            self.statistics.file_flushed(self.flushed_ns)
+        errors = self._errors()
+        self._stderr.close()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {errors}")
+
+    def _sample_cpu(self, process: subprocess.Popen | None = None):
+        process = process or self._process
+        cpu_s = process_cpu_seconds(process.pid)
+        if cpu_s is None or cpu_s <= self.cpu_seconds:
+            return
+        if self.statistics is not None:
+            self.statistics.add_process_cpu(cpu_s - self.cpu_seconds)
+        self.cpu_seconds = cpu_s
+
+    def _errors(self) -> str:
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors="replace").strip()
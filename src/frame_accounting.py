@@ -0,0 +1,59 @@
+"""Accounting of the frames a camera exposed against the frames recorded.
+
+Cameras number their frames (the GenICam block id), so a jump in the frame
+numbers of the recorded frames shows frames that were lost between the
+sensor and the file. Triggers the camera ignored, e.g. because it was still
+exposing, never get a frame number; cameras that support it report them
+with a FrameTriggerMissed event instead.
+"""
+
+from dataclasses import dataclass
+
+# longest run of placeholder frames inserted for a single gap; larger jumps
+# are more likely a reset of the camera's frame counter than lost frames
+MAX_PLACEHOLDER_RUN = 1000
+
+
+@dataclass
+class FrameAccountingStatistics:
+    frames_recorded: int = 0
+    # frames the camera numbered that never reached the file
+    frames_missing: int = 0
+    # runs of consecutive missing frames
+    gaps: int = 0
+    # triggers the camera reported as ignored
+    missed_triggers: int = 0
+    placeholder_frames: int = 0
+
+
+class FrameAccounting:
+    """Detects gaps in the frame numbers of the frames of one recording.
+
+    `frame` is called by the writer thread only, `trigger_missed` by the
+    camera's event thread only.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.statistics = FrameAccountingStatistics()
+        self._last_frame_number: int | None = None
+
+    def frame(self, frame_number: int) -> int:
+        """Account for a recorded frame; returns the number of frames missing before it."""
+        statistics = self.statistics
+        last = self._last_frame_number
+        self._last_frame_number = frame_number
+        statistics.frames_recorded += 1
+        if last is None or frame_number <= last:
+            # the first frame, or the camera restarted counting
+            return 0
+        missing = frame_number - last - 1
+        if missing:
+            statistics.frames_missing += missing
+            statistics.gaps += 1
+        return missing
+
+    def trigger_missed(self):
+        self.statistics.missed_triggers += 1
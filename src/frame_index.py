@@ -0,0 +1,288 @@
+"""Seek index of the frames of an MP4 recording.
+
+Built from the sample tables of the file's video track once the file is
+finished and written next to it. The file starts with a header (see
+HEADER_FORMAT) and the codec's configuration record (e.g. H.264's avcC, with
+SPS and PPS), followed by one FRAME_INDEX_DTYPE record per sample in decode
+order: where the sample is in the file, whether decoding can start at it, and
+its presentation timestamp in units of `timescale`.
+
+Frame numbers count frames in presentation order, like a player shows them.
+"""
+
+import os
+import struct
+from dataclasses import dataclass, field
+
+import numpy as np
+
+FRAME_INDEX_SUFFIX = ".index.bin"
+MAGIC = b"ISINDEX\x00"
+VERSION = 1
+HEADER_FORMAT = "<8sII III 4sI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+FRAME_INDEX_DTYPE = np.dtype(
+    [
+        ("offset", "<u8"),
+        ("size", "<u4"),
+        ("keyframe", "u1"),
+        ("pts", "<i8"),
+    ]
+)
+
+# boxes on the way from the file to the sample tables
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+# size of a VisualSampleEntry before its child boxes, see ISO/IEC 14496-12
+VISUAL_SAMPLE_ENTRY_SIZE = 86
+NAL_START_CODE = b"\x00\x00\x00\x01"
+
+
+@dataclass
+class FrameIndex:
+    timescale: int
+    width: int
+    height: int
+    # sample entry type, e.g. b"avc1"
+    codec: bytes
+    # the codec's configuration record
+    extradata: bytes
+    # FRAME_INDEX_DTYPE records in decode order
+    samples: np.ndarray
+    _ranks: np.ndarray | None = field(default=None, repr=False)
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.samples)
+
+    @property
+    def ranks(self) -> np.ndarray:
+        """Frame number of every sample."""
+        if self._ranks is None:
+            order = np.argsort(self.samples["pts"], kind="stable")
+            self._ranks = np.empty_like(order)
+            self._ranks[order] = np.arange(len(order))
+        return self._ranks
+
+    def timestamp_ns(self, frame_number: int) -> int:
+        sample = int(np.flatnonzero(self.ranks == frame_number)[0])
+        return int(self.samples["pts"][sample]) * 1_000_000_000 // self.timescale
+
+    def decode_span(self, first: int, last: int) -> tuple[int, int]:
+        """Samples (decode order, inclusive) to decode for frames `first` to
+        `last`: from the nearest keyframe before them up to the last of them."""
+        samples = np.flatnonzero((self.ranks >= first) & (self.ranks <= last))
+        keyframes = np.flatnonzero(self.samples["keyframe"][: samples.min() + 1])
+        start = int(keyframes[-1]) if len(keyframes) else 0
+        return start, int(samples.max())
+
+
+def _boxes(data: bytes, start: int = 0, end: int | None = None):
+    """(type, payload start, payload end) of the boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, start)
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", data, start + 8)
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            raise ValueError(f"Invalid {box_type!r} box")
+        yield box_type, start + header, start + size
+        start += size
+
+
+def _read_moov(path: str) -> bytes:
+    # the media data may come before or after the movie box, skip it unread
+    with open(path, "rb") as video_file:
+        file_size = os.fstat(video_file.fileno()).st_size
+        start = 0
+        while start + 8 <= file_size:
+            video_file.seek(start)
+            header = video_file.read(16)
+            size, box_type = struct.unpack_from(">I4s", header)
+            header_size = 8
+            if size == 1:
+                (size,) = struct.unpack_from(">Q", header, 8)
+                header_size = 16
+            elif size == 0:
+                size = file_size - start
+            if size < header_size:
+                break
+            if box_type == b"moov":
+                video_file.seek(start + header_size)
+                return video_file.read(size - header_size)
+            start += size
+    raise ValueError(f"{path} has no movie box")
+
+
+def _find(data: bytes, start: int, end: int, path: list[bytes]) -> list[tuple]:
+    """All boxes at `path` below data[start:end]."""
+    found = []
+    for box_type, payload, box_end in _boxes(data, start, end):
+        if box_type != path[0]:
+            continue
+        if len(path) == 1:
+            found.append((payload, box_end))
+        elif box_type in CONTAINER_BOXES:
+            found += _find(data, payload, box_end, path[1:])
+    return found
+
+
+def _table(
+    data: bytes, box: tuple | None, columns: int, dtype: str = ">u4"
+) -> np.ndarray:
+    """Entries of a sample table box: version and flags, entry count, entries."""
+    if box is None:
+        return np.zeros((0, columns), np.int64)
+    payload, _ = box
+    (count,) = struct.unpack_from(">I", data, payload + 4)
+    entries = np.frombuffer(data, dtype, count * columns, payload + 8)
+    return entries.astype(np.int64).reshape(count, columns)
+
+
+def _video_track(data: bytes) -> tuple[int, int]:
+    for trak, trak_end in _find(data, 0, len(data), [b"trak"]):
+        hdlr = _find(data, trak, trak_end, [b"mdia", b"hdlr"])
+        # version and flags, pre_defined, then the handler type
+        if hdlr and data[hdlr[0][0] + 8 : hdlr[0][0] + 12] == b"vide":
+            return trak, trak_end
+    raise ValueError("No video track")
+
+
+def build_frame_index(path: str) -> FrameIndex:
+    data = _read_moov(path)
+    trak, trak_end = _video_track(data)
+
+    def box(*path: bytes) -> tuple | None:
+        found = _find(data, trak, trak_end, [b"mdia", *path])
+        return found[0] if found else None
+
+    mdhd, _ = box(b"mdhd")
+    # creation and modification time are 32 or 64 bit, by version
+    timescale_offset = 20 if data[mdhd] == 1 else 12
+    (timescale,) = struct.unpack_from(">I", data, mdhd + timescale_offset)
+
+    stbl = (b"minf", b"stbl")
+    stsd, _ = box(*stbl, b"stsd")
+    entry = stsd + 8
+    entry_size, codec = struct.unpack_from(">I4s", data, entry)
+    width, height = struct.unpack_from(">HH", data, entry + 32)
+    extradata = b""
+    for _, payload, box_end in _boxes(
+        data, entry + VISUAL_SAMPLE_ENTRY_SIZE, entry + entry_size
+    ):
+        # avcC, hvcC, ... the configuration record follows the sample entry
+        extradata = data[payload:box_end]
+        break
+
+    stsz, _ = box(*stbl, b"stsz")
+    sample_size, count = struct.unpack_from(">II", data, stsz + 4)
+    if sample_size:
+        sizes = np.full(count, sample_size, np.int64)
+    else:
+        sizes = np.frombuffer(data, ">u4", count, stsz + 12).astype(np.int64)
+
+    # chunk offsets and samples per chunk give the offset of every sample
+    chunk_offsets = _table(data, box(*stbl, b"stco"), 1)[:, 0]
+    if box(*stbl, b"co64") is not None:
+        chunk_offsets = _table(data, box(*stbl, b"co64"), 1, ">u8")[:, 0]
+    stsc = _table(data, box(*stbl, b"stsc"), 3)
+    chunk_starts = np.append(stsc[:, 0] - 1, len(chunk_offsets))
+    samples_per_chunk = np.repeat(stsc[:, 1], np.diff(chunk_starts))
+    chunk_of_sample = np.repeat(np.arange(len(chunk_offsets)), samples_per_chunk)
+    first_in_chunk = np.repeat(
+        np.cumsum(samples_per_chunk) - samples_per_chunk, samples_per_chunk
+    )[:count]
+    before = np.cumsum(sizes) - sizes
+    offsets = chunk_offsets[chunk_of_sample[:count]] + before - before[first_in_chunk]
+
+    stts = _table(data, box(*stbl, b"stts"), 2)
+    durations = np.repeat(stts[:, 1], stts[:, 0])
+    dts = np.cumsum(durations) - durations
+    # composition offsets of reordered frames; negative ones need version 1
+    ctts = _table(data, box(*stbl, b"ctts"), 2, ">i4")
+    pts = dts + (np.repeat(ctts[:, 1], ctts[:, 0]) if len(ctts) else 0)
+
+    samples = np.zeros(count, FRAME_INDEX_DTYPE)
+    samples["offset"] = offsets
+    samples["size"] = sizes
+    stss = box(*stbl, b"stss")
+    if stss is None:
+        # without a sync sample table every sample is one
+        samples["keyframe"] = 1
+    else:
+        samples["keyframe"][_table(data, stss, 1)[:, 0] - 1] = 1
+    samples["pts"] = pts[:count]
+    return FrameIndex(timescale, width, height, codec, extradata, samples)
+
+
+def frame_index_filename(video_filename: str) -> str:
+    return os.path.splitext(video_filename)[0] + FRAME_INDEX_SUFFIX
+
+
+def write_frame_index(path: str, index: FrameIndex):
+    header = struct.pack(
+        HEADER_FORMAT,
+        MAGIC,
+        VERSION,
+        FRAME_INDEX_DTYPE.itemsize,
+        index.timescale,
+        index.width,
+        index.height,
+        index.codec,
+        len(index.extradata),
+    )
+    # replaced at once, so that readers never see a partial index
+    with open(f"{path}.tmp", "wb") as index_file:
+        index_file.write(header + index.extradata + index.samples.tobytes())
+    os.replace(f"{path}.tmp", path)
+
+
+def read_frame_index(path: str) -> FrameIndex:
+    with open(path, "rb") as index_file:
+        header = index_file.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:8] != MAGIC:
+            raise ValueError(f"{path} is not a frame index")
+        (
+            _,
+            version,
+            record_size,
+            timescale,
+            width,
+            height,
+            codec,
+            extradata_size,
+        ) = struct.unpack(HEADER_FORMAT, header)
+        if version != VERSION or record_size != FRAME_INDEX_DTYPE.itemsize:
+            raise ValueError(f"Unsupported frame index version {version}")
+        extradata = index_file.read(extradata_size)
+    samples = np.fromfile(path, FRAME_INDEX_DTYPE, offset=HEADER_SIZE + extradata_size)
+    return FrameIndex(timescale, width, height, codec, extradata, samples)
+
+
+def avc_to_annexb(extradata: bytes, samples: list[bytes]) -> bytes:
+    """H.264 samples of an MP4 file as a byte stream a decoder can start on:
+    SPS and PPS from the avcC record, then every NAL unit with a start code
+    instead of its length."""
+    length_size = (extradata[4] & 0x3) + 1
+    stream = bytearray()
+    position = 5
+    # the sequence parameter sets, then the picture parameter sets
+    for count_mask in (0x1F, 0xFF):
+        count = extradata[position] & count_mask
+        position += 1
+        for _ in range(count):
+            (size,) = struct.unpack_from(">H", extradata, position)
+            stream += NAL_START_CODE + extradata[position + 2 : position + 2 + size]
+            position += 2 + size
+    for sample in samples:
+        position = 0
+        while position + length_size <= len(sample):
+            size = int.from_bytes(sample[position : position + length_size], "big")
+            position += length_size
+            stream += NAL_START_CODE + sample[position : position + size]
+            position += size
+    return bytes(stream)
@@ -0,0 +1,80 @@
+"""Per-frame timestamp sidecar written next to a recording.
+
+The file starts with a 16 byte header (magic, version, record size) followed
+by one FRAME_LOG_DTYPE record per written frame, in the order the frames were
+written to the video. Gaps in `frame_number` show dropped frames, unless
+placeholder frames were written for them; their records have zero timestamps.
+"""
+
+import struct
+
+import numpy as np
+
+FRAME_LOG_SUFFIX = ".frames.bin"
+MAGIC = b"ISFRAMES"
+VERSION = 1
+HEADER_FORMAT = "<8sII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+FRAME_LOG_DTYPE = np.dtype(
+    [
+        ("frame_number", "<u8"),
+        ("device_timestamp_ns", "<u8"),
+        ("host_timestamp_ns", "<i8"),
+    ]
+)
+
+
+class FrameLog:
+    """Collects per-frame timestamps in a preallocated array and writes them
+    to disk in batches of `batch_size` records."""
+
+    def __init__(self, path: str, batch_size: int = 1024):
+        self.path = path
+        self.frames_logged = 0
+        self._batch = np.zeros(batch_size, FRAME_LOG_DTYPE)
+        self._frame_number = self._batch["frame_number"]
+        self._device_timestamp = self._batch["device_timestamp_ns"]
+        self._host_timestamp = self._batch["host_timestamp_ns"]
+        self._count = 0
+        self._file = open(path, "wb")
+        self._file.write(
+            struct.pack(HEADER_FORMAT, MAGIC, VERSION, FRAME_LOG_DTYPE.itemsize)
+        )
+
+    def append(
+        self, frame_number: int, device_timestamp_ns: int, host_timestamp_ns: int
+    ):
+        n = self._count
+        self._frame_number[n] = frame_number
+        self._device_timestamp[n] = device_timestamp_ns
+        self._host_timestamp[n] = host_timestamp_ns
+        self._count = n + 1
+        self.frames_logged += 1
+        if self._count == len(self._batch):
+            self.flush()
+
+    def flush(self):
+        if self._count:
+            self._file.write(self._batch[: self._count].tobytes())
+            self._count = 0
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+
+
+def read_frame_log(path: str) -> np.ndarray:
+    with open(path, "rb") as log_file:
+        magic, version, record_size = struct.unpack(
+            HEADER_FORMAT, log_file.read(HEADER_SIZE)
+        )
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a frame log")
+    if version != VERSION or record_size != FRAME_LOG_DTYPE.itemsize:
+        raise ValueError(f"Unsupported frame log version {version}")
+    return np.fromfile(path, FRAME_LOG_DTYPE, offset=HEADER_SIZE)
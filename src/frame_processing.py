@@ -0,0 +1,213 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+from frame_writer import SharedBuffer
+
+# A stage receives a read-only numpy view of the frame, shape (height, width, channels)
+StageFunc = Callable[[np.ndarray], Any]
+ResultCallback = Callable[[str, int, Any], None]
+
+
+@dataclass
+class StageStatistics:
+    frames_processed: int = 0
+    frames_skipped: int = 0
+    budget_overruns: int = 0
+    total_time_s: float = 0.0
+    max_time_s: float = 0.0
+    enabled: bool = True
+    last_frame_number: int | None = None
+    last_result: Any = None
+
+
+@dataclass
+class ProcessingStage:
+    name: str
+    func: StageFunc
+    budget_s: float
+    on_result: ResultCallback | None = None
+    busy: bool = False
+    consecutive_overruns: int = 0
+    stats: StageStatistics = field(default_factory=StageStatistics)
+
+
+class FrameProcessor:
+    """Runs per-frame analysis stages on a worker pool at camera rate.
+
+    Stages get a zero-copy, read-only view of the sink's buffer. Each stage
+    processes at most one frame at a time and frames arriving while it is busy
+    are skipped for that stage, so the number of buffers held by processing is
+    bounded by `max_in_flight` and the sink never runs dry. A stage that
+    exceeds its time budget `max_consecutive_overruns` times in a row is
+    disabled.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_in_flight: int = 2,
+        max_consecutive_overruns: int = 10,
+    ):
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.max_consecutive_overruns = max_consecutive_overruns
+        self._stages: Dict[str, ProcessingStage] = {}
+        self._lock = Lock()
+        self._in_flight = 0
+        self._executor: ThreadPoolExecutor | None = None
+
+    def register_stage(
+        self,
+        name: str,
+        func: StageFunc,
+        budget_ms: float = 5.0,
+        on_result: ResultCallback | None = None,
+    ):
+        with self._lock:
+            if name in self._stages:
+                raise ValueError(f"A processing stage named {name} already exists")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="frame-processing"
+                )
+            self._stages[name] = ProcessingStage(name, func, budget_ms / 1e3, on_result)
+
+    def unregister_stage(self, name: str):
+        with self._lock:
+            self._stages.pop(name)
+
+    def has_stages(self) -> bool:
+        return bool(self._stages)
+
+    def get_statistics(self) -> Dict[str, StageStatistics]:
+        with self._lock:
+            return {
+                name: StageStatistics(**vars(stage.stats))
+                for name, stage in self._stages.items()
+            }
+
+    def submit(self, frame: SharedBuffer, frame_number: int) -> bool:
+        with self._lock:
+            stages = [s for s in self._stages.values() if s.stats.enabled]
+            if self._in_flight >= self.max_in_flight:
+                for stage in stages:
+                    stage.stats.frames_skipped += 1
+                return False
+
+            ready = []
+            for stage in stages:
+                if stage.busy:
+                    stage.stats.frames_skipped += 1
+                else:
+                    stage.busy = True
+                    ready.append(stage)
+            if not ready:
+                return False
+            self._in_flight += 1
+
+        job = _FrameJob(self, frame.acquire(), frame_number, len(ready))
+        for stage in ready:
+            self._executor.submit(job.run, stage)
+        return True
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _run_stage(self, stage: ProcessingStage, view: np.ndarray, frame_number: int):
+        start = time.perf_counter()
+        try:
+            result = stage.func(view)
+        except Exception as e:
+            result = e
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            stats = stage.stats
+            stats.frames_processed += 1
+            stats.total_time_s += elapsed
+            stats.max_time_s = max(stats.max_time_s, elapsed)
+            stats.last_frame_number = frame_number
+            stats.last_result = result
+            if elapsed > stage.budget_s:
+                stats.budget_overruns += 1
+                stage.consecutive_overruns += 1
+                if stage.consecutive_overruns >= self.max_consecutive_overruns:
+                    stats.enabled = False
+            else:
+                stage.consecutive_overruns = 0
+            stage.busy = False
+
+        if stage.on_result is not None:
+            stage.on_result(stage.name, frame_number, result)
+
+    def _frame_done(self):
+        with self._lock:
+            self._in_flight -= 1
+
+
+class _FrameJob:
+    def __init__(
+        self,
+        processor: FrameProcessor,
+        frame: SharedBuffer,
+        frame_number: int,
+        stages: int,
+    ):
+        self.processor = processor
+        self.frame = frame
+        self.frame_number = frame_number
+        self._remaining = stages
+        self._lock = Lock()
+
+    def run(self, stage: ProcessingStage):
+        try:
+            self.processor._run_stage(stage, self.frame.numpy_view(), self.frame_number)
+        finally:
+            with self._lock:
+                self._remaining -= 1
+                done = self._remaining == 0
+            if done:
+                self.frame.release()
+                self.processor._frame_done()
+
+
+class RoiMeanIntensity:
+    """Mean intensity inside a rectangular region of interest."""
+
+    def __init__(self, x: int, y: int, width: int, height: int):
+        self.region = (slice(y, y + height), slice(x, x + width))
+
+    def __call__(self, frame: np.ndarray) -> float:
+        return float(frame[self.region].mean())
+
+
+class MotionEnergy:
+    """Mean absolute difference to the previous frame.
+
+    Works on every `subsample`-th pixel; the only state kept between frames
+    is that subsampled grid, never a full copy of the frame.
+    """
+
+    def __init__(self, subsample: int = 4):
+        self.subsample = subsample
+        self._previous: np.ndarray | None = None
+        self._difference: np.ndarray | None = None
+
+    def __call__(self, frame: np.ndarray) -> float:
+        current = frame[:: self.subsample, :: self.subsample]
+        if self._previous is None or self._previous.shape != current.shape:
+            self._previous = current.astype(np.int32)
+            self._difference = np.empty_like(self._previous)
+            return 0.0
+        np.subtract(current, self._previous, out=self._difference)
+        np.abs(self._difference, out=self._difference)
+        energy = float(self._difference.mean())
+        np.copyto(self._previous, current)
+        return energy
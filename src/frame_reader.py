@@ -0,0 +1,236 @@
+"""Random access to single frames of finished MP4 recordings.
+
+Using the recording's frame index (see frame_index), only the samples from
+the nearest keyframe before the requested frames up to the last of them are
+read and decoded, by piping them to a local ffmpeg process. Decoded frames
+are kept in a least-recently-used cache bounded in bytes, so that scrubbing
+through a recording decodes every group of pictures only once.
+"""
+
+import functools
+import os
+import struct
+import subprocess
+import zlib
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+from ffmpeg_writer import ffmpeg_available
+from frame_index import (
+    FrameIndex,
+    avc_to_annexb,
+    build_frame_index,
+    frame_index_filename,
+    read_frame_index,
+    write_frame_index,
+)
+
+# decoded frames kept by default, in bytes
+DEFAULT_CACHE_BYTES = 256 * 2**20
+# frame indexes kept in memory
+INDEX_CACHE_SIZE = 16
+
+
+class DecoderUnavailable(Exception):
+    pass
+
+
+class FrameCache:
+    """Decoded frames by (file, frame number), least recently used first out."""
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames: OrderedDict[tuple[str, int], np.ndarray] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: tuple[str, int]) -> np.ndarray | None:
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def put(self, key: tuple[str, int], frame: np.ndarray):
+        if frame.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._frames[key] = frame
+            self.nbytes += frame.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+
+def encode_png(frame: np.ndarray) -> bytes:
+    """PNG of a height x width x channels frame of 8 or 16 bit pixels."""
+    height, width, channels = frame.shape
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+    bit_depth = frame.dtype.itemsize * 8
+    # every row starts with filter type 0; PNG stores 16 bit pixels big endian
+    rows = frame.astype(frame.dtype.newbyteorder(">")).reshape(height, -1)
+    raw = np.zeros((height, rows.nbytes // height + 1), np.uint8)
+    raw[:, 1:] = rows.view(np.uint8).reshape(height, -1)
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        checksum = zlib.crc32(chunk_type + data)
+        return (
+            struct.pack(">I", len(data))
+            + chunk_type
+            + data
+            + struct.pack(">I", checksum)
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 1))
+        + chunk(b"IEND", b"")
+    )
+
+
+def load_frame_index(video_path: str) -> FrameIndex:
+    """The frame index of a video file, built and saved if it is missing or
+    older than the file."""
+    index_path = frame_index_filename(video_path)
+    video_mtime = os.stat(video_path).st_mtime_ns
+    try:
+        if os.stat(index_path).st_mtime_ns >= video_mtime:
+            return read_frame_index(index_path)
+    except (OSError, ValueError):
+        pass
+    index = build_frame_index(video_path)
+    write_frame_index(index_path, index)
+    return index
+
+
+@functools.lru_cache(maxsize=INDEX_CACHE_SIZE)
+def _cached_frame_index(video_path: str, mtime_ns: int) -> FrameIndex:
+    return load_frame_index(video_path)
+
+
+class RecordingFrames:
+    """The frames of a recording's video files, numbered across segments."""
+
+    def __init__(
+        self, paths: list[str], cache: FrameCache | None = None, ffmpeg="ffmpeg"
+    ):
+        self.paths = paths
+        self.cache = cache if cache is not None else FrameCache()
+        self.ffmpeg = ffmpeg
+        self.indexes = [
+            _cached_frame_index(path, os.stat(path).st_mtime_ns) for path in paths
+        ]
+        self._first = np.cumsum([0] + [index.frame_count for index in self.indexes])
+
+    @property
+    def frame_count(self) -> int:
+        return int(self._first[-1])
+
+    def locate(self, frame_number: int) -> tuple[int, int]:
+        """File and frame number within it of a frame of the recording."""
+        if not 0 <= frame_number < self.frame_count:
+            raise IndexError(f"Frame {frame_number} is not in the recording")
+        file = int(np.searchsorted(self._first, frame_number, side="right")) - 1
+        return file, frame_number - int(self._first[file])
+
+    def timestamp_ns(self, frame_number: int) -> int:
+        file, local = self.locate(frame_number)
+        return self.indexes[file].timestamp_ns(local)
+
+    def frames(self, first: int, count: int = 1) -> list[np.ndarray]:
+        """`count` frames from `first` on, as height x width x 3 RGB arrays."""
+        self.locate(first)
+        self.locate(first + count - 1)
+        frames = []
+        frame_number = first
+        while frame_number < first + count:
+            file, local = self.locate(frame_number)
+            frame = self.cache.get((self.paths[file], local))
+            if frame is not None:
+                frames.append(frame)
+                frame_number += 1
+                continue
+            # everything up to the end of the range or of the file
+            last = min(first + count, int(self._first[file + 1])) - 1
+            last_local = last - int(self._first[file])
+            decoded = self._decode(file, local, last_local)
+            for number in range(local, last_local + 1):
+                if number not in decoded:
+                    raise RuntimeError(
+                        f"Frame {number} of {self.paths[file]} was not decoded"
+                    )
+                frames.append(decoded[number])
+            frame_number = last + 1
+        return frames
+
+    def _decode(self, file: int, first: int, last: int) -> dict[int, np.ndarray]:
+        """Decode frames `first` to `last` of a file; returns all frames decoded
+        on the way, by frame number within the file."""
+        index = self.indexes[file]
+        if index.codec != b"avc1":
+            raise DecoderUnavailable(f"Cannot decode {index.codec.decode()} video")
+        if not ffmpeg_available(self.ffmpeg):
+            raise DecoderUnavailable("Decoding frames requires ffmpeg")
+        start, end = index.decode_span(first, last)
+        samples = index.samples[start : end + 1]
+        with open(self.paths[file], "rb") as video_file:
+            data = []
+            for offset, size in zip(samples["offset"], samples["size"]):
+                video_file.seek(int(offset))
+                data.append(video_file.read(int(size)))
+        result = subprocess.run(
+            [
+                self.ffmpeg,
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-f",
+                "h264",
+                "-i",
+                "pipe:0",
+                # one output frame per decoded frame, none dropped or repeated
+                "-vsync",
+                "passthrough",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                "rgb24",
+                "pipe:1",
+            ],
+            input=avc_to_annexb(index.extradata, data),
+            capture_output=True,
+        )
+        if result.returncode != 0:
+            errors = result.stderr.decode(errors="replace").strip()
+            raise RuntimeError(f"ffmpeg failed: {errors}")
+        frame_nbytes = index.width * index.height * 3
+        if len(result.stdout) != (end - start + 1) * frame_nbytes:
+            raise RuntimeError(
+                f"ffmpeg decoded {len(result.stdout) / frame_nbytes:g} frames "
+                f"of {end - start + 1}"
+            )
+        decoded = np.frombuffer(result.stdout, np.uint8)
+        decoded = decoded.reshape(-1, index.height, index.width, 3)
+        # the decoder returns the frames in presentation order
+        numbers = np.sort(index.ranks[start : end + 1])
+        frames = {}
+        for frame_number, frame in zip(numbers.tolist(), decoded):
+            # copied, so that cached frames do not keep all of ffmpeg's output
+            frames[frame_number] = frame.copy()
+            self.cache.put((self.paths[file], frame_number), frames[frame_number])
+        return frames
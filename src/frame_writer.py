@@ -0,0 +1,227 @@
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from threading import Condition, Lock, Thread
+from typing import Any, Callable
+
+
+class OverflowPolicy(Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    DROP_NEWEST = "drop-newest"
+
+
+@dataclass
+class WriterStatistics:
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    frames_written: int = 0
+    frames_dropped: int = 0
+    write_errors: int = 0
+
+
+class SharedBuffer:
+    """Reference-counted handle to a buffer used by several consumers.
+
+    The buffer goes back to its pool when the last holder calls `release`.
+    The creator holds the first reference; every additional consumer must
+    `acquire` before it hands the frame to another thread.
+    """
+
+    def __init__(
+        self, buffer, host_timestamp_ns: int = 0, received_perf_ns: int | None = None
+    ):
+        self.buffer = buffer
+        # host time at which the frame was taken from the sink
+        self.host_timestamp_ns = host_timestamp_ns
+        # the same moment by time.perf_counter_ns, for latencies
+        self.received_perf_ns = received_perf_ns
+        # whether the frame waited in the pre-roll before it was queued
+        self.preroll = False
+        self._references = 1
+        self._lock = Lock()
+        self._array = None
+
+    def acquire(self) -> "SharedBuffer":
+        with self._lock:
+            if self._references == 0:
+                raise RuntimeError("Buffer was already released")
+            self._references += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._references -= 1
+            last = self._references == 0
+        if last:
+            self._array = None
+            self.buffer.release()
+
+    def numpy_view(self):
+        """Read-only numpy view of the buffer, without copying the image."""
+        if self._array is None:
+            array = self.buffer.numpy_wrap().view()
+            array.flags.writeable = False
+            self._array = array
+        return self._array
+
+
+class FrameWriter:
+    """Writes frames on a dedicated thread, fed through a bounded ring.
+
+    The producer (usually the sink callback) only calls `put`, which never
+    waits on the encoder unless the overflow policy is BLOCK. Every frame that
+    is taken out of the ring, written or dropped, is handed to `release_func`
+    so the underlying buffer goes back to its pool.
+    """
+
+    def __init__(
+        self,
+        write_func: Callable[[Any], None],
+        release_func: Callable[[Any], None] | None = None,
+        depth: int = 16,
+        overflow_policy: OverflowPolicy = OverflowPolicy.BLOCK,
+        name: str = "frame-writer",
+    ):
+        if depth < 1:
+            raise ValueError("Queue depth must be at least 1")
+        self.write_func = write_func
+        self.release_func = release_func
+        self.depth = depth
+        self.overflow_policy = overflow_policy
+        self.name = name
+
+        self._queue: deque = deque()
+        self._cond = Condition()
+        self._thread: Thread | None = None
+        self._running = False
+        self._busy = False
+        # frames queued through prefill, which do not count against depth
+        self._backlog = 0
+        self._stats = WriterStatistics()
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._stats = WriterStatistics()
+        self._thread = Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, drain: bool = True):
+        with self._cond:
+            if not self._running:
+                return
+            if not drain:
+                while self._queue:
+                    self._drop(self._queue.popleft())
+                self._backlog = 0
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def put(self, frame) -> bool:
+        with self._cond:
+            if not self._running:
+                self._release(frame)
+                return False
+
+            if len(self._queue) - self._backlog >= self.depth:
+                if self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+                    self._drop(frame)
+                    return False
+                elif self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+                    self._drop(self._queue[self._backlog])
+                    del self._queue[self._backlog]
+                else:
+                    while (
+                        self._running and len(self._queue) - self._backlog >= self.depth
+                    ):
+                        self._cond.wait()
+                    if not self._running:
+                        self._release(frame)
+                        return False
+
+            self._queue.append(frame)
+            depth = len(self._queue)
+            if depth > self._stats.max_queue_depth:
+                self._stats.max_queue_depth = depth
+            self._cond.notify_all()
+            return True
+
+    def prefill(self, frames: list) -> int:
+        """Queue already buffered frames (e.g. a pre-roll) ahead of new ones.
+
+        Prefilled frames are never dropped and do not take up room in the
+        ring, because their buffers were allocated for the pre-roll and not
+        for the writer queue.
+        """
+        with self._cond:
+            if not self._running:
+                for frame in frames:
+                    self._release(frame)
+                return 0
+            self._queue.extend(frames)
+            self._backlog += len(frames)
+            self._cond.notify_all()
+            return len(frames)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until every queued frame has been written."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._queue and not self._busy, timeout=timeout
+            )
+
+    def get_statistics(self) -> WriterStatistics:
+        with self._cond:
+            return WriterStatistics(
+                queue_depth=len(self._queue),
+                max_queue_depth=self._stats.max_queue_depth,
+                frames_written=self._stats.frames_written,
+                frames_dropped=self._stats.frames_dropped,
+                write_errors=self._stats.write_errors,
+            )
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                frame = self._queue.popleft()
+                if self._backlog:
+                    self._backlog -= 1
+                self._busy = True
+                self._cond.notify_all()
+
+            try:
+                self.write_func(frame)
+                written = True
+            except Exception:
+                written = False
+            finally:
+                self._release(frame)
+
+            with self._cond:
+                if written:
+                    self._stats.frames_written += 1
+                else:
+                    self._stats.write_errors += 1
+                self._busy = False
+                self._cond.notify_all()
+
+    def _drop(self, frame):
+        self._stats.frames_dropped += 1
+        self._release(frame)
+
+    def _release(self, frame):
+        if self.release_func is not None:
+            self.release_func(frame)
@@ -1,6 +1,7 @@
+import argparse
+import sys
 from threading import Lock, Thread
 from imaging_source_recorder import ImagingSourceRecorder
-from fastapi_http_server import run_http_server
 from PySide6.QtCore import (
     QStandardPaths,
     QDir,
@@ -20,6 +21,8 @@ from PySide6.QtWidgets import (
     QToolBar,
 )
 import imagingcontrol4 as ic4
+from offload import Offloader, add_offload_arguments, offloader_from_args
+from recorder import RECORDINGS_DIR
 from resourceselector import ResourceSelector
 
 DEVICE_LOST_EVENT = QEvent.Type(QEvent.Type.User + 2)
@@ -45,11 +48,13 @@ class MainWindow(QMainWindow):
         self.device_file = appdata_directory + "/device.json"
         self.codec_config_file = appdata_directory + "/codecconfig.json"
 
-        self.recorder = ImagingSourceRecorder()
+        # render at most 30 fps so that the display does not compete with recording
+        self.recorder = ImagingSourceRecorder(preview_max_fps=30.0)
 
         self.recorder.grabber.event_add_device_lost(
             lambda g: QApplication.postEvent(self, QEvent(DEVICE_LOST_EVENT))
         )
+        self.recorder.grabber.event_add_device_lost(lambda g: publish_device_lost())
 
         self.property_dialog = None
 
@@ -207,7 +212,7 @@ class MainWindow(QMainWindow):
 
         self.update_statistics_timer = QTimer()
         self.update_statistics_timer.timeout.connect(self.onUpdateStatisticsTimer)
-        self.update_statistics_timer.start()
+        self.update_statistics_timer.start(500)
 
         # Add a timer to update the controls periodically
         self.update_timer = QTimer(self)
@@ -284,7 +289,8 @@ class MainWindow(QMainWindow):
 
         try:
             stats = self.recorder.grabber.stream_statistics
-            text = f"Frames Delivered: {stats.sink_delivered} Dropped: {stats.device_transmission_error}/{stats.device_underrun}/{stats.transform_underrun}/{stats.sink_underrun}"
+            writer_stats = self.recorder.get_writer_statistics()
+            text = f"Frames Delivered: {stats.sink_delivered} Dropped: {stats.device_transmission_error}/{stats.device_underrun}/{stats.transform_underrun}/{stats.sink_underrun}/{writer_stats.frames_dropped}"
             self.statistics_label.setText(text)
             tooltip = (
                 f"Frames Delivered: {stats.sink_delivered}"
@@ -293,9 +299,18 @@ class MainWindow(QMainWindow):
                 f"  Device Underrun: {stats.device_underrun}"
                 f"  Transform Underrun: {stats.transform_underrun}"
                 f"  Sink Underrun: {stats.sink_underrun}"
+                f"  Writer Dropped: {writer_stats.frames_dropped}"
+                f"  Writer Queue: {writer_stats.queue_depth}/{self.recorder.frame_writer.depth}"
             )
             self.statistics_label.setToolTip(tooltip)
-            self.fps_label.setText(f"FPS: {self.recorder.get_frames_per_second():.2f}")
+            fps_text = (
+                f"FPS: {self.recorder.metrics.frames.rate():.2f}"
+                f" (avg {self.recorder.get_frames_per_second():.2f})"
+            )
+            preview_stats = self.recorder.get_preview_statistics()
+            if preview_stats is not None:
+                fps_text += f" Preview CPU: {preview_stats.cpu_percent:.1f}%"
+            self.fps_label.setText(fps_text)
         except ic4.IC4Exception:
             pass
 
@@ -417,7 +432,42 @@ class MainWindow(QMainWindow):
         self.updateControls()
 
 
+def publish_device_lost():
+    from fastapi_http_server import default_camera_id, events
+
+    events.publish("device_lost", {"camera_id": default_camera_id})
+
+
+def serve_recorder(recorder: ImagingSourceRecorder, offloader: Offloader | None):
+    # the REST stack is imported by the server thread, so that it does not
+    # delay showing the window
+    from fastapi_http_server import run_http_server
+
+    run_http_server(
+        recorder.start_recording,
+        recorder.stop_recording,
+        offload=offloader,
+        status=recorder.get_status,
+        arm_func=recorder.arm,
+        fire_func=recorder.fire,
+        estimate_func=recorder.estimate_bytes_per_second,
+    )
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="imaging-source-recorder-gui",
+        description="Record from an Imaging Source camera",
+        allow_abbrev=False,
+    )
+    add_offload_arguments(parser)
+    # the others are Qt's
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
 def main_gui():
+    args = parse_args(sys.argv[1:])
     with ic4.Library.init_context():
         app = QApplication()
         app.setApplicationName("imaging-source-recorder")
@@ -427,17 +477,22 @@ def main_gui():
         main_window = MainWindow()
         main_window.show()
 
+        offloader = offloader_from_args(
+            args, RECORDINGS_DIR, is_busy=main_window.recorder.is_recording
+        )
+        if offloader is not None:
+            offloader.start()
+
         # Start the HTTP server in a separate thread
         http_thread = Thread(
-            target=run_http_server,
-            args=(
-                main_window.recorder.start_recording,
-                main_window.recorder.stop_recording,
-            ),
+            target=serve_recorder, args=(main_window.recorder, offloader)
         )
         http_thread.daemon = True
         http_thread.start()
         app.exec()
+        if offloader is not None:
+            offloader.stop()
+            offloader.queue.close()
 
 
 if __name__ == "__main__":
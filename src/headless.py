@@ -0,0 +1,134 @@
+"""Recorder service without a GUI.
+
+Opens the devices from saved state files, starts streaming without a display
+and serves the REST API with uvicorn in the main thread. Nothing here imports
+PySide6.
+"""
+
+import argparse
+import os
+import sys
+
+import imagingcontrol4 as ic4
+
+import fastapi_http_server
+from disk_admission import DEFAULT_RESERVE_BYTES, DiskAdmission
+from fastapi_http_server import run_http_server
+from imaging_source_recorder import ImagingSourceRecorder
+from offload import Offloader, add_offload_arguments, offloader_from_args
+from recorder import RECORDINGS_DIR
+from recorder_manager import RecorderManager, camera_id_from_state_file
+
+DEFAULT_DEVICE_FILE = os.path.join("default_config", "device.json")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="imaging-source-recorder",
+        description="Record from Imaging Source cameras, controlled via REST",
+    )
+    parser.add_argument(
+        "--device-state",
+        nargs="+",
+        default=[DEFAULT_DEVICE_FILE],
+        help="device state file(s) saved by the GUI; one per camera",
+    )
+    parser.add_argument("--codec-config", help="codec configuration file")
+    parser.add_argument(
+        "--recordings-dir",
+        default=RECORDINGS_DIR,
+        help="directory of the recordings; its index and queues are kept next to it",
+    )
+    parser.add_argument("--host", default=fastapi_http_server.HOST)
+    parser.add_argument("--port", type=int, default=fastapi_http_server.PORT)
+    parser.add_argument(
+        "--writer-queue-depth",
+        type=int,
+        default=16,
+        help="frames buffered between the camera and the encoder",
+    )
+    parser.add_argument(
+        "--disk-reserve-gb",
+        type=float,
+        default=DEFAULT_RESERVE_BYTES / 1e9,
+        help="free space recordings leave on the disk; they stop before using it",
+    )
+    add_offload_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def create_recorders(args: argparse.Namespace) -> RecorderManager:
+    def create_recorder() -> ImagingSourceRecorder:
+        recorder = ImagingSourceRecorder(
+            writer_queue_depth=args.writer_queue_depth,
+            recordings_dir=args.recordings_dir,
+        )
+        if args.codec_config:
+            recorder.video_writer.property_map.deserialize_from_file(args.codec_config)
+        return recorder
+
+    manager = RecorderManager(create_recorder)
+    manager.open_from_state_files(args.device_state)
+    for camera_id, recorder in manager.recorders.items():
+        recorder.grabber.event_add_device_lost(
+            lambda grabber, camera_id=camera_id: print(
+                f"Device {camera_id} lost", file=sys.stderr
+            )
+        )
+        recorder.grabber.event_add_device_lost(
+            lambda grabber, camera_id=camera_id: fastapi_http_server.events.publish(
+                "device_lost", {"camera_id": camera_id}
+            )
+        )
+    return manager
+
+
+def create_offloader(
+    args: argparse.Namespace, manager: RecorderManager
+) -> Offloader | None:
+    return offloader_from_args(
+        args,
+        args.recordings_dir,
+        is_busy=lambda: any(r.is_recording() for r in manager.recorders.values()),
+    )
+
+
+def main_headless(argv: list[str] | None = None):
+    args = parse_args(argv)
+    with ic4.Library.init_context():
+        manager = create_recorders(args)
+        offloader = create_offloader(args, manager)
+        try:
+            if offloader is not None:
+                offloader.start()
+            manager.start_streaming_all()
+            # the single-camera endpoints drive the first device
+            first_id = camera_id_from_state_file(args.device_state[0])
+            first = manager.get(first_id)
+            run_http_server(
+                first.start_recording,
+                first.stop_recording,
+                manager=manager if len(manager.recorders) > 1 else None,
+                default_camera_id=first_id,
+                host=args.host,
+                port=args.port,
+                offload=offloader,
+                status=first.get_status,
+                arm_func=first.arm,
+                fire_func=first.fire,
+                estimate_func=first.estimate_bytes_per_second,
+                disk_admission=DiskAdmission(
+                    args.recordings_dir,
+                    reserve_bytes=int(args.disk_reserve_gb * 1e9),
+                ),
+                recordings_dir=args.recordings_dir,
+            )
+        finally:
+            if offloader is not None:
+                offloader.stop()
+                offloader.queue.close()
+            manager.close()
+
+
+if __name__ == "__main__":
+    main_headless()
@@ -1,8 +1,34 @@
+import functools
 import time
+from threading import Lock
 import imagingcontrol4 as ic4
-from recorder import VideoRecorderInterface, RECORDINGS_DIR
+from disk_admission import estimate_bytes_per_second
+from ffmpeg_writer import FfmpegVideoWriter, ffmpeg_filename
+from frame_accounting import MAX_PLACEHOLDER_RUN, FrameAccounting
+from frame_log import FrameLog, FRAME_LOG_SUFFIX
+from frame_processing import FrameProcessor, ResultCallback, StageFunc, StageStatistics
+from frame_writer import FrameWriter, OverflowPolicy, SharedBuffer, WriterStatistics
+from metrics import DROP_REASONS, PeriodicSampler, RecorderMetrics, RecorderStatus
+from preroll import PrerollBuffer
+from preview import PreviewRenderer, PreviewStatistics
+from raw_recording import RawRecordingFull, RawVideoWriter, frame_nbytes, raw_filename
+from segmented_recording import SegmentedVideoWriter
+from recorder import (
+    EncoderEngine,
+    EncoderStatistics,
+    FireStatistics,
+    VideoRecorderInterface,
+    RecorderSettings,
+    RecordingMode,
+    RECORDINGS_DIR,
+)
 import os
 
+# capacity of a raw recording if the settings do not specify one
+DEFAULT_RAW_DURATION_S = 60.0
+# interval at which the drop counters are sampled for drops_per_second
+DROP_SAMPLE_INTERVAL_S = 0.5
+
 
 class ImagingSourceRecorder(VideoRecorderInterface):
     # interface methods
@@ -16,8 +42,14 @@ class ImagingSourceRecorder(VideoRecorderInterface):
             return
 
         if not self.grabber.is_streaming:
+            if self.preview is not None and display is not None:
+                # frames reach the display through the throttled preview instead
+                self.preview.start(display)
+                display = None
+            self.metrics.frames.reset()
             self.grabber.stream_setup(self.sink, display)
             self.stream_start_time = time.perf_counter_ns()
+            self._drop_sampler.start()
 
     def enable_triggered_recording_mode(self, enable: bool = True):
         self.grabber.device_property_map.try_set_value(
@@ -25,6 +57,12 @@ class ImagingSourceRecorder(VideoRecorderInterface):
             enable,
         )
 
+    def _try_get_frame_rate(self) -> float | None:
+        try:
+            return self.get_frame_rate()
+        except ic4.IC4Exception:
+            return None
+
     def get_triggered_record_mode(self) -> bool:
         return self.grabber.device_property_map.get_value_bool(ic4.PropId.TRIGGER_MODE)
 
@@ -39,43 +77,173 @@ class ImagingSourceRecorder(VideoRecorderInterface):
             return ""
         return self.filename
 
-    def __init__(self):
+    def __init__(
+        self,
+        writer_queue_depth: int = 16,
+        writer_overflow_policy: OverflowPolicy = OverflowPolicy.DROP_NEWEST,
+        processing_workers: int = 2,
+        processing_max_in_flight: int = 2,
+        preroll_seconds: float | None = None,
+        preroll_max_mb: float | None = None,
+        preview_max_fps: float | None = None,
+        preview_subsample: int = 1,
+        recordings_dir: str = RECORDINGS_DIR,
+    ):
+        # relative file names of recordings are placed here
+        self.recordings_dir = recordings_dir
         self.capture_to_video = False
         self.video_capture_pause = False
-        self.video_writer = ic4.VideoWriter(ic4.VideoWriterType.MP4_H264)
+        self.video_writer = self._create_video_writer()
+        # the writer of the current recording, either video_writer or a raw writer
+        self.active_writer = self.video_writer
+        self.frame_log: FrameLog | None = None
         self.stream_start_time = 0
+        self.metrics = RecorderMetrics()
+        # drops are sampled on a fixed cadence while streaming, not when read
+        self._drop_sampler = PeriodicSampler(self._sample_drops, DROP_SAMPLE_INTERVAL_S)
+        self.frame_accounting = FrameAccounting()
+        # set by arm, cleared when capturing starts
+        self.armed = False
+        # pending scheduled fire: (host time in ns, device frame number)
+        self._fire_at: tuple[int | None, int | None] | None = None
+        self.fire_statistics = FireStatistics()
+        self.encoder_statistics = EncoderStatistics()
+        self._frame_nbytes = 0
+        self.fill_gaps = False
+        # set once a raw recording has no room left; capturing into it stops
+        # until the recording is stopped
+        self.recording_full = False
+        self._trigger_missed_subscribed = False
+
+        # Encoding runs on its own thread so that encoder stalls fill the ring
+        # instead of starving the sink of buffers. By default a full ring drops
+        # the new frame, so the sink callback never waits on the encoder; the
+        # drops show up in the writer statistics and as missing frames.
+        self.frame_writer = FrameWriter(
+            write_func=self._write_frame,
+            release_func=lambda frame: frame.release(),
+            depth=writer_queue_depth,
+            overflow_policy=writer_overflow_policy,
+        )
+        self.frame_processor = FrameProcessor(
+            max_workers=processing_workers, max_in_flight=processing_max_in_flight
+        )
+
+        # Recent frames kept while not recording, written first when a recording starts
+        self.preroll: PrerollBuffer | None = None
+        if preroll_seconds is not None or preroll_max_mb is not None:
+            self.preroll = PrerollBuffer(
+                max_seconds=preroll_seconds,
+                max_bytes=int(preroll_max_mb * 1e6) if preroll_max_mb else None,
+            )
+        self.preroll_frames_written = 0
+        # Without a preview the display renders every frame inside the grabber
+        self.preview: PreviewRenderer | None = None
+        if preview_max_fps is not None:
+            self.preview = PreviewRenderer(preview_max_fps, preview_subsample)
+        # host time (time.time_ns) at which the current recording started capturing
+        self.recording_started_ns: int | None = None
+        # Guards the hand-over from pre-roll to recording in start_recording
+        self._capture_lock = Lock()
 
         class Listener(ic4.QueueSinkListener):
             def sink_connected(
-                self,
+                listener,
                 sink: ic4.QueueSink,
                 image_type: ic4.ImageType,
                 min_buffers_required: int,
             ) -> bool:
                 # Allocate more buffers than suggested, because we temporarily take some buffers
-                # out of circulation when saving an image or video files.
-                sink.alloc_and_queue_buffers(min_buffers_required + 2)
+                # out of circulation when saving an image or video files. Every slot of the
+                # writer queue can hold on to a buffer while it waits for the encoder, and
+                # processing stages can hold on to a few more. The pre-roll keeps its own
+                # set of buffers, and so does the preview.
+                preroll_frames = 0
+                if self.preroll is not None:
+                    preroll_frames = self.preroll.configure(
+                        frame_nbytes(image_type), self._try_get_frame_rate()
+                    )
+                sink.alloc_and_queue_buffers(
+                    min_buffers_required
+                    + self.frame_writer.depth
+                    + self.frame_processor.max_in_flight
+                    + preroll_frames
+                    + (PreviewRenderer.MAX_BUFFERS if self.preview is not None else 0)
+                    + 2
+                )
                 return True
 
-            def sink_disconnected(self, sink: ic4.QueueSink):
-                pass
+            def sink_disconnected(listener, sink: ic4.QueueSink):
+                if self.preroll is not None:
+                    self.preroll.clear()
 
             def frames_queued(listener, sink: ic4.QueueSink):
+                started = time.perf_counter_ns()
                 buf = sink.pop_output_buffer()
+                popped = time.perf_counter_ns()
+                received_ns = time.time_ns()
 
                 # Connect the buffer's chunk data to the device's property map
                 # This allows for properties backed by chunk data to be updated
                 self.grabber.device_property_map.connect_chunkdata(buf)
-
-                if self.capture_to_video and not self.video_capture_pause:
-                    try:
-                        self.video_writer.add_frame(buf)
-                    except ic4.IC4Exception as ex:
-                        pass
-
-        self.grabber = ic4.Grabber()
-
-        self.sink = ic4.QueueSink(Listener())
+                stages = self.metrics.stages
+                stages["sink_pop"].observe_ns(popped - started)
+                stages["chunkdata"].observe_ns(time.perf_counter_ns() - popped)
+                self.metrics.frames.add()
+
+                frame = SharedBuffer(buf, received_ns, popped)
+                if self.frame_processor.has_stages():
+                    self.frame_processor.submit(
+                        frame, buf.meta_data.device_frame_number
+                    )
+                if self.preview is not None and self.preview.is_running():
+                    self.preview.offer(frame)
+                with self._capture_lock:
+                    if self._fire_at is not None and self._fire_due(
+                        received_ns, buf.meta_data.device_frame_number
+                    ):
+                        self._start_capture()
+                    if self.capture_to_video:
+                        if self.fire_statistics.first_frame_ns is None:
+                            self._first_frame(received_ns)
+                        if not self.video_capture_pause and not self.recording_full:
+                            self.frame_writer.put(frame.acquire())
+                    elif self.preroll is not None:
+                        self.preroll.push(frame.acquire())
+                frame.release()
+
+        self.grabber = self._create_grabber()
+
+        self.sink = self._create_sink(Listener())
+
+    # Factories for the ic4 objects, overridden by the simulated recorder
+    def _create_grabber(self) -> ic4.Grabber:
+        return ic4.Grabber()
+
+    def _create_sink(self, listener: ic4.QueueSinkListener) -> ic4.QueueSink:
+        return ic4.QueueSink(listener)
+
+    def _create_video_writer(self) -> ic4.VideoWriter:
+        return ic4.VideoWriter(ic4.VideoWriterType.MP4_H264)
+
+    def _create_segment_writer(self) -> ic4.VideoWriter:
+        # every segment is encoded with the codec settings of video_writer
+        writer = self._create_video_writer()
+        writer.property_map.deserialize(self.video_writer.property_map.serialize())
+        return writer
+
+    def _subscribe_trigger_missed(self):
+        # not every camera reports missed triggers; they then go uncounted
+        props = self.grabber.device_property_map
+        try:
+            props.set_value(ic4.PropId.EVENT_SELECTOR, "FrameTriggerMissed")
+            props.set_value(ic4.PropId.EVENT_NOTIFICATION, "On")
+            props.find(ic4.PropId.EVENT_FRAME_TRIGGER_MISSED).event_add_notification(
+                lambda prop: self.frame_accounting.trigger_missed()
+            )
+        except ic4.IC4Exception:
+            return
+        self._trigger_missed_subscribed = True
 
     def load_state_from_file(self, filename: str):
         self.grabber.device_open_from_state_file(filename)
@@ -86,9 +254,24 @@ class ImagingSourceRecorder(VideoRecorderInterface):
         if not self.grabber.is_device_valid:
             self.capture_to_video = False
             return
+        self.arm(file_name, frame_rate, triggered_mode, settings)
+        self.fire()
+
+    def arm(self, file_name, frame_rate=None, triggered_mode=False, settings=None):
+        """Prepare a recording (device, file, encoder) without capturing yet.
 
+        `fire` then only has to flip the capture flag.
+        """
+        if not self.grabber.is_device_valid:
+            raise ic4.IC4Exception(ic4.ErrorCode.DeviceInvalid, "No device opened")
+        if settings and settings.mode == RecordingMode.RAW and settings.fill_gaps:
+            # the index of a raw file has the frame numbers, gaps included
+            raise ValueError("Raw recordings cannot fill gaps")
+        armed_at = time.perf_counter_ns()
         try:
             self.enable_triggered_recording_mode(triggered_mode)
+            if triggered_mode and not self._trigger_missed_subscribed:
+                self._subscribe_trigger_missed()
 
             if not self.is_streaming():
                 self.start_streaming()
@@ -98,23 +281,250 @@ class ImagingSourceRecorder(VideoRecorderInterface):
                     ic4.PropId.ACQUISITION_FRAME_RATE
                 )
 
-            self.video_writer.begin_file(
-                path=os.path.join(RECORDINGS_DIR, file_name),
-                image_type=self.sink.output_image_type,
+            if settings is None:
+                settings = RecorderSettings()
+
+            image_type = self.sink.output_image_type
+            engine = settings.encoder.value
+            if settings.mode == RecordingMode.RAW:
+                engine = RecordingMode.RAW.value
+            self.encoder_statistics = EncoderStatistics(engine)
+            if settings.mode == RecordingMode.RAW and settings.is_segmented():
+                file_name = raw_filename(file_name)
+                capacity = self._raw_segment_capacity(settings, frame_rate, image_type)
+                self.active_writer = SegmentedVideoWriter(
+                    lambda: RawVideoWriter(capacity),
+                    max_frames=capacity,
+                    max_seconds=settings.segment_seconds,
+                )
+            elif settings.mode == RecordingMode.RAW:
+                file_name = raw_filename(file_name)
+                self.active_writer = RawVideoWriter(
+                    self._raw_capacity(settings, frame_rate)
+                )
+            elif settings.encoder == EncoderEngine.FFMPEG:
+                file_name = ffmpeg_filename(file_name, settings.codec)
+                create_writer = functools.partial(
+                    FfmpegVideoWriter,
+                    settings.codec,
+                    settings.preset,
+                    settings.threads,
+                    self.encoder_statistics,
+                )
+                if settings.is_segmented():
+                    self.active_writer = SegmentedVideoWriter(
+                        create_writer,
+                        max_frames=settings.segment_frames,
+                        max_seconds=settings.segment_seconds,
+                        max_bytes=settings.segment_bytes,
+                    )
+                else:
+                    self.active_writer = create_writer()
+            elif settings.is_segmented():
+                self.active_writer = SegmentedVideoWriter(
+                    self._create_segment_writer,
+                    max_frames=settings.segment_frames,
+                    max_seconds=settings.segment_seconds,
+                    max_bytes=settings.segment_bytes,
+                )
+            else:
+                self.active_writer = self.video_writer
+
+            path = os.path.join(self.recordings_dir, file_name)
+            self.active_writer.begin_file(
+                path=path,
+                image_type=image_type,
                 frame_rate=frame_rate,
             )
-            self.capture_to_video = True
-
+            self.frame_log = FrameLog(os.path.splitext(path)[0] + FRAME_LOG_SUFFIX)
+            self._frame_nbytes = frame_nbytes(image_type)
+            self.frame_accounting.reset()
+            self.fill_gaps = settings.fill_gaps
+            self.recording_full = False
+            self.frame_writer.start()
             self.filename = file_name
         except ic4.IC4Exception as ex:
             self.capture_to_video = False
             raise ex
+        self.fire_statistics = FireStatistics(
+            arm_duration_ms=(time.perf_counter_ns() - armed_at) / 1e6
+        )
+        self.armed = True
+
+    def fire(self, at_ns: int | None = None, at_frame: int | None = None):
+        """Start capturing into the armed recording.
+
+        Without arguments capturing starts with the next frame. Otherwise it
+        starts with the first frame received at or after host time `at_ns`
+        (time.time_ns), or the first frame whose device frame number is at
+        least `at_frame`.
+        """
+        with self._capture_lock:
+            if not self.armed:
+                raise RuntimeError("No recording is armed")
+            self.fire_statistics.fired_ns = time.time_ns()
+            self.fire_statistics.scheduled_ns = at_ns
+            if at_ns is None and at_frame is None:
+                self._start_capture()
+            else:
+                self._fire_at = (at_ns, at_frame)
+
+    def estimate_bytes_per_second(
+        self, frame_rate: float | None = None, settings: RecorderSettings | None = None
+    ) -> float:
+        """Upper estimate of the data rate of a recording with these arguments.
+
+        Taken from the device's image type and frame rate; the stream is not
+        started for it.
+        """
+        if not self.grabber.is_device_valid:
+            return 0.0
+        if frame_rate is None:
+            frame_rate = self.get_frame_rate()
+        return estimate_bytes_per_second(
+            frame_nbytes(self._configured_image_type()), frame_rate, settings
+        )
+
+    def _configured_image_type(self) -> ic4.ImageType:
+        if self.is_streaming():
+            return self.sink.output_image_type
+        # the sink takes frames in the device's pixel format, unconverted
+        props = self.grabber.device_property_map
+        pixel_format = props.get_value_str(ic4.PropId.PIXEL_FORMAT)
+        return ic4.ImageType(
+            ic4.PixelFormat.__members__.get(pixel_format, ic4.PixelFormat.Unspecified),
+            props.get_value_int(ic4.PropId.WIDTH),
+            props.get_value_int(ic4.PropId.HEIGHT),
+        )
+
+    def is_armed(self) -> bool:
+        return self.armed
+
+    def _fire_due(self, received_ns: int, frame_number: int) -> bool:
+        at_ns, at_frame = self._fire_at
+        if at_ns is not None and received_ns < at_ns:
+            return False
+        return at_frame is None or frame_number >= at_frame
+
+    def _start_capture(self):
+        # called with the capture lock held
+        self.preroll_frames_written = 0
+        if self.preroll is not None:
+            frames = self.preroll.drain()
+            for frame in frames:
+                frame.preroll = True
+            self.preroll_frames_written = self.frame_writer.prefill(frames)
+        self.capture_to_video = True
+        self.recording_started_ns = time.time_ns()
+        self.armed = False
+        self._fire_at = None
+
+    def _first_frame(self, received_ns: int):
+        statistics = self.fire_statistics
+        statistics.first_frame_ns = received_ns
+        started = max(statistics.fired_ns, statistics.scheduled_ns or 0)
+        statistics.first_frame_latency_ms = (received_ns - started) / 1e6
 
     def stop_recording(self):
-        self.capture_to_video = False
-        self.video_writer.finish_file()
+        with self._capture_lock:
+            self.capture_to_video = False
+            self.armed = False
+            self._fire_at = None
+        self.frame_writer.stop(drain=True)
+        self.active_writer.finish_file()
+        if self.frame_log is not None:
+            self.frame_log.close()
+            self.frame_log = None
+
+    def _write_frame(self, frame: SharedBuffer):
+        stages = self.metrics.stages
+        # pre-roll frames waited in the pre-roll on purpose
+        if frame.received_perf_ns is not None and not frame.preroll:
+            stages["writer_queue"].observe_ns(
+                time.perf_counter_ns() - frame.received_perf_ns
+            )
+        meta_data = frame.buffer.meta_data
+        missing = self.frame_accounting.frame(meta_data.device_frame_number)
+        if self.fill_gaps and 0 < missing <= MAX_PLACEHOLDER_RUN:
+            self._write_placeholders(frame, missing)
+        self._add_frame(frame.buffer)
+        # logged after the write, so record i of the log describes frame i of the file
+        self.frame_log.append(
+            meta_data.device_frame_number,
+            meta_data.device_timestamp_ns,
+            frame.host_timestamp_ns,
+        )
+
+    def _add_frame(self, buffer: ic4.ImageBuffer):
+        started = time.perf_counter_ns()
+        cpu_started = time.thread_time_ns()
+        try:
+            self.active_writer.add_frame(buffer)
+        except RawRecordingFull:
+            self.recording_full = True
+            raise
+        finished = time.perf_counter_ns()
+        self.metrics.stages["write"].observe_ns(finished - started)
+        self._account_encoded(started, finished, time.thread_time_ns() - cpu_started)
+
+    def _account_encoded(self, started_ns: int, finished_ns: int, cpu_ns: int):
+        statistics = self.encoder_statistics
+        if statistics.first_write_ns is None:
+            statistics.first_write_ns = started_ns
+        statistics.frames += 1
+        statistics.bytes += self._frame_nbytes
+        statistics.encode_s += (finished_ns - started_ns) / 1e9
+        statistics.encode_cpu_s += cpu_ns / 1e9
+        statistics.elapsed_s = (finished_ns - statistics.first_write_ns) / 1e9
+
+    def _write_placeholders(self, frame: SharedBuffer, missing: int):
+        first_missing = frame.buffer.meta_data.device_frame_number - missing
+        for frame_number in range(first_missing, first_missing + missing):
+            self._add_frame(frame.buffer)
+            self.frame_log.append(frame_number, 0, 0)
+        self.frame_accounting.statistics.placeholder_frames += missing
+
+    @staticmethod
+    def _raw_capacity(settings: RecorderSettings, frame_rate: float) -> int:
+        if settings.max_frames is not None:
+            return settings.max_frames
+        max_duration_s = settings.max_duration_s or DEFAULT_RAW_DURATION_S
+        return int(max_duration_s * frame_rate) + 1
+
+    @staticmethod
+    def _raw_segment_capacity(
+        settings: RecorderSettings, frame_rate: float, image_type: ic4.ImageType
+    ) -> int:
+        # raw segment files are preallocated, so every limit becomes a frame count
+        limits = []
+        if settings.segment_frames is not None:
+            limits.append(settings.segment_frames)
+        if settings.segment_seconds is not None:
+            limits.append(int(settings.segment_seconds * frame_rate) + 1)
+        if settings.segment_bytes is not None:
+            limits.append(max(settings.segment_bytes // frame_nbytes(image_type), 1))
+        return min(limits)
+
+    def register_processing_stage(
+        self,
+        name: str,
+        func: StageFunc,
+        budget_ms: float = 5.0,
+        on_result: ResultCallback | None = None,
+    ):
+        self.frame_processor.register_stage(name, func, budget_ms, on_result)
+
+    def unregister_processing_stage(self, name: str):
+        self.frame_processor.unregister_stage(name)
+
+    def get_processing_statistics(self) -> dict[str, StageStatistics]:
+        return self.frame_processor.get_statistics()
 
     def stop_streaming(self):
+        # also after the device was lost, which leaves the preview running
+        if self.preview is not None:
+            self.preview.stop()
+        self._drop_sampler.stop()
         if not self.grabber.is_device_valid:
             return
 
@@ -124,7 +534,7 @@ class ImagingSourceRecorder(VideoRecorderInterface):
     def toggle_streaming(self, display: ic4.Display | None = None):
         if self.grabber.is_device_valid:
             if self.grabber.is_streaming:
-                self.grabber.stream_stop()
+                self.stop_streaming()
             else:
                 self.start_streaming(display)
 
@@ -134,6 +544,14 @@ class ImagingSourceRecorder(VideoRecorderInterface):
     def get_number_of_written_frames(self) -> int:
         return self.grabber.stream_statistics.sink_delivered
 
+    def get_writer_statistics(self) -> WriterStatistics:
+        return self.frame_writer.get_statistics()
+
+    def get_preview_statistics(self) -> PreviewStatistics | None:
+        if self.preview is None:
+            return None
+        return self.preview.get_statistics()
+
     def get_frames_per_second(self):
         return (
             self.grabber.stream_statistics.sink_delivered
@@ -141,5 +559,58 @@ class ImagingSourceRecorder(VideoRecorderInterface):
             * 1e9
         )
 
+    def _frames_dropped(self) -> dict[str, int]:
+        stats = self.grabber.stream_statistics
+        return dict(
+            zip(
+                DROP_REASONS,
+                (
+                    stats.device_transmission_error,
+                    stats.device_underrun,
+                    stats.transform_underrun,
+                    stats.sink_underrun,
+                    self.get_writer_statistics().frames_dropped,
+                ),
+            )
+        )
+
+    def _sample_drops(self):
+        try:
+            if self.grabber.is_device_valid and self.is_streaming():
+                self.metrics.drops.sample(sum(self._frames_dropped().values()))
+        except ic4.IC4Exception:
+            # the device was lost; sampled again once it streams
+            pass
+
+    def get_status(self) -> RecorderStatus:
+        status = RecorderStatus(
+            streaming=self.is_streaming(), recording=self.is_recording()
+        )
+        if self.grabber.is_device_valid and self.is_streaming():
+            status.frames_delivered = self.grabber.stream_statistics.sink_delivered
+            status.frames_dropped = self._frames_dropped()
+            status.writer_queue_depth = self.get_writer_statistics().queue_depth
+            status.frames_per_second = self.metrics.frames.rate()
+            status.average_frames_per_second = self.get_frames_per_second()
+            status.drops_per_second = self.metrics.drops.rate()
+        status.frames_written = self.get_writer_statistics().frames_written
+        status.armed = self.armed
+        status.recording_full = self.recording_full
+        status.arm_duration_ms = self.fire_statistics.arm_duration_ms
+        status.first_frame_latency_ms = self.fire_statistics.first_frame_latency_ms
+        encoder = self.encoder_statistics
+        status.encoder = encoder.engine
+        status.encoder_frames_per_second = encoder.frames_per_second
+        status.encoder_cpu_percent = encoder.cpu_percent
+        accounting = self.frame_accounting.statistics
+        status.frames_missing = accounting.frames_missing
+        status.missed_triggers = accounting.missed_triggers
+        status.placeholder_frames = accounting.placeholder_frames
+        status.stages = {
+            stage: histogram.snapshot()
+            for stage, histogram in self.metrics.stages.items()
+        }
+        return status
+
     def __del__(self):
         self.grabber.device_close()
@@ -0,0 +1,177 @@
+"""Coalesced, asynchronous writes of recording metadata sidecars.
+
+Metadata is written to `{recording}.metadata.json` through a temporary file
+that replaces the old one, so readers never see a partial file. Events are
+appended to `{recording}.events.jsonl`, one JSON object per line. Updates
+arriving within `flush_interval_s` of each other are written together.
+Failed writes are logged and retried; updates that still could not be
+written stay pending until the next update or flush of their recording.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+
+import aiofiles
+import aiofiles.os
+
+METADATA_SUFFIX = ".metadata.json"
+EVENTS_SUFFIX = ".events.jsonl"
+
+logger = logging.getLogger(__name__)
+
+
+async def write_json_atomic(path: str, data):
+    temp_path = f"{path}.tmp"
+    async with aiofiles.open(temp_path, "w") as temp_file:
+        await temp_file.write(json.dumps(data))
+    await aiofiles.os.replace(temp_path, path)
+
+
+async def append_json_lines(path: str, items: list):
+    # a single write, so a batch is never interleaved with another one
+    async with aiofiles.open(path, "a") as lines_file:
+        await lines_file.write("".join(json.dumps(item) + "\n" for item in items))
+
+
+class _Pending:
+    def __init__(self):
+        # newest metadata to write, replacing the file's content
+        self.metadata: dict | None = None
+        self.events: list = []
+        self.flush_now = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        # of the last write, if it failed
+        self.error: Exception | None = None
+
+    def has_updates(self) -> bool:
+        return self.metadata is not None or bool(self.events)
+
+
+class MetadataWriter:
+    """Writes the metadata and events of recordings on the event loop.
+
+    All methods must be called from the same event loop.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        flush_interval_s: float = 0.5,
+        max_attempts: int = 3,
+        retry_interval_s: float = 1.0,
+    ):
+        self.directory = directory
+        self.flush_interval_s = flush_interval_s
+        self.max_attempts = max_attempts
+        self.retry_interval_s = retry_interval_s
+        self._pending: dict[str, _Pending] = {}
+
+    def metadata_path(self, recording_id: str) -> str:
+        return os.path.join(self.directory, recording_id + METADATA_SUFFIX)
+
+    def events_path(self, recording_id: str) -> str:
+        return os.path.join(self.directory, recording_id + EVENTS_SUFFIX)
+
+    def update(
+        self, recording_id: str, metadata: dict | None = None, events: list = ()
+    ):
+        """Queue the full `metadata` and/or `events` to append for writing."""
+        pending = self._pending.get(recording_id)
+        if pending is None:
+            pending = self._pending[recording_id] = _Pending()
+        if metadata is not None:
+            pending.metadata = dict(metadata)
+        pending.events.extend(events)
+        self._start(recording_id, pending)
+
+    async def write(self, recording_id: str, metadata: dict):
+        """Write `metadata` now, e.g. before a recording starts.
+
+        Raises the error of the write if it failed.
+        """
+        self.update(recording_id, metadata)
+        if not await self.flush(recording_id):
+            raise self._pending[recording_id].error
+
+    async def flush(self, recording_id: str | None = None) -> bool:
+        """Write pending updates of one or all recordings now and wait for them.
+
+        Returns whether everything was written; updates that failed stay pending.
+        """
+        ids = list(self._pending) if recording_id is None else [recording_id]
+        written = True
+        for pending_id in ids:
+            pending = self._pending.get(pending_id)
+            if pending is None:
+                continue
+            self._start(pending_id, pending)
+            pending.flush_now.set()
+            await asyncio.shield(pending.task)
+            written = written and not self.has_pending(pending_id)
+        return written
+
+    def write_blocking(self, recording_id: str, metadata: dict):
+        """Write `metadata` now from a thread other than the event loop's."""
+        path = self.metadata_path(recording_id)
+        with open(f"{path}.tmp", "w") as temp_file:
+            json.dump(metadata, temp_file)
+        os.replace(f"{path}.tmp", path)
+
+    def has_pending(self, recording_id: str) -> bool:
+        return recording_id in self._pending
+
+    def _start(self, recording_id: str, pending: _Pending):
+        if pending.task is None:
+            pending.task = asyncio.get_running_loop().create_task(
+                self._run(recording_id, pending)
+            )
+
+    async def _run(self, recording_id: str, pending: _Pending):
+        failures = 0
+        try:
+            while pending.has_updates():
+                if failures:
+                    await asyncio.sleep(self.retry_interval_s)
+                else:
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(
+                            pending.flush_now.wait(), self.flush_interval_s
+                        )
+                pending.flush_now.clear()
+                metadata, pending.metadata = pending.metadata, None
+                events, pending.events = pending.events, []
+                try:
+                    if metadata is not None:
+                        await write_json_atomic(
+                            self.metadata_path(recording_id), metadata
+                        )
+                    if events:
+                        await append_json_lines(self.events_path(recording_id), events)
+                except Exception as e:
+                    # put back for the next attempt, behind newer metadata and
+                    # ahead of newer events
+                    if pending.metadata is None:
+                        pending.metadata = metadata
+                    pending.events[:0] = events
+                    pending.error = e
+                    failures += 1
+                    logger.error(
+                        "Writing the metadata of %s failed (attempt %d of %d): %s",
+                        recording_id,
+                        failures,
+                        self.max_attempts,
+                        e,
+                    )
+                    if failures >= self.max_attempts:
+                        return
+                    continue
+                failures = 0
+                pending.error = None
+        finally:
+            pending.task = None
+            # failed updates stay until the next update or flush retries them
+            if not pending.has_updates():
+                del self._pending[recording_id]
@@ -0,0 +1,380 @@
+"""Low-overhead instrumentation of the record path.
+
+Every histogram and rate is updated by a single thread (the sink callback,
+the writer thread or a sampler) without locking; readers take approximate snapshots,
+which is good enough for monitoring.
+"""
+
+import math
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from typing import Callable
+
+# upper bounds of the latency buckets, from 10 µs to 1 s
+LATENCY_BOUNDS_S = (
+    1e-5,
+    2.5e-5,
+    5e-5,
+    1e-4,
+    2.5e-4,
+    5e-4,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    1e-2,
+    2.5e-2,
+    5e-2,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+# stages of the record path, in the order a frame passes them
+STAGES = ("sink_pop", "chunkdata", "writer_queue", "write")
+
+DROP_REASONS = (
+    "device_transmission_error",
+    "device_underrun",
+    "transform_underrun",
+    "sink_underrun",
+    "writer",
+)
+
+
+@dataclass
+class HistogramSnapshot:
+    bounds_s: tuple[float, ...]
+    # observations per bucket; the last bucket holds everything above bounds_s
+    counts: list[int]
+    count: int
+    sum_s: float
+    max_s: float
+
+    def quantile(self, q: float) -> float:
+        """Estimate of the q-quantile, interpolated within its bucket."""
+        if self.count == 0:
+            return math.nan
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                lower = self.bounds_s[i - 1] if i > 0 else 0.0
+                upper = self.bounds_s[i] if i < len(self.bounds_s) else self.max_s
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max_s
+
+    @property
+    def mean_s(self) -> float:
+        return self.sum_s / self.count if self.count else math.nan
+
+
+class LatencyHistogram:
+    def __init__(self, bounds_s: tuple[float, ...] = LATENCY_BOUNDS_S):
+        self.bounds_s = bounds_s
+        self._bounds_ns = [int(bound * 1e9) for bound in bounds_s]
+        self._counts = [0] * (len(bounds_s) + 1)
+        self._count = 0
+        self._sum_ns = 0
+        self._max_ns = 0
+
+    def observe_ns(self, duration_ns: int):
+        self._counts[bisect_left(self._bounds_ns, duration_ns)] += 1
+        self._count += 1
+        self._sum_ns += duration_ns
+        if duration_ns > self._max_ns:
+            self._max_ns = duration_ns
+
+    def snapshot(self) -> HistogramSnapshot:
+        return HistogramSnapshot(
+            self.bounds_s,
+            list(self._counts),
+            self._count,
+            self._sum_ns / 1e9,
+            self._max_ns / 1e9,
+        )
+
+
+class EventRate:
+    """Events per second over a sliding window, counted in time bins."""
+
+    def __init__(self, window_s: float = 5.0, resolution_s: float = 0.25):
+        self.window_s = window_s
+        self._resolution_ns = int(resolution_s * 1e9)
+        self._bins = max(int(window_s / resolution_s), 1)
+        self._epochs = [-1] * self._bins
+        self._counts = [0] * self._bins
+        self._first_ns: int | None = None
+
+    def add(self, count: int = 1, now_ns: int | None = None):
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        if self._first_ns is None:
+            self._first_ns = now_ns
+        epoch = now_ns // self._resolution_ns
+        slot = epoch % self._bins
+        if self._epochs[slot] != epoch:
+            self._epochs[slot] = epoch
+            self._counts[slot] = 0
+        self._counts[slot] += count
+
+    def rate(self, now_ns: int | None = None) -> float:
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        if self._first_ns is None:
+            return 0.0
+        epoch = now_ns // self._resolution_ns
+        total = sum(
+            count
+            for bin_epoch, count in zip(self._epochs, self._counts)
+            if 0 <= epoch - bin_epoch < self._bins
+        )
+        # the window covers the full bins before the current one and the
+        # elapsed part of the current one, but not the time before the first event
+        window_ns = (self._bins - 1) * self._resolution_ns + (
+            now_ns - epoch * self._resolution_ns
+        )
+        window_ns = min(window_ns, now_ns - self._first_ns)
+        if window_ns <= 0:
+            return 0.0
+        return total / window_ns * 1e9
+
+    def reset(self):
+        self._epochs = [-1] * self._bins
+        self._counts = [0] * self._bins
+        self._first_ns = None
+
+
+class CounterRate:
+    """Rate of increase of a cumulative counter.
+
+    The counter is sampled on a fixed cadence (see PeriodicSampler), so that
+    the rate does not depend on how often, or by how many readers, it is read.
+    """
+
+    def __init__(self, window_s: float = 5.0):
+        self.window_s = window_s
+        self._samples: list[tuple[int, int]] = []
+        self._lock = Lock()
+        self._rate = 0.0
+
+    def rate(self) -> float:
+        """The rate computed by the last sample."""
+        return self._rate
+
+    def sample(self, total: int, now_ns: int | None = None) -> float:
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        with self._lock:
+            if self._samples and total < self._samples[-1][1]:
+                # the counter was reset, e.g. by restarting the stream
+                self._samples.clear()
+            self._samples.append((now_ns, total))
+            # keep the newest sample at or before the start of the window
+            start_ns = now_ns - int(self.window_s * 1e9)
+            while len(self._samples) > 2 and self._samples[1][0] <= start_ns:
+                self._samples.pop(0)
+            first_ns, first_total = self._samples[0]
+            if now_ns == first_ns:
+                self._rate = 0.0
+            else:
+                self._rate = (total - first_total) / (now_ns - first_ns) * 1e9
+            return self._rate
+
+
+class PeriodicSampler:
+    """Calls `sample` every `interval_s` on its own thread while started."""
+
+    def __init__(self, sample: Callable[[], None], interval_s: float = 0.5):
+        self.sample = sample
+        self.interval_s = interval_s
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.sample()
+
+
+class RecorderMetrics:
+    def __init__(self, window_s: float = 5.0):
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.frames = EventRate(window_s)
+        self.drops = CounterRate(window_s)
+
+
+@dataclass
+class RecorderStatus:
+    streaming: bool
+    recording: bool
+    frames_delivered: int = 0
+    frames_dropped: dict[str, int] = field(default_factory=dict)
+    writer_queue_depth: int = 0
+    # over the last few seconds, and since the stream started
+    frames_per_second: float = 0.0
+    average_frames_per_second: float = 0.0
+    drops_per_second: float = 0.0
+    # of the current or last recording, see frame_accounting
+    frames_missing: int = 0
+    missed_triggers: int = 0
+    placeholder_frames: int = 0
+    # by the writer, since the current or last recording started
+    frames_written: int = 0
+    armed: bool = False
+    # the current raw recording has no room left, see raw_recording
+    recording_full: bool = False
+    # see recorder.FireStatistics
+    arm_duration_ms: float | None = None
+    first_frame_latency_ms: float | None = None
+    # of the current or last recording, see recorder.EncoderStatistics
+    encoder: str | None = None
+    encoder_frames_per_second: float = 0.0
+    encoder_cpu_percent: float | None = None
+    stages: dict[str, HistogramSnapshot] = field(default_factory=dict)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def format_prometheus(statuses: dict[str, RecorderStatus]) -> str:
+    """Prometheus text exposition of the status of every camera."""
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_labels(**labels)} {value}")
+
+    metric(
+        "recorder_streaming",
+        "gauge",
+        "1 while the camera is streaming",
+        [("", {"camera": c}, int(s.streaming)) for c, s in statuses.items()],
+    )
+    metric(
+        "recorder_recording",
+        "gauge",
+        "1 while the camera is recording",
+        [("", {"camera": c}, int(s.recording)) for c, s in statuses.items()],
+    )
+    metric(
+        "recorder_frames_delivered_total",
+        "counter",
+        "Frames delivered to the sink since the stream started",
+        [("", {"camera": c}, s.frames_delivered) for c, s in statuses.items()],
+    )
+    metric(
+        "recorder_frames_dropped_total",
+        "counter",
+        "Frames lost since the stream started, by reason",
+        [
+            ("", {"camera": c, "reason": reason}, count)
+            for c, s in statuses.items()
+            for reason, count in s.frames_dropped.items()
+        ],
+    )
+    metric(
+        "recorder_frames_per_second",
+        "gauge",
+        "Frames delivered per second over the last few seconds",
+        [("", {"camera": c}, s.frames_per_second) for c, s in statuses.items()],
+    )
+    metric(
+        "recorder_drops_per_second",
+        "gauge",
+        "Frames lost per second over the last few seconds",
+        [("", {"camera": c}, s.drops_per_second) for c, s in statuses.items()],
+    )
+    metric(
+        "recorder_frames_missing_total",
+        "counter",
+        "Frames of the current recording lost between camera and file",
+        [("", {"camera": c}, s.frames_missing) for c, s in statuses.items()],
+    )
+    metric(
+        "recorder_missed_triggers_total",
+        "counter",
+        "Triggers the camera ignored during the current recording",
+        [("", {"camera": c}, s.missed_triggers) for c, s in statuses.items()],
+    )
+    metric(
+        "recorder_placeholder_frames_total",
+        "counter",
+        "Placeholder frames written for missing frames of the current recording",
+        [("", {"camera": c}, s.placeholder_frames) for c, s in statuses.items()],
+    )
+    metric(
+        "recorder_first_frame_latency_seconds",
+        "gauge",
+        "Delay from starting the current recording to its first live frame",
+        [
+            ("", {"camera": c}, s.first_frame_latency_ms / 1e3)
+            for c, s in statuses.items()
+            if s.first_frame_latency_ms is not None
+        ],
+    )
+    metric(
+        "recorder_encoder_frames_per_second",
+        "gauge",
+        "Frames the encoder takes per second of writer time, i.e. its capacity",
+        [
+            ("", {"camera": c, "engine": s.encoder}, s.encoder_frames_per_second)
+            for c, s in statuses.items()
+            if s.encoder is not None
+        ],
+    )
+    metric(
+        "recorder_encoder_cpu_ratio",
+        "gauge",
+        "CPU time of writer thread and encoder process per second of recording",
+        [
+            ("", {"camera": c, "engine": s.encoder}, s.encoder_cpu_percent / 100)
+            for c, s in statuses.items()
+            if s.encoder is not None and s.encoder_cpu_percent is not None
+        ],
+    )
+    metric(
+        "recorder_writer_queue_depth",
+        "gauge",
+        "Frames waiting for the encoder",
+        [("", {"camera": c}, s.writer_queue_depth) for c, s in statuses.items()],
+    )
+
+    samples = []
+    for camera_id, status in statuses.items():
+        for stage, histogram in status.stages.items():
+            labels = {"camera": camera_id, "stage": stage}
+            cumulative = 0
+            for bound, count in zip(histogram.bounds_s + (math.inf,), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                samples.append(("_bucket", {**labels, "le": le}, cumulative))
+            samples.append(("_sum", labels, histogram.sum_s))
+            samples.append(("_count", labels, histogram.count))
+    metric(
+        "recorder_stage_latency_seconds",
+        "histogram",
+        "Time a frame spends in each stage of the record path",
+        samples,
+    )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,501 @@
+"""Background transfer of finished recordings to archive storage.
+
+Files to transfer are kept in a persistent SQLite queue, so transfers that
+were pending or interrupted continue after a restart. Workers run at the
+lowest thread priority, share a bandwidth limit and verify every file after
+the transfer before it is (optionally) deleted locally.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+PART_SUFFIX = ".part"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recording_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    size INTEGER,
+    sha256 TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, not_before);
+"""
+
+
+class JobStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class OffloadJob:
+    job_id: int
+    recording_id: str
+    filename: str
+    status: JobStatus
+    attempts: int = 0
+    size: int | None = None
+    sha256: str | None = None
+    error: str | None = None
+
+
+class OffloadQueue:
+    """Persistent queue of files to transfer, one job per file."""
+
+    def __init__(self, path: str, max_attempts: int = 5, retry_delay_s: float = 30.0):
+        self.max_attempts = max_attempts
+        self.retry_delay_s = retry_delay_s
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        with self._db:
+            # transfers interrupted by a restart are resumed
+            self._db.execute(
+                "UPDATE jobs SET status = ? WHERE status = ?",
+                (JobStatus.PENDING.value, JobStatus.RUNNING.value),
+            )
+
+    def enqueue(self, recording_id: str, filenames: list[str]) -> list[int]:
+        with self._lock, self._db:
+            return [
+                self._db.execute(
+                    "INSERT INTO jobs (recording_id, filename, status) VALUES (?, ?, ?)",
+                    (recording_id, filename, JobStatus.PENDING.value),
+                ).lastrowid
+                for filename in filenames
+            ]
+
+    def claim(self) -> OffloadJob | None:
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT job_id FROM jobs WHERE status = ? AND not_before <= ? "
+                "ORDER BY job_id LIMIT 1",
+                (JobStatus.PENDING.value, time.time()),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1 WHERE job_id = ?",
+                (JobStatus.RUNNING.value, row[0]),
+            )
+        return self.get(row[0])
+
+    def complete(self, job_id: int, size: int, sha256: str):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, size = ?, sha256 = ?, error = NULL "
+                "WHERE job_id = ?",
+                (JobStatus.DONE.value, size, sha256, job_id),
+            )
+
+    def fail(self, job_id: int, error: str):
+        with self._lock, self._db:
+            (attempts,) = self._db.execute(
+                "SELECT attempts FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            status = JobStatus.FAILED if attempts >= self.max_attempts else None
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, not_before = ? "
+                "WHERE job_id = ?",
+                (
+                    (status or JobStatus.PENDING).value,
+                    error,
+                    time.time() + self.retry_delay_s,
+                    job_id,
+                ),
+            )
+
+    def get(self, job_id: int) -> OffloadJob | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT job_id, recording_id, filename, status, attempts, size, "
+                "sha256, error FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return OffloadJob(row[0], row[1], row[2], JobStatus(row[3]), *row[4:])
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            counts = dict(rows.fetchall())
+        return {status.value: counts.get(status.value, 0) for status in JobStatus}
+
+    def close(self):
+        self._db.close()
+
+
+class TokenBucket:
+    """Limits the rate of bytes passed to `consume`, shared by all workers."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, CHUNK_SIZE)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class OffloadTarget(ABC):
+    @abstractmethod
+    def uploaded_size(self, name: str) -> int:
+        """Bytes of `name` already transferred by an interrupted upload."""
+
+    @abstractmethod
+    def upload(self, name: str, chunks: Iterator[bytes], offset: int):
+        """Transfer `chunks`, which continue the file at `offset`."""
+
+    @abstractmethod
+    def verify(self, name: str, size: int, sha256: str) -> bool:
+        pass
+
+    @abstractmethod
+    def commit(self, name: str):
+        """Make a verified upload visible under its final name."""
+
+    @abstractmethod
+    def discard(self, name: str):
+        """Remove an upload that failed verification."""
+
+
+class LocalDirectoryTarget(OffloadTarget):
+    """Copies to a directory, e.g. a mounted network share."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _part(self, name: str) -> str:
+        return os.path.join(self.root, name + PART_SUFFIX)
+
+    def uploaded_size(self, name: str) -> int:
+        try:
+            return os.path.getsize(self._part(name))
+        except FileNotFoundError:
+            return 0
+
+    def upload(self, name: str, chunks: Iterator[bytes], offset: int):
+        with open(self._part(name), "r+b" if offset else "wb") as part:
+            part.seek(offset)
+            part.truncate()
+            for chunk in chunks:
+                part.write(chunk)
+
+    def verify(self, name: str, size: int, sha256: str) -> bool:
+        path = self._part(name)
+        return os.path.getsize(path) == size and file_sha256(path) == sha256
+
+    def commit(self, name: str):
+        os.replace(self._part(name), os.path.join(self.root, name))
+
+    def discard(self, name: str):
+        try:
+            os.remove(self._part(name))
+        except FileNotFoundError:
+            pass
+
+
+class WebDAVTarget(OffloadTarget):
+    """Uploads with PUT to a temporary name and MOVEs it into place.
+
+    WebDAV has no partial PUT, so interrupted uploads start over. Servers do
+    not report checksums either, so every upload is read back and hashed
+    before it is committed; reading back is not bandwidth limited.
+    """
+
+    def __init__(
+        self, base_url: str, auth: tuple[str, str] | None = None, transport=None
+    ):
+        # only needed for WebDAV, and slow to import
+        try:
+            import httpx
+        except ImportError as e:
+            raise RuntimeError("WebDAV offloading requires httpx") from e
+        self.base_url = base_url.rstrip("/")
+        self._client = httpx.Client(auth=auth, timeout=60.0, transport=transport)
+
+    def _url(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def uploaded_size(self, name: str) -> int:
+        return 0
+
+    def upload(self, name: str, chunks: Iterator[bytes], offset: int):
+        response = self._client.put(self._url(name + PART_SUFFIX), content=chunks)
+        response.raise_for_status()
+
+    def verify(self, name: str, size: int, sha256: str) -> bool:
+        digest = hashlib.sha256()
+        received = 0
+        with self._client.stream("GET", self._url(name + PART_SUFFIX)) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes(CHUNK_SIZE):
+                digest.update(chunk)
+                received += len(chunk)
+        return received == size and digest.hexdigest() == sha256
+
+    def commit(self, name: str):
+        response = self._client.request(
+            "MOVE",
+            self._url(name + PART_SUFFIX),
+            headers={"Destination": self._url(name), "Overwrite": "T"},
+        )
+        response.raise_for_status()
+
+    def discard(self, name: str):
+        self._client.delete(self._url(name + PART_SUFFIX))
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        while chunk := source.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def lower_thread_priority():
+    """Give the calling thread the lowest CPU priority the platform allows."""
+    if sys.platform.startswith("linux"):
+        # Linux applies nice values to individual threads
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except OSError:
+            pass
+    elif sys.platform == "win32":
+        import ctypes
+
+        THREAD_PRIORITY_IDLE = -15
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_IDLE)
+
+
+class Offloader:
+    """Transfers queued files from `directory` to `target` on worker threads.
+
+    While `is_busy` returns true (e.g. while recording), the bandwidth is
+    limited to `busy_max_bytes_per_s` instead of `max_bytes_per_s`; a limit of
+    0 pauses the transfers. `on_deleted` is called with the job of every file
+    deleted after its upload, e.g. to drop the recording from a catalog.
+    """
+
+    def __init__(
+        self,
+        queue: OffloadQueue,
+        target: OffloadTarget,
+        directory: str,
+        workers: int = 1,
+        max_bytes_per_s: float | None = None,
+        busy_max_bytes_per_s: float | None = 0,
+        is_busy: Callable[[], bool] = lambda: False,
+        delete_after_upload: bool = False,
+        poll_interval_s: float = 1.0,
+        on_deleted: Callable[[OffloadJob], None] | None = None,
+    ):
+        self.queue = queue
+        self.target = target
+        self.directory = directory
+        self.workers = workers
+        self.max_bytes_per_s = max_bytes_per_s
+        self.busy_max_bytes_per_s = busy_max_bytes_per_s
+        self.is_busy = is_busy
+        self.delete_after_upload = delete_after_upload
+        self.poll_interval_s = poll_interval_s
+        self.on_deleted = on_deleted
+        self._bucket = TokenBucket(max_bytes_per_s) if max_bytes_per_s else None
+        self._busy_bucket = (
+            TokenBucket(busy_max_bytes_per_s) if busy_max_bytes_per_s else None
+        )
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"offload-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def enqueue(self, recording_id: str, filenames: list[str]) -> list[int]:
+        job_ids = self.queue.enqueue(recording_id, filenames)
+        self._wake.set()
+        return job_ids
+
+    def process_one(self) -> bool:
+        """Transfer the next queued file, if any; returns whether there was one."""
+        job = self.queue.claim()
+        if job is None:
+            return False
+        try:
+            size, sha256 = self._transfer(job.filename)
+            self.queue.complete(job.job_id, size, sha256)
+        except Exception as e:
+            logger.warning("Offloading %s failed: %s", job.filename, e)
+            self.queue.fail(job.job_id, str(e))
+            return True
+        if self.delete_after_upload:
+            try:
+                self._delete(job)
+            except Exception as e:
+                # the file is archived, only the local copy is left behind
+                logger.error("Deleting %s after offloading failed: %s", job.filename, e)
+        return True
+
+    def _delete(self, job: OffloadJob):
+        # the user may have deleted the file meanwhile
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self.directory, job.filename))
+        if self.on_deleted is not None:
+            self.on_deleted(job)
+
+    def _run(self):
+        lower_thread_priority()
+        while not self._stop.is_set():
+            try:
+                transferred = self.process_one()
+            except Exception:
+                # e.g. the queue's database failed; retried after the interval
+                logger.exception("Offload worker error")
+                transferred = False
+            if not transferred:
+                self._wake.wait(self.poll_interval_s)
+                self._wake.clear()
+
+    def _transfer(self, filename: str) -> tuple[int, str]:
+        path = os.path.join(self.directory, filename)
+        size = os.path.getsize(path)
+        offset = self.target.uploaded_size(filename)
+        if offset > size:
+            offset = 0
+        # the checksum covers the whole file, including a resumed prefix
+        digest = hashlib.sha256()
+        if offset:
+            with open(path, "rb") as source:
+                remaining = offset
+                while remaining:
+                    chunk = source.read(min(CHUNK_SIZE, remaining))
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+
+        def chunks():
+            with open(path, "rb") as source:
+                source.seek(offset)
+                while not self._stop.is_set():
+                    self._throttle(CHUNK_SIZE)
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    digest.update(chunk)
+                    yield chunk
+                raise InterruptedError("Offloading stopped")
+
+        self.target.upload(filename, chunks(), offset)
+        sha256 = digest.hexdigest()
+        if not self.target.verify(filename, size, sha256):
+            # start from scratch on the next attempt
+            self.target.discard(filename)
+            raise ValueError(f"Verification of {filename} failed")
+        self.target.commit(filename)
+        return size, sha256
+
+    def _throttle(self, amount: int):
+        while self.is_busy():
+            if self._busy_bucket is not None:
+                self._busy_bucket.consume(amount)
+                return
+            if self.busy_max_bytes_per_s is None:
+                break
+            # paused while busy
+            if self._stop.wait(self.poll_interval_s):
+                return
+        if self._bucket is not None:
+            self._bucket.consume(amount)
+
+
+def add_offload_arguments(parser: argparse.ArgumentParser):
+    offload = parser.add_argument_group("offloading of finished recordings")
+    target = offload.add_mutually_exclusive_group()
+    target.add_argument("--offload-dir", help="archive directory, e.g. a mount")
+    target.add_argument("--offload-url", help="WebDAV URL of the archive")
+    offload.add_argument(
+        "--offload-rate-mbps",
+        type=float,
+        help="bandwidth limit in MB/s; transfers pause while recording",
+    )
+    offload.add_argument("--offload-workers", type=int, default=1)
+    offload.add_argument(
+        "--offload-delete",
+        action="store_true",
+        help="delete local files once they are verified in the archive",
+    )
+
+
+def offloader_from_args(
+    args: argparse.Namespace, directory: str, is_busy: Callable[[], bool]
+) -> Offloader | None:
+    """The offloader configured by `add_offload_arguments`, None if there is none.
+
+    The queue is kept next to `directory`.
+    """
+    if args.offload_dir:
+        target = LocalDirectoryTarget(args.offload_dir)
+    elif args.offload_url:
+        target = WebDAVTarget(args.offload_url)
+    else:
+        return None
+    return Offloader(
+        OffloadQueue(f"{directory}-offload.sqlite"),
+        target,
+        directory,
+        workers=args.offload_workers,
+        max_bytes_per_s=args.offload_rate_mbps and args.offload_rate_mbps * 1e6,
+        is_busy=is_busy,
+        delete_after_upload=args.offload_delete,
+    )
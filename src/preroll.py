@@ -0,0 +1,70 @@
+import math
+from collections import deque
+from threading import Lock
+
+from frame_writer import SharedBuffer
+
+
+class PrerollBuffer:
+    """Ring of the most recent frames, kept while no recording is running.
+
+    The ring is bounded by age (`max_seconds`, measured on the frames' host
+    timestamps) and by memory (`max_bytes`). Frames hold on to their sink
+    buffers, so the sink has to allocate `capacity` extra buffers, which is
+    only known once the image type and frame rate are (see `configure`).
+    """
+
+    def __init__(self, max_seconds: float | None = None, max_bytes: int | None = None):
+        if max_seconds is None and max_bytes is None:
+            raise ValueError("A pre-roll needs a duration or a memory limit")
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.capacity = 0
+        self._frames: deque[SharedBuffer] = deque()
+        self._lock = Lock()
+
+    def configure(self, frame_size: int, frame_rate: float | None) -> int:
+        """Size the ring for a stream; returns the number of frames it can hold."""
+        limits = []
+        if self.max_bytes is not None:
+            limits.append(self.max_bytes // max(frame_size, 1))
+        if self.max_seconds is not None and frame_rate:
+            limits.append(math.ceil(self.max_seconds * frame_rate) + 1)
+        if not limits:
+            # neither limit can be turned into a frame count, e.g. an unknown
+            # frame rate with only a duration; do not buffer anything
+            limits.append(0)
+        self.clear()
+        self.capacity = min(limits)
+        return self.capacity
+
+    def push(self, frame: SharedBuffer):
+        evicted = []
+        with self._lock:
+            if self.capacity == 0:
+                evicted.append(frame)
+            else:
+                self._frames.append(frame)
+                while len(self._frames) > self.capacity:
+                    evicted.append(self._frames.popleft())
+                if self.max_seconds is not None:
+                    max_age_ns = self.max_seconds * 1e9
+                    newest = frame.host_timestamp_ns
+                    while newest - self._frames[0].host_timestamp_ns > max_age_ns:
+                        evicted.append(self._frames.popleft())
+        for old in evicted:
+            old.release()
+
+    def drain(self) -> list[SharedBuffer]:
+        """Take all buffered frames, oldest first. The caller owns them."""
+        with self._lock:
+            frames = list(self._frames)
+            self._frames.clear()
+        return frames
+
+    def clear(self):
+        for frame in self.drain():
+            frame.release()
+
+    def __len__(self) -> int:
+        return len(self._frames)
@@ -0,0 +1,152 @@
+import time
+from dataclasses import dataclass
+from threading import Condition, Thread
+
+import imagingcontrol4 as ic4
+import numpy as np
+
+from frame_writer import SharedBuffer
+
+
+@dataclass
+class PreviewStatistics:
+    frames_shown: int = 0
+    frames_skipped: int = 0
+    # CPU time spent by the preview thread copying and handing frames to the display
+    cpu_time_s: float = 0.0
+    # cpu_time_s relative to the time the preview has been running, in percent
+    cpu_percent: float = 0.0
+
+
+class PreviewRenderer:
+    """Shows a throttled, optionally subsampled copy of the stream on a display.
+
+    Frames are offered from the sink callback. At most `max_fps` of them are
+    accepted; each accepted frame is copied into a buffer owned by the preview
+    and released straight away, so the display never keeps a sink buffer the
+    recorder needs. The copy and the hand-over to the display run on the
+    preview's own thread.
+    """
+
+    # number of sink buffers the preview can hold at the same time: one
+    # waiting in the slot and one being copied
+    MAX_BUFFERS = 2
+
+    def __init__(self, max_fps: float = 20.0, subsample: int = 1):
+        if max_fps <= 0:
+            raise ValueError("max_fps must be positive")
+        if subsample < 1:
+            raise ValueError("subsample must be at least 1")
+        self.max_fps = max_fps
+        self.subsample = subsample
+        self.display: ic4.Display | None = None
+        self._pool: ic4.BufferPool | None = None
+        self._slot: SharedBuffer | None = None
+        self._condition = Condition()
+        self._thread: Thread | None = None
+        self._running = False
+        self._last_accepted_ns = 0
+        self._started_ns = 0
+        self._cpu_time_ns = 0
+        self._frames_shown = 0
+        self._frames_skipped = 0
+
+    def start(self, display: ic4.Display):
+        if self._running:
+            return
+        self.display = display
+        self._pool = ic4.BufferPool()
+        self._running = True
+        self._started_ns = time.perf_counter_ns()
+        self._cpu_time_ns = 0
+        self._frames_shown = 0
+        self._frames_skipped = 0
+        self._thread = Thread(target=self._run, name="preview", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+        self._discard_slot()
+        self.display.display_buffer(None)
+        self.display = None
+        self._pool = None
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def offer(self, frame: SharedBuffer) -> bool:
+        """Called for every frame; returns whether the preview took it."""
+        if frame.host_timestamp_ns - self._last_accepted_ns < 1e9 / self.max_fps:
+            self._frames_skipped += 1
+            return False
+        self._last_accepted_ns = frame.host_timestamp_ns
+        with self._condition:
+            if not self._running:
+                return False
+            replaced = self._slot
+            self._slot = frame.acquire()
+            self._condition.notify()
+        if replaced is not None:
+            # the preview thread fell behind, show the newer frame instead
+            self._frames_skipped += 1
+            replaced.release()
+        return True
+
+    def get_statistics(self) -> PreviewStatistics:
+        elapsed_ns = time.perf_counter_ns() - self._started_ns if self._running else 0
+        return PreviewStatistics(
+            frames_shown=self._frames_shown,
+            frames_skipped=self._frames_skipped,
+            cpu_time_s=self._cpu_time_ns / 1e9,
+            cpu_percent=100.0 * self._cpu_time_ns / elapsed_ns if elapsed_ns else 0.0,
+        )
+
+    def _discard_slot(self):
+        with self._condition:
+            frame, self._slot = self._slot, None
+        if frame is not None:
+            frame.release()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and self._slot is None:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                frame, self._slot = self._slot, None
+            start = time.thread_time_ns()
+            try:
+                image = self._copy(frame)
+            finally:
+                frame.release()
+            self.display.display_buffer(image)
+            self._cpu_time_ns += time.thread_time_ns() - start
+            self._frames_shown += 1
+
+    def _copy(self, frame: SharedBuffer) -> ic4.ImageBuffer:
+        source = frame.numpy_view()
+        image_type = frame.buffer.image_type
+        step = self.subsample
+        if step > 1:
+            if image_type.pixel_format.name.startswith("Bayer"):
+                # keep whole 2x2 cells so the result is still a valid Bayer image
+                height, width, channels = source.shape
+                cells = source[: height // 2 * 2, : width // 2 * 2].reshape(
+                    height // 2, 2, width // 2, 2, channels
+                )
+                cells = cells[::step, :, ::step]
+                source = cells.reshape(cells.shape[0] * 2, cells.shape[2] * 2, channels)
+            else:
+                source = source[::step, ::step]
+        image = self._pool.get_buffer(
+            ic4.ImageType(image_type.pixel_format, source.shape[1], source.shape[0])
+        )
+        np.copyto(image.numpy_wrap(), source)
+        return image
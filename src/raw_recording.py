@@ -0,0 +1,220 @@
+"""Raw, lossless recordings in a preallocated, memory-mapped file.
+
+Layout (little endian)::
+
+    header   HEADER_SIZE bytes, see HEADER_FORMAT
+    index    capacity entries of INDEX_DTYPE (frame number, device timestamp)
+    frames   capacity frames of height x width x channels pixels
+
+The index and the frame data start on page boundaries. When a recording is
+finished the file is truncated after the last written frame, so `capacity`
+in the header is the number of frames the index has room for and
+`frame_count` the number of frames that were actually written.
+"""
+
+import mmap
+import os
+import struct
+from typing import Dict
+
+import numpy as np
+
+MAGIC = b"ISRAW\x00\x00\x00"
+VERSION = 1
+HEADER_SIZE = 4096
+HEADER_FORMAT = "<8sII IIII 32s16s d QQ QQQ"
+RAW_EXTENSION = ".raw"
+
+INDEX_DTYPE = np.dtype([("frame_number", "<u8"), ("device_timestamp_ns", "<u8")])
+
+# numpy element type and number of channels for each supported pixel format,
+# matching the layout of ic4.ImageBuffer.numpy_wrap
+PIXEL_FORMATS: Dict[str, tuple[type, int]] = {
+    "Mono8": (np.uint8, 1),
+    "Mono16": (np.uint16, 1),
+    "BayerBG8": (np.uint8, 1),
+    "BayerGB8": (np.uint8, 1),
+    "BayerGR8": (np.uint8, 1),
+    "BayerRG8": (np.uint8, 1),
+    "BayerBG16": (np.uint16, 1),
+    "BayerGB16": (np.uint16, 1),
+    "BayerGR16": (np.uint16, 1),
+    "BayerRG16": (np.uint16, 1),
+    "BGR8": (np.uint8, 3),
+    "BGRa8": (np.uint8, 4),
+    "BGRa16": (np.uint16, 4),
+}
+
+
+class RawRecordingFull(Exception):
+    pass
+
+
+def _align(offset: int) -> int:
+    return (offset + mmap.PAGESIZE - 1) // mmap.PAGESIZE * mmap.PAGESIZE
+
+
+def frame_nbytes(image_type) -> int:
+    """Size of one frame of the given image type; 4 bytes per pixel if unknown."""
+    if image_type.pixel_format.name not in PIXEL_FORMATS:
+        return image_type.width * image_type.height * 4
+    dtype, channels = PIXEL_FORMATS[image_type.pixel_format.name]
+    return image_type.width * image_type.height * channels * np.dtype(dtype).itemsize
+
+
+def raw_filename(file_name: str) -> str:
+    return os.path.splitext(file_name)[0] + RAW_EXTENSION
+
+
+class RawVideoWriter:
+    """Writes frames unencoded into a preallocated, memory-mapped file.
+
+    Has the same begin_file/add_frame/finish_file interface as
+    `ic4.VideoWriter`. The file is sized for `max_frames` frames up front so
+    that writing a frame is a single sequential copy into the mapping.
+    """
+
+    def __init__(self, max_frames: int):
+        if max_frames < 1:
+            raise ValueError("max_frames must be at least 1")
+        self.max_frames = max_frames
+        self.frame_count = 0
+        self._file = None
+        self._mmap: mmap.mmap | None = None
+        self._index: np.ndarray | None = None
+        self._frames: np.ndarray | None = None
+
+    def begin_file(self, path: str, image_type, frame_rate: float):
+        pixel_format = image_type.pixel_format.name
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Pixel format {pixel_format} is not supported")
+        dtype, channels = PIXEL_FORMATS[pixel_format]
+        dtype = np.dtype(dtype).newbyteorder("<")
+        shape = (image_type.height, image_type.width, channels)
+        frame_size = int(np.prod(shape)) * dtype.itemsize
+
+        index_offset = HEADER_SIZE
+        data_offset = _align(index_offset + self.max_frames * INDEX_DTYPE.itemsize)
+        file_size = data_offset + self.max_frames * frame_size
+
+        self._file = open(path, "w+b")
+        if hasattr(os, "posix_fallocate"):
+            # reserve the blocks now instead of on the first write of each page
+            os.posix_fallocate(self._file.fileno(), 0, file_size)
+        else:
+            self._file.truncate(file_size)
+        self._mmap = mmap.mmap(self._file.fileno(), file_size)
+
+        self._header = (
+            MAGIC,
+            VERSION,
+            HEADER_SIZE,
+            image_type.width,
+            image_type.height,
+            channels,
+            dtype.itemsize,
+            pixel_format.encode(),
+            dtype.str.encode(),
+            frame_rate,
+            self.max_frames,
+            0,
+            index_offset,
+            data_offset,
+            frame_size,
+        )
+        self._write_header(0)
+        self._index = np.ndarray(
+            (self.max_frames,), INDEX_DTYPE, buffer=self._mmap, offset=index_offset
+        )
+        self._frames = np.ndarray(
+            (self.max_frames, *shape), dtype, buffer=self._mmap, offset=data_offset
+        )
+        self._data_offset = data_offset
+        self._frame_size = frame_size
+        # publish the frame count in the header about once per second so an
+        # interrupted recording can still be read back
+        self._header_interval = max(int(frame_rate), 1)
+        self.frame_count = 0
+
+    def add_frame(self, buf):
+        n = self.frame_count
+        if n >= self.max_frames:
+            raise RawRecordingFull(f"Raw recording is full ({self.max_frames} frames)")
+        self._frames[n] = buf.numpy_wrap()
+        meta_data = buf.meta_data
+        self._index[n] = (meta_data.device_frame_number, meta_data.device_timestamp_ns)
+        self.frame_count = n + 1
+        if self.frame_count % self._header_interval == 0:
+            self._write_header(self.frame_count)
+
+    def finish_file(self):
+        if self._mmap is None:
+            return
+        self._write_header(self.frame_count)
+        self._index = None
+        self._frames = None
+        self._mmap.flush()
+        self._mmap.close()
+        self._mmap = None
+        self._file.truncate(self._data_offset + self.frame_count * self._frame_size)
+        self._file.close()
+        self._file = None
+
+    def _write_header(self, frame_count: int):
+        header = list(self._header)
+        header[11] = frame_count
+        struct.pack_into(HEADER_FORMAT, self._mmap, 0, *header)
+
+
+class RawRecording:
+    """Read access to a raw recording through numpy memmaps."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as raw_file:
+            values = struct.unpack(
+                HEADER_FORMAT, raw_file.read(struct.calcsize(HEADER_FORMAT))
+            )
+        (
+            magic,
+            version,
+            _,
+            self.width,
+            self.height,
+            self.channels,
+            _,
+            pixel_format,
+            dtype,
+            self.frame_rate,
+            self.capacity,
+            self.frame_count,
+            index_offset,
+            data_offset,
+            _,
+        ) = values
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a raw recording")
+        if version != VERSION:
+            raise ValueError(f"Unsupported raw recording version {version}")
+        self.pixel_format = pixel_format.rstrip(b"\x00").decode()
+        self.dtype = np.dtype(dtype.rstrip(b"\x00").decode())
+
+        count = self.frame_count
+        shape = (count, self.height, self.width, self.channels)
+        if count:
+            self.index = np.memmap(
+                path, INDEX_DTYPE, mode="r", offset=index_offset, shape=(count,)
+            )
+            self.frames = np.memmap(
+                path, self.dtype, mode="r", offset=data_offset, shape=shape
+            )
+        else:
+            # numpy cannot map zero bytes
+            self.index = np.empty((0,), INDEX_DTYPE)
+            self.frames = np.empty(shape, self.dtype)
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def __getitem__(self, item) -> np.ndarray:
+        return self.frames[item]
@@ -1,11 +1,121 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from enum import Enum
 from os import PathLike
+from threading import Lock
 
 RECORDINGS_DIR = "recordings"
 
 
-class RecorderSettings(ABC):
-    pass
+class RecordingMode(Enum):
+    ENCODED = "encoded"
+    # unencoded frames in a preallocated, memory-mapped file (see raw_recording)
+    RAW = "raw"
+
+
+class EncoderEngine(Enum):
+    # ic4.VideoWriter with the codec settings of codecconfig.json
+    IC4 = "ic4"
+    # frames piped to a local ffmpeg process (see ffmpeg_writer)
+    FFMPEG = "ffmpeg"
+
+
+@dataclass
+class RecorderSettings:
+    mode: RecordingMode = RecordingMode.ENCODED
+    # engine of encoded recordings; codec, preset and threads only apply to
+    # ffmpeg, see ffmpeg_writer.FFMPEG_CODECS
+    encoder: EncoderEngine = EncoderEngine.IC4
+    codec: str = "h264"
+    preset: str = "veryfast"
+    # encoder threads, 0 lets the codec decide
+    threads: int = 0
+    # capacity of a raw recording, either in frames or in seconds at the
+    # recording frame rate
+    max_frames: int | None = None
+    max_duration_s: float | None = None
+    # roll over to a new file (see segmented_recording) after this many
+    # frames, seconds or bytes, whichever comes first
+    segment_frames: int | None = None
+    segment_seconds: float | None = None
+    segment_bytes: int | None = None
+    # write a copy of the next recorded frame for every missing frame, so
+    # that frame i of the file is frame i of the camera (see frame_accounting)
+    fill_gaps: bool = False
+
+    def is_segmented(self) -> bool:
+        return (
+            self.segment_frames is not None
+            or self.segment_seconds is not None
+            or self.segment_bytes is not None
+        )
+
+
+@dataclass
+class FireStatistics:
+    # time spent preparing the recording, before capturing can start
+    arm_duration_ms: float | None = None
+    # host times (time.time_ns) of the fire call and of the scheduled start
+    fired_ns: int | None = None
+    scheduled_ns: int | None = None
+    # host time of the first frame captured live, and its delay after the
+    # fire call or the scheduled start, whichever is later
+    first_frame_ns: int | None = None
+    first_frame_latency_ms: float | None = None
+
+
+@dataclass
+class EncoderStatistics:
+    # "ic4", "ffmpeg" or "raw"
+    engine: str = EncoderEngine.IC4.value
+    frames: int = 0
+    bytes: int = 0
+    # wall and CPU time the writer thread spent in add_frame, from the first
+    # frame to the last one
+    encode_s: float = 0.0
+    encode_cpu_s: float = 0.0
+    elapsed_s: float = 0.0
+    # CPU time of an external encoder process, None for in-process engines
+    process_cpu_s: float | None = None
+    # perf_counter_ns of the first write, and the wall time from it until an
+    # external encoder had flushed its last finished file
+    first_write_ns: int | None = None
+    flushed_s: float = 0.0
+    _lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+    @property
+    def frames_per_second(self) -> float:
+        """Frames the engine takes per second of writer time, i.e. its capacity.
+
+        Writes to ffmpeg only fill its pipe, so its frames are counted over the
+        wall time until it has flushed them; while it keeps up, that is the
+        frame rate it was fed.
+        """
+        if self.engine == EncoderEngine.FFMPEG.value:
+            seconds = max(self.elapsed_s, self.flushed_s)
+        else:
+            seconds = self.encode_s
+        return self.frames / seconds if seconds > 0 else 0.0
+
+    @property
+    def cpu_percent(self) -> float | None:
+        """CPU time of writer thread and encoder process per wall time; over 100
+        for multithreaded encoders."""
+        if self.elapsed_s <= 0:
+            return None
+        return (self.encode_cpu_s + (self.process_cpu_s or 0.0)) / self.elapsed_s * 100
+
+    def add_process_cpu(self, seconds: float):
+        # encoder processes of consecutive segments report from different threads
+        with self._lock:
+            self.process_cpu_s = (self.process_cpu_s or 0.0) + seconds
+
+    def file_flushed(self, flushed_ns: int):
+        # segments are flushed in the background, possibly out of order
+        with self._lock:
+            if self.first_write_ns is not None:
+                flushed_s = (flushed_ns - self.first_write_ns) / 1e9
+                self.flushed_s = max(self.flushed_s, flushed_s)
 
 
 class VideoRecorderInterface(ABC):
@@ -0,0 +1,251 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Barrier
+from typing import TYPE_CHECKING, Callable, Dict
+
+from recorder import RecorderSettings
+
+if TYPE_CHECKING:
+    from imaging_source_recorder import ImagingSourceRecorder
+
+# head start of fire_all's default start time over the fire calls
+FIRE_ALL_LEAD_NS = 5_000_000
+# longest wait of start_all for the cameras' first frames
+FIRST_FRAME_TIMEOUT_S = 1.0
+
+
+@dataclass
+class CameraStartResult:
+    camera_id: str
+    file_name: str
+    # host time (time.time_ns) at which the camera started capturing, and at
+    # which its first frame arrived
+    started_ns: int | None = None
+    first_frame_ns: int | None = None
+    start_duration_ms: float | None = None
+    error: str | None = None
+
+
+@dataclass
+class StartAllResult:
+    cameras: Dict[str, CameraStartResult] = field(default_factory=dict)
+    # spread of the arrival times of the first frames over all cameras that
+    # started, None if no first frame arrived in time
+    start_skew_ms: float | None = None
+
+
+def camera_id_from_state_file(filename: str) -> str:
+    try:
+        with open(filename) as state_file:
+            serial = json.load(state_file).get("device", {}).get("serial")
+        if serial:
+            return str(serial)
+    except (OSError, ValueError):
+        pass
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def file_name_for_camera(file_name_base: str, camera_id: str) -> str:
+    root, extension = os.path.splitext(file_name_base)
+    return f"{root}_{camera_id}{extension or '.mp4'}"
+
+
+def _create_recorder() -> "ImagingSourceRecorder":
+    # imported on first use, so that the REST server can load without ic4
+    from imaging_source_recorder import ImagingSourceRecorder
+
+    return ImagingSourceRecorder()
+
+
+class RecorderManager:
+    """Owns several recorders and starts/stops them together.
+
+    Every recorder keeps its own sink and writer threads. `start_all` releases
+    all start calls at the same moment and reports how far apart the first
+    frames of the cameras' recordings arrived.
+    """
+
+    def __init__(
+        self,
+        recorder_factory: Callable[[], "ImagingSourceRecorder"] | None = None,
+    ):
+        self.recorder_factory = recorder_factory or _create_recorder
+        self.recorders: Dict[str, "ImagingSourceRecorder"] = {}
+        self.last_start: StartAllResult | None = None
+
+    def add_recorder(self, camera_id: str, recorder: "ImagingSourceRecorder"):
+        if camera_id in self.recorders:
+            raise ValueError(f"Camera {camera_id} already exists")
+        self.recorders[camera_id] = recorder
+
+    def open_from_state_files(self, filenames: list[str]) -> list[str]:
+        camera_ids = []
+        for filename in filenames:
+            camera_id = camera_id_from_state_file(filename)
+            recorder = self.recorder_factory()
+            recorder.load_state_from_file(filename)
+            self.add_recorder(camera_id, recorder)
+            camera_ids.append(camera_id)
+        return camera_ids
+
+    def get(self, camera_id: str) -> "ImagingSourceRecorder":
+        return self.recorders[camera_id]
+
+    def start_streaming_all(self):
+        for recorder in self.recorders.values():
+            recorder.start_streaming()
+
+    def start_all(
+        self,
+        file_name_base: str,
+        frame_rate: float | None = None,
+        triggered_mode: bool = False,
+        settings: RecorderSettings | None = None,
+        first_frame_timeout_s: float = FIRST_FRAME_TIMEOUT_S,
+    ) -> StartAllResult:
+        result = StartAllResult()
+        if not self.recorders:
+            return result
+        barrier = Barrier(len(self.recorders))
+
+        def start(camera_id: str, recorder: "ImagingSourceRecorder"):
+            camera = CameraStartResult(
+                camera_id, file_name_for_camera(file_name_base, camera_id)
+            )
+            barrier.wait()
+            start = time.perf_counter()
+            try:
+                recorder.start_recording(
+                    camera.file_name,
+                    frame_rate=frame_rate,
+                    triggered_mode=triggered_mode,
+                    settings=settings,
+                )
+                camera.started_ns = recorder.recording_started_ns
+            except Exception as e:
+                camera.error = str(e)
+            camera.start_duration_ms = (time.perf_counter() - start) * 1e3
+            return camera
+
+        with ThreadPoolExecutor(max_workers=len(self.recorders)) as executor:
+            futures = [
+                executor.submit(start, camera_id, recorder)
+                for camera_id, recorder in self.recorders.items()
+            ]
+            for future in futures:
+                camera = future.result()
+                result.cameras[camera.camera_id] = camera
+
+        # triggered cameras start with the first trigger, which may take a while
+        self._wait_for_first_frames(
+            result, 0.0 if triggered_mode else first_frame_timeout_s
+        )
+        first = [c.first_frame_ns for c in result.cameras.values() if c.first_frame_ns]
+        if first:
+            result.start_skew_ms = (max(first) - min(first)) / 1e6
+        self.last_start = result
+        return result
+
+    def _wait_for_first_frames(self, result: StartAllResult, timeout_s: float):
+        deadline = time.monotonic() + timeout_s
+        for camera in result.cameras.values():
+            if camera.error is not None:
+                continue
+            statistics = self.get(camera.camera_id).fire_statistics
+            while statistics.first_frame_ns is None and time.monotonic() < deadline:
+                time.sleep(0.001)
+            camera.first_frame_ns = statistics.first_frame_ns
+
+    def arm_all(
+        self,
+        file_name_base: str,
+        frame_rate: float | None = None,
+        triggered_mode: bool = False,
+        settings: RecorderSettings | None = None,
+    ) -> StartAllResult:
+        """Arm all cameras in parallel; `fire_all` then starts them together."""
+        result = StartAllResult()
+        if not self.recorders:
+            return result
+
+        def arm(camera_id: str, recorder: "ImagingSourceRecorder"):
+            camera = CameraStartResult(
+                camera_id, file_name_for_camera(file_name_base, camera_id)
+            )
+            try:
+                recorder.arm(
+                    camera.file_name,
+                    frame_rate=frame_rate,
+                    triggered_mode=triggered_mode,
+                    settings=settings,
+                )
+            except Exception as e:
+                camera.error = str(e)
+            camera.start_duration_ms = recorder.fire_statistics.arm_duration_ms
+            return camera
+
+        with ThreadPoolExecutor(max_workers=len(self.recorders)) as executor:
+            futures = [
+                executor.submit(arm, camera_id, recorder)
+                for camera_id, recorder in self.recorders.items()
+            ]
+            for future in futures:
+                camera = future.result()
+                result.cameras[camera.camera_id] = camera
+        self.last_start = result
+        return result
+
+    def fire_all(self, at_ns: int | None = None) -> int:
+        """Start all armed cameras with their first frame at or after `at_ns`.
+
+        Defaults to a moment just after the call, so that no camera starts
+        before the others were told to. Returns the start time used.
+        """
+        if at_ns is None:
+            at_ns = time.time_ns() + FIRE_ALL_LEAD_NS
+        for recorder in self.recorders.values():
+            if recorder.is_armed():
+                recorder.fire(at_ns=at_ns)
+        return at_ns
+
+    def estimate_bytes_per_second(
+        self, frame_rate: float | None = None, settings: RecorderSettings | None = None
+    ) -> Dict[str, float]:
+        """Estimated data rate of each camera's recording with these arguments."""
+        return {
+            camera_id: recorder.estimate_bytes_per_second(frame_rate, settings)
+            for camera_id, recorder in self.recorders.items()
+        }
+
+    def stop_all(self) -> Dict[str, str | None]:
+        """Stop all recording cameras in parallel; returns errors by camera."""
+        recording = {
+            camera_id: recorder
+            for camera_id, recorder in self.recorders.items()
+            if recorder.is_recording() or recorder.is_armed()
+        }
+        if not recording:
+            return {}
+
+        def stop(recorder: "ImagingSourceRecorder") -> str | None:
+            try:
+                recorder.stop_recording()
+            except Exception as e:
+                return str(e)
+            return None
+
+        with ThreadPoolExecutor(max_workers=len(recording)) as executor:
+            futures = {
+                camera_id: executor.submit(stop, recorder)
+                for camera_id, recorder in recording.items()
+            }
+            return {camera_id: f.result() for camera_id, f in futures.items()}
+
+    def close(self):
+        self.stop_all()
+        for recorder in self.recorders.values():
+            recorder.stop_streaming()
+        self.recorders.clear()
@@ -0,0 +1,314 @@
+import base64
+import json
+import os
+import sqlite3
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from typing import Callable, Generic, Iterator, TypeVar
+
+from pydantic import BaseModel
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    recording_id TEXT PRIMARY KEY,
+    video_filename TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recordings_by_mtime ON recordings (mtime_ns, recording_id);
+"""
+
+RecordingT = TypeVar("RecordingT", bound=BaseModel)
+
+# sort keys of CatalogQuery and the index columns they sort by
+SORT_COLUMNS = {"recording_id": "recording_id", "modified": "mtime_ns"}
+
+
+@dataclass
+class CatalogQuery:
+    # metadata key -> required value, or None if the key only has to exist
+    metadata: dict[str, str | None] = field(default_factory=dict)
+    # range of the video files' modification times, in ns since the epoch
+    modified_after_ns: int | None = None
+    modified_before_ns: int | None = None
+    sort: str = "recording_id"
+    descending: bool = False
+
+
+def encode_cursor(sort_value, recording_id: str) -> str:
+    data = json.dumps([sort_value, recording_id]).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        sort_value, recording_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return sort_value, recording_id
+
+
+class RecordingsCatalog(MutableMapping, Generic[RecordingT]):
+    """Recordings by id, persisted in an SQLite index next to the recordings.
+
+    Recordings for which `is_persistent` is true (finished ones) are kept in
+    the index only; the others (starting, recording, stopping) are kept in
+    memory until they are stored again in a persistent state. Recordings read
+    from the index are copies, so store them again after changing them.
+
+    `reconcile` brings the index up to date with the directory. It compares
+    the modification times of the video files with the index and only loads
+    recordings whose video file changed, so opening the catalog does not read
+    any files at all. Stored recordings whose video file is gone, e.g. failed
+    ones that never wrote a file, are removed from the index.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        directory: str,
+        model: type[RecordingT],
+        load_func: Callable[[str], RecordingT],
+        is_persistent: Callable[[RecordingT], bool],
+        # of the video files, or a tuple of them
+        extension: str | tuple[str, ...] = ".mp4",
+        key_func: Callable[[str], str | None] | None = None,
+    ):
+        self.directory = directory
+        self.model = model
+        self.load_func = load_func
+        self.is_persistent = is_persistent
+        self.extension = extension
+        # recording id of a video file, None for files that are part of
+        # another file's recording
+        self.key_func = key_func or (lambda filename: os.path.splitext(filename)[0])
+        self._live: dict[str, RecordingT] = {}
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._stop_reconciling = Event()
+        self._reconcile_thread: Thread | None = None
+
+    def __getitem__(self, recording_id: str) -> RecordingT:
+        with self._lock:
+            if recording_id in self._live:
+                return self._live[recording_id]
+            row = self._db.execute(
+                "SELECT data FROM recordings WHERE recording_id = ?", (recording_id,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(recording_id)
+        return self.model.model_validate_json(row[0])
+
+    def __setitem__(self, recording_id: str, recording: RecordingT):
+        with self._lock:
+            if self.is_persistent(recording):
+                self._live.pop(recording_id, None)
+                self._store(recording_id, recording, self._mtime(recording))
+            else:
+                self._live[recording_id] = recording
+                # a new recording replaces a finished one with the same name
+                self._delete(recording_id)
+
+    def __delitem__(self, recording_id: str):
+        with self._lock:
+            live = self._live.pop(recording_id, None)
+            if not self._delete(recording_id) and live is None:
+                raise KeyError(recording_id)
+
+    def __contains__(self, recording_id) -> bool:
+        with self._lock:
+            if recording_id in self._live:
+                return True
+            return (
+                self._db.execute(
+                    "SELECT 1 FROM recordings WHERE recording_id = ?", (recording_id,)
+                ).fetchone()
+                is not None
+            )
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            live = list(self._live)
+            stored = [
+                row[0]
+                for row in self._db.execute(
+                    "SELECT recording_id FROM recordings ORDER BY rowid"
+                )
+            ]
+        return iter(stored + [i for i in live if i not in stored])
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM recordings").fetchone()
+            return count + len(self._live)
+
+    def clear(self):
+        with self._lock, self._db:
+            self._live.clear()
+            self._db.execute("DELETE FROM recordings")
+
+    def live(self) -> list[RecordingT]:
+        """Recordings that are not finished yet."""
+        with self._lock:
+            return list(self._live.values())
+
+    def stored(self) -> Iterator[RecordingT]:
+        """Finished recordings, in the order they were added to the index."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM recordings ORDER BY rowid"
+            ).fetchall()
+        for (data,) in rows:
+            yield self.model.model_validate_json(data)
+
+    def page(
+        self, query: CatalogQuery, cursor: str | None = None, limit: int | None = None
+    ) -> tuple[list[tuple[str, str]], str | None]:
+        """Finished recordings matching `query`, as (recording_id, JSON) pairs.
+
+        Returns at most `limit` recordings following `cursor` and the cursor
+        of the next page, or None if this is the last page.
+        """
+        column = SORT_COLUMNS[query.sort]
+        direction = "DESC" if query.descending else "ASC"
+        where, params = [], []
+        for key, value in query.metadata.items():
+            if value is None:
+                where.append(
+                    "EXISTS (SELECT 1 FROM json_each(data, '$.metadata') "
+                    "WHERE key = ?)"
+                )
+                params.append(key)
+            else:
+                where.append(
+                    "EXISTS (SELECT 1 FROM json_each(data, '$.metadata') "
+                    "WHERE key = ? AND CAST(value AS TEXT) = ?)"
+                )
+                params += [key, value]
+        if query.modified_after_ns is not None:
+            where.append("mtime_ns >= ?")
+            params.append(query.modified_after_ns)
+        if query.modified_before_ns is not None:
+            where.append("mtime_ns < ?")
+            params.append(query.modified_before_ns)
+        if cursor is not None:
+            operator = "<" if query.descending else ">"
+            where.append(f"({column}, recording_id) {operator} (?, ?)")
+            params += decode_cursor(cursor)
+        sql = (
+            f"SELECT recording_id, {column}, data FROM recordings"
+            f"{' WHERE ' + ' AND '.join(where) if where else ''}"
+            f" ORDER BY {column} {direction}, recording_id {direction} LIMIT ?"
+        )
+        # fetch one more row to find out whether there is a next page
+        params.append(-1 if limit is None else limit + 1)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+        return [(recording_id, data) for recording_id, _, data in rows], next_cursor
+
+    def reconcile(self) -> int:
+        """Update the index from the directory; returns the number of changes."""
+        # not skipped when the directory's mtime is unchanged: files rewritten
+        # in place do not change it
+        with self._lock:
+            indexed = dict(
+                self._db.execute("SELECT video_filename, mtime_ns FROM recordings")
+            )
+            live = set(self._live)
+
+        changes = 0
+        found = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(self.extension) or not entry.is_file():
+                    continue
+                recording_id = self.key_func(entry.name)
+                if recording_id is None or recording_id in live:
+                    continue
+                found.add(entry.name)
+                mtime = entry.stat().st_mtime_ns
+                if indexed.get(entry.name) == mtime:
+                    continue
+                recording = self.load_func(entry.name)
+                with self._lock:
+                    self._store(recording.recording_id, recording, mtime)
+                changes += 1
+
+        with self._lock, self._db:
+            for video_filename in indexed.keys() - found:
+                self._db.execute(
+                    "DELETE FROM recordings WHERE video_filename = ?",
+                    (video_filename,),
+                )
+                changes += 1
+        return changes
+
+    def start_reconciling(self, interval_s: float):
+        """Reconcile now and then every `interval_s` seconds in the background."""
+        if self._reconcile_thread is not None:
+            return
+        self._stop_reconciling.clear()
+
+        def run():
+            while True:
+                try:
+                    self.reconcile()
+                except OSError:
+                    pass
+                if self._stop_reconciling.wait(interval_s):
+                    return
+
+        self._reconcile_thread = Thread(
+            target=run, name="recordings-catalog", daemon=True
+        )
+        self._reconcile_thread.start()
+
+    def stop_reconciling(self):
+        if self._reconcile_thread is None:
+            return
+        self._stop_reconciling.set()
+        self._reconcile_thread.join()
+        self._reconcile_thread = None
+
+    def close(self):
+        self.stop_reconciling()
+        self._db.close()
+
+    def _mtime(self, recording: RecordingT) -> int:
+        try:
+            return os.stat(
+                os.path.join(self.directory, recording.video_filename)
+            ).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _store(self, recording_id: str, recording: RecordingT, mtime_ns: int):
+        with self._db:
+            # the video file may have been indexed under another id before
+            self._db.execute(
+                "DELETE FROM recordings WHERE video_filename = ? AND recording_id != ?",
+                (recording.video_filename, recording_id),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?)",
+                (
+                    recording_id,
+                    recording.video_filename,
+                    mtime_ns,
+                    recording.model_dump_json(),
+                ),
+            )
+
+    def _delete(self, recording_id: str) -> bool:
+        with self._db:
+            cursor = self._db.execute(
+                "DELETE FROM recordings WHERE recording_id = ?", (recording_id,)
+            )
+        return cursor.rowcount > 0
@@ -0,0 +1,134 @@
+import contextlib
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    # only for annotations; the REST server reads SEGMENT_PATTERN without ic4
+    import imagingcontrol4 as ic4
+
+# {recording}.seg0000.mp4, {recording}.seg0001.mp4, ...
+SEGMENT_PATTERN = re.compile(r"^(?P<recording>.+)\.seg(?P<index>\d{4,})(?P<ext>\.\w+)$")
+
+
+def segment_filename(path: str, index: int) -> str:
+    root, extension = os.path.splitext(path)
+    return f"{root}.seg{index:04d}{extension}"
+
+
+class SegmentedVideoWriter:
+    """Video writer that rolls over to a new file every N frames, seconds or bytes.
+
+    Behaves like a single writer towards the recorder. The writer of the next
+    segment is created and its file opened ahead of time on a helper thread,
+    so a rollover only swaps writers between two frames; finishing the old
+    segment (writing the MP4 index) also happens on the helper thread.
+
+    Segment durations are measured with the frames' device timestamps, or
+    with the nominal frame rate for frames without one, so they do not
+    depend on when the writer thread gets to the frames.
+    """
+
+    def __init__(
+        self,
+        writer_factory: Callable[[], object],
+        max_frames: int | None = None,
+        max_seconds: float | None = None,
+        max_bytes: int | None = None,
+    ):
+        if max_frames is None and max_seconds is None and max_bytes is None:
+            raise ValueError("A segment needs a frame, duration or size limit")
+        self.writer_factory = writer_factory
+        self.max_frames = max_frames
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        # paths of all segments written so far, in order
+        self.segments: list[str] = []
+        self._executor: ThreadPoolExecutor | None = None
+        self._writer = None
+        self._next: Future | None = None
+        self._finishing: list[Future] = []
+
+    def begin_file(self, path: str, image_type: "ic4.ImageType", frame_rate: float):
+        self._path = path
+        self._image_type = image_type
+        self._frame_rate = frame_rate
+        self.segments = []
+        self._finishing = []
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="segments"
+        )
+        self._writer = self._open_segment(0)
+        self._start_segment(0)
+
+    def add_frame(self, buf):
+        timestamp_ns = self._timestamp_ns(buf)
+        if self._segment_full(timestamp_ns):
+            self._roll_over()
+        if self._frames == 0:
+            self._first_timestamp_ns = timestamp_ns
+        self._writer.add_frame(buf)
+        self._frames += 1
+
+    def finish_file(self):
+        if self._writer is None:
+            return
+        self._writer.finish_file()
+        self._writer = None
+        for future in self._finishing:
+            future.result()
+        # the prepared segment was never used
+        if self._next is not None:
+            unused = self._next.result()
+            unused.finish_file()
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(segment_filename(self._path, len(self.segments)))
+            self._next = None
+        self._executor.shutdown()
+        self._executor = None
+
+    def _open_segment(self, index: int):
+        writer = self.writer_factory()
+        writer.begin_file(
+            segment_filename(self._path, index), self._image_type, self._frame_rate
+        )
+        return writer
+
+    def _start_segment(self, index: int):
+        self.segments.append(segment_filename(self._path, index))
+        self._frames = 0
+        self._first_timestamp_ns = None
+        self._next = self._executor.submit(self._open_segment, index + 1)
+
+    def _timestamp_ns(self, buf) -> int | None:
+        meta_data = getattr(buf, "meta_data", None)
+        if meta_data is None or not meta_data.device_timestamp_ns:
+            return None
+        return meta_data.device_timestamp_ns
+
+    def _segment_seconds(self, timestamp_ns: int | None) -> float:
+        """Duration of the current segment up to a frame with `timestamp_ns`."""
+        if timestamp_ns is not None and self._first_timestamp_ns is not None:
+            return (timestamp_ns - self._first_timestamp_ns) / 1e9
+        return self._frames / self._frame_rate
+
+    def _segment_full(self, timestamp_ns: int | None) -> bool:
+        if self._frames == 0:
+            return False
+        if self.max_frames is not None and self._frames >= self.max_frames:
+            return True
+        if (
+            self.max_seconds is not None
+            and self._segment_seconds(timestamp_ns) >= self.max_seconds
+        ):
+            return True
+        if self.max_bytes is not None:
+            return os.path.getsize(self.segments[-1]) >= self.max_bytes
+        return False
+
+    def _roll_over(self):
+        finished = self._writer
+        self._writer = self._next.result()
+        self._finishing.append(self._executor.submit(finished.finish_file))
+        self._start_segment(len(self.segments))
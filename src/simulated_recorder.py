@@ -0,0 +1,397 @@
+import json
+import time
+from collections import deque
+from threading import Event, Lock, Semaphore, Thread
+from typing import Any, Callable, Dict
+
+import numpy as np
+import imagingcontrol4 as ic4
+
+from imaging_source_recorder import ImagingSourceRecorder
+from raw_recording import PIXEL_FORMATS
+
+# number of buffers an ic4 QueueSink typically asks for
+MIN_BUFFERS_REQUIRED = 4
+
+
+class SimulatedImageBuffer:
+    """Numpy-backed stand-in for `ic4.ImageBuffer`.
+
+    Releasing the buffer returns it to the sink it was allocated by, just like
+    an ic4 buffer returns to the QueueSink's free queue.
+    """
+
+    def __init__(self, sink: "SimulatedQueueSink", image_type: ic4.ImageType):
+        dtype, channels = PIXEL_FORMATS[image_type.pixel_format.name]
+        self.image_type = image_type
+        self.meta_data = ic4.ImageBuffer.MetaData(0, 0)
+        self._array = np.zeros((image_type.height, image_type.width, channels), dtype)
+        self._sink = sink
+        self._queued = True
+
+    @property
+    def buffer_size(self) -> int:
+        return self._array.nbytes
+
+    @property
+    def pitch(self) -> int:
+        return self._array.strides[0]
+
+    def numpy_wrap(self) -> np.ndarray:
+        return self._array
+
+    def numpy_copy(self) -> np.ndarray:
+        return self._array.copy()
+
+    def release(self):
+        if not self._queued:
+            self._queued = True
+            self._sink._requeue(self)
+
+
+class SimulatedQueueSink:
+    """Stand-in for `ic4.QueueSink` with a fixed pool of numpy buffers."""
+
+    def __init__(self, listener: ic4.QueueSinkListener):
+        self.listener = listener
+        self._image_type: ic4.ImageType | None = None
+        self._free: deque[SimulatedImageBuffer] = deque()
+        self._output: deque[SimulatedImageBuffer] = deque()
+        self._lock = Lock()
+
+    @property
+    def output_image_type(self) -> ic4.ImageType:
+        if self._image_type is None:
+            raise ic4.IC4Exception(ic4.ErrorCode.SinkNotConnected, "Sink not connected")
+        return self._image_type
+
+    def alloc_and_queue_buffers(self, count: int):
+        with self._lock:
+            for _ in range(count):
+                self._free.append(SimulatedImageBuffer(self, self.output_image_type))
+
+    def pop_output_buffer(self) -> SimulatedImageBuffer:
+        with self._lock:
+            if not self._output:
+                raise ic4.IC4Exception(
+                    ic4.ErrorCode.NoData, "No output buffer available"
+                )
+            buf = self._output.popleft()
+        buf._queued = False
+        return buf
+
+    def _connect(self, image_type: ic4.ImageType) -> bool:
+        self._image_type = image_type
+        return self.listener.sink_connected(self, image_type, MIN_BUFFERS_REQUIRED)
+
+    def _disconnect(self):
+        with self._lock:
+            self._free.clear()
+            self._output.clear()
+        self.listener.sink_disconnected(self)
+
+    def _take_free_buffer(self) -> SimulatedImageBuffer | None:
+        with self._lock:
+            return self._free.popleft() if self._free else None
+
+    def _queue_output(self, buf: SimulatedImageBuffer):
+        with self._lock:
+            self._output.append(buf)
+
+    def _requeue(self, buf: SimulatedImageBuffer):
+        with self._lock:
+            if buf.image_type == self._image_type:
+                self._free.append(buf)
+
+
+class SimulatedPropertyMap:
+    def __init__(self, values: Dict[str, Any]):
+        self.values = values
+
+    def get_value_float(self, prop: str) -> float:
+        return float(self.values[prop])
+
+    def get_value_int(self, prop: str) -> int:
+        return int(self.values[prop])
+
+    def get_value_bool(self, prop: str) -> bool:
+        value = self.values[prop]
+        if isinstance(value, str):
+            return value == "On"
+        return bool(value)
+
+    def get_value_str(self, prop: str) -> str:
+        value = self.values[prop]
+        if isinstance(value, bool):
+            return "On" if value else "Off"
+        return str(value)
+
+    def set_value(self, prop: str, value):
+        self.values[prop] = value
+
+    def try_set_value(self, prop: str, value) -> bool:
+        self.values[prop] = value
+        return True
+
+    def connect_chunkdata(self, buf):
+        pass
+
+
+class SimulatedGrabber:
+    """Stand-in for `ic4.Grabber` that generates a moving test pattern.
+
+    In free-running mode frames are produced at `AcquisitionFrameRate`. With
+    `TriggerMode` enabled a frame is only produced for each `software_trigger`.
+    """
+
+    def __init__(self, width: int, height: int, pixel_format: str, frame_rate: float):
+        self.device_property_map = SimulatedPropertyMap(
+            {
+                ic4.PropId.WIDTH: width,
+                ic4.PropId.HEIGHT: height,
+                ic4.PropId.PIXEL_FORMAT: pixel_format,
+                ic4.PropId.ACQUISITION_FRAME_RATE: frame_rate,
+                ic4.PropId.TRIGGER_MODE: False,
+            }
+        )
+        self.is_device_valid = True
+        self.is_device_open = True
+        self.device_info = None
+        self.sink: SimulatedQueueSink | None = None
+        self._statistics = ic4.Grabber.StreamStatistics(0, 0, 0, 0, 0, 0, 0, 0, 0)
+        self._thread: Thread | None = None
+        self._stop = Event()
+        self._triggers = Semaphore(0)
+        self._pattern: np.ndarray | None = None
+        self._device_lost_handlers: list[Callable] = []
+        self._trigger_missed_handlers: list[Callable] = []
+        # frames to number but not deliver, emulating transmission errors
+        self._frames_to_lose = 0
+
+    @property
+    def is_streaming(self) -> bool:
+        return self._thread is not None
+
+    @property
+    def stream_statistics(self) -> ic4.Grabber.StreamStatistics:
+        s = self._statistics
+        return ic4.Grabber.StreamStatistics(
+            s.device_delivered,
+            s.device_transmission_error,
+            s.device_transform_underrun,
+            s.device_underrun,
+            s.transform_delivered,
+            s.transform_underrun,
+            s.sink_delivered,
+            s.sink_underrun,
+            s.sink_ignored,
+        )
+
+    def device_open_from_state_file(self, filename: str):
+        # Only the properties that shape the generated stream are honoured
+        with open(filename) as state_file:
+            properties = json.load(state_file).get("properties", {})
+        for prop in (
+            ic4.PropId.WIDTH,
+            ic4.PropId.HEIGHT,
+            ic4.PropId.PIXEL_FORMAT,
+            ic4.PropId.ACQUISITION_FRAME_RATE,
+            ic4.PropId.TRIGGER_MODE,
+        ):
+            if prop in properties:
+                self.device_property_map.set_value(prop, properties[prop])
+
+    def device_close(self):
+        self.stream_stop()
+
+    def event_add_device_lost(self, handler: Callable):
+        self._device_lost_handlers.append(handler)
+
+    def stream_setup(self, sink: SimulatedQueueSink, display=None):
+        if self.is_streaming:
+            raise ic4.IC4Exception(ic4.ErrorCode.InvalidOperation, "Already streaming")
+        props = self.device_property_map
+        pixel_format = props.get_value_str(ic4.PropId.PIXEL_FORMAT)
+        if pixel_format not in PIXEL_FORMATS:
+            raise ic4.IC4Exception(
+                ic4.ErrorCode.InvalidParamVal,
+                f"Unsupported pixel format {pixel_format}",
+            )
+        image_type = ic4.ImageType(
+            ic4.PixelFormat[pixel_format],
+            props.get_value_int(ic4.PropId.WIDTH),
+            props.get_value_int(ic4.PropId.HEIGHT),
+        )
+        self._pattern = self._make_pattern(image_type)
+
+        self.sink = sink
+        if not sink._connect(image_type):
+            self.sink = None
+            raise ic4.IC4Exception(
+                ic4.ErrorCode.SinkConnectAborted, "Sink refused connection"
+            )
+
+        self._statistics = ic4.Grabber.StreamStatistics(0, 0, 0, 0, 0, 0, 0, 0, 0)
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="simulated-camera", daemon=True)
+        self._thread.start()
+
+    def stream_stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._triggers.release()
+        self._thread.join()
+        self._thread = None
+        if self.sink is not None:
+            self.sink._disconnect()
+            self.sink = None
+
+    def software_trigger(self):
+        self._triggers.release()
+
+    def event_add_trigger_missed(self, handler: Callable):
+        self._trigger_missed_handlers.append(handler)
+
+    def simulate_missed_trigger(self):
+        # the camera ignores the trigger, so no frame number is used up
+        for handler in self._trigger_missed_handlers:
+            handler(self)
+
+    def simulate_lost_frames(self, count: int):
+        self._frames_to_lose += count
+
+    def simulate_device_lost(self):
+        self.is_device_valid = False
+        for handler in self._device_lost_handlers:
+            handler(self)
+
+    @staticmethod
+    def _make_pattern(image_type: ic4.ImageType) -> np.ndarray:
+        # Horizontal gradient twice as wide as the image; each frame shows a
+        # shifted window so consecutive frames differ.
+        dtype, channels = PIXEL_FORMATS[image_type.pixel_format.name]
+        max_value = np.iinfo(dtype).max
+        width, height = image_type.width, image_type.height
+        ramp = (np.arange(2 * width) * max_value // max(2 * width - 1, 1)).astype(dtype)
+        pattern = np.broadcast_to(ramp[None, :, None], (height, 2 * width, channels))
+        return np.ascontiguousarray(pattern)
+
+    def _run(self):
+        next_frame_time = time.perf_counter()
+        frame_number = 0
+        while not self._stop.is_set():
+            if self.device_property_map.get_value_bool(ic4.PropId.TRIGGER_MODE):
+                if not self._triggers.acquire(timeout=0.1) or self._stop.is_set():
+                    next_frame_time = time.perf_counter()
+                    continue
+            else:
+                period = 1.0 / self.device_property_map.get_value_float(
+                    ic4.PropId.ACQUISITION_FRAME_RATE
+                )
+                next_frame_time += period
+                delay = next_frame_time - time.perf_counter()
+                if delay > 0:
+                    if self._stop.wait(delay):
+                        break
+                elif delay < -period:
+                    # fell behind, e.g. because the host was busy; do not burst
+                    next_frame_time = time.perf_counter()
+
+            frame_number += 1
+            if self._frames_to_lose:
+                self._frames_to_lose -= 1
+                self._statistics.device_transmission_error += 1
+                continue
+            self._emit_frame(frame_number)
+
+    def _emit_frame(self, frame_number: int):
+        stats = self._statistics
+        stats.device_delivered += 1
+        buf = self.sink._take_free_buffer()
+        if buf is None:
+            stats.sink_underrun += 1
+            return
+
+        width = buf.image_type.width
+        offset = frame_number % width
+        np.copyto(buf._array, self._pattern[:, offset : offset + width])
+        buf.meta_data = ic4.ImageBuffer.MetaData(frame_number, time.monotonic_ns())
+
+        self.sink._queue_output(buf)
+        stats.sink_delivered += 1
+        self.sink.listener.frames_queued(self.sink)
+
+
+class NullVideoWriter:
+    """Video writer that discards frames, optionally spending time per frame.
+
+    `encode_time` emulates the cost of an encoder so that back-pressure on
+    the writer queue can be reproduced without ic4's native writer. Like the
+    native encoder, the emulated work does not hold the GIL.
+    """
+
+    def __init__(self, encode_time: float = 0.0):
+        self.encode_time = encode_time
+        self.frames_written = 0
+        self.file_name: str | None = None
+
+    def begin_file(self, path: str, image_type: ic4.ImageType, frame_rate: float):
+        self.file_name = path
+        self.image_type = image_type
+        self.frame_rate = frame_rate
+        self.frames_written = 0
+
+    def add_frame(self, buf):
+        if self.encode_time > 0:
+            time.sleep(self.encode_time)
+        self.frames_written += 1
+
+    def finish_file(self):
+        self.file_name = None
+
+
+class SimulatedRecorder(ImagingSourceRecorder):
+    """ImagingSourceRecorder driven by a synthetic camera.
+
+    Runs the same sink callback, writer queue and writer code as the real
+    recorder, so frame drops and latency can be measured without hardware.
+    """
+
+    def __init__(
+        self,
+        width: int = 720,
+        height: int = 484,
+        pixel_format: str = "Mono8",
+        frame_rate: float = 100.0,
+        video_writer=None,
+        **kwargs,
+    ):
+        self._simulated_camera = (width, height, pixel_format, frame_rate)
+        self._video_writer = video_writer
+        super().__init__(**kwargs)
+
+    def _create_grabber(self) -> SimulatedGrabber:
+        return SimulatedGrabber(*self._simulated_camera)
+
+    def _create_sink(self, listener: ic4.QueueSinkListener) -> SimulatedQueueSink:
+        return SimulatedQueueSink(listener)
+
+    def _create_video_writer(self):
+        if self._video_writer is not None:
+            return self._video_writer
+        return NullVideoWriter()
+
+    def _create_segment_writer(self):
+        if isinstance(self.video_writer, NullVideoWriter):
+            return NullVideoWriter(self.video_writer.encode_time)
+        return NullVideoWriter()
+
+    def _subscribe_trigger_missed(self):
+        self.grabber.event_add_trigger_missed(
+            lambda grabber: self.frame_accounting.trigger_missed()
+        )
+        self._trigger_missed_subscribed = True
+
+    def software_trigger(self):
+        self.grabber.software_trigger()
@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+from command_queue import CommandStatus, RecorderCommandQueue
+
+
+def test_cameras_run_in_parallel():
+    queue = RecorderCommandQueue()
+    release = threading.Event()
+    slow = queue.submit("finalise", release.wait, 5, cameras=["left"])
+    # the other camera does not wait for the left one's command
+    fast = queue.submit("start", lambda: "started", cameras=["right"])
+    assert fast.future.result(timeout=5) == "started"
+    assert slow.status == CommandStatus.RUNNING
+    release.set()
+    assert slow.future.result(timeout=5) is True
+    queue.shutdown()
+
+
+def test_commands_of_a_camera_run_in_order():
+    queue = RecorderCommandQueue()
+    release = threading.Event()
+    order = []
+    first = queue.submit("first", lambda: order.append(release.wait(5)), cameras=["a"])
+    # waits for camera a, then blocks camera b until it ran
+    both = queue.submit("both", lambda: order.append("both"), cameras=["a", "b"])
+    last = queue.submit("last", lambda: order.append("last"), cameras=["b"])
+    assert both.status == last.status == CommandStatus.PENDING
+    release.set()
+    last.future.result(timeout=5)
+    assert order == [True, "both", "last"]
+    assert first.status == CommandStatus.DONE
+    queue.shutdown()
+
+
+def test_failed_command():
+    queue = RecorderCommandQueue()
+    done = []
+
+    def fail():
+        raise RuntimeError("no device")
+
+    command = queue.submit("start", fail, on_done=done.append)
+    with pytest.raises(RuntimeError):
+        command.future.result(timeout=5)
+    assert command.status == CommandStatus.FAILED
+    assert command.error == "no device"
+    assert done == [command]
+    # the camera is free for the next command
+    assert queue.submit("stop", lambda: None).future.result(timeout=5) is None
+    queue.shutdown()
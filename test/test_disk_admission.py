@@ -0,0 +1,106 @@
+import shutil
+from collections import namedtuple
+
+from disk_admission import (
+    DiskAdmission,
+    ThroughputCache,
+    estimate_bytes_per_second,
+    measure_write_throughput,
+)
+from recorder import EncoderEngine, RecorderSettings, RecordingMode
+from simulated_recorder import SimulatedRecorder
+
+DiskUsage = namedtuple("DiskUsage", "total used free")
+
+
+def fake_free_bytes(monkeypatch, free: int):
+    monkeypatch.setattr(
+        shutil, "disk_usage", lambda path: DiskUsage(free * 2, free, free)
+    )
+
+
+def admission(tmp_path, throughput: float = 100e6, **kwargs) -> DiskAdmission:
+    admission = DiskAdmission(str(tmp_path), **kwargs)
+    admission.cache.put(str(tmp_path), throughput)
+    return admission
+
+
+def test_estimate_bytes_per_second():
+    raw = RecorderSettings(mode=RecordingMode.RAW)
+    assert estimate_bytes_per_second(1000, 100.0, raw) == 100_000
+    assert estimate_bytes_per_second(1000, 100.0) < 100_000
+    ffv1 = RecorderSettings(encoder=EncoderEngine.FFMPEG, codec="ffv1")
+    assert estimate_bytes_per_second(1000, 100.0, ffv1) > estimate_bytes_per_second(
+        1000, 100.0
+    )
+
+
+def test_recorder_estimate_does_not_start_streaming():
+    recorder = SimulatedRecorder(width=64, height=48, frame_rate=50.0)
+    try:
+        raw = RecorderSettings(mode=RecordingMode.RAW)
+        assert recorder.estimate_bytes_per_second(settings=raw) == 64 * 48 * 50.0
+        assert not recorder.is_streaming()
+        recorder.start_streaming()
+        assert recorder.estimate_bytes_per_second(25.0, raw) == 64 * 48 * 25.0
+    finally:
+        recorder.stop_streaming()
+
+
+def test_measure_write_throughput_leaves_no_file(tmp_path):
+    assert measure_write_throughput(str(tmp_path), 2**20, 2**18) > 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_throughput_is_measured_once(tmp_path):
+    directory = tmp_path / "recordings"
+    directory.mkdir()
+    first = DiskAdmission(str(directory), benchmark_bytes=2**20)
+    measured = first.write_bytes_per_second()
+    assert (tmp_path / "recordings-disk.json").exists()
+
+    # a new server reads the cached throughput instead of measuring again
+    second = DiskAdmission(str(directory))
+    assert second.write_bytes_per_second() == measured
+    expired = ThroughputCache(str(tmp_path / "recordings-disk.json"), max_age_s=-1)
+    assert expired.get(str(directory)) is None
+
+
+def test_preflight_admits_and_warns(monkeypatch, tmp_path):
+    fake_free_bytes(monkeypatch, 100e9)
+    disk = admission(tmp_path, reserve_bytes=int(1e9))
+    preflight = disk.preflight(10e6)
+    assert preflight.ok and preflight.warnings == []
+    assert preflight.seconds_left == 99e9 / 10e6
+
+    # close to the disk's throughput, together with a running recording
+    preflight = disk.preflight(50e6, running_bytes_per_second=40e6)
+    assert preflight.ok
+    assert preflight.required_bytes_per_second == 90e6
+    assert "90%" in preflight.warnings[0]
+
+    fake_free_bytes(monkeypatch, 2e9)
+    preflight = disk.preflight(10e6)
+    assert preflight.ok
+    assert preflight.warnings == ["The disk is full after 100 s"]
+
+
+def test_preflight_rejects(monkeypatch, tmp_path):
+    fake_free_bytes(monkeypatch, 100e9)
+    disk = admission(tmp_path, reserve_bytes=int(1e9))
+    preflight = disk.preflight(200e6)
+    assert not preflight.ok
+    assert "the disk writes 100 MB/s" in preflight.error
+
+    fake_free_bytes(monkeypatch, 1.5e9)
+    assert "full after 50 s" in disk.preflight(10e6).error
+    fake_free_bytes(monkeypatch, 0.5e9)
+    assert "are reserved" in disk.preflight(0.0).error
+
+
+def test_should_stop(monkeypatch, tmp_path):
+    disk = admission(tmp_path, reserve_bytes=int(1e9), stop_margin_s=10.0)
+    assert not disk.should_stop(10e6, free_bytes=int(1.2e9))
+    assert disk.should_stop(10e6, free_bytes=int(1.05e9))
+    fake_free_bytes(monkeypatch, 0.9e9)
+    assert disk.should_stop(0.0)
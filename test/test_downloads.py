@@ -0,0 +1,33 @@
+import pytest
+from downloads import choose_encoding, etag_matches, parse_range
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=990-2000", 1000) == (990, 999)
+    # multiple ranges and other units are ignored
+    assert parse_range("bytes=0-1,5-6", 1000) is None
+    assert parse_range("items=0-1", 1000) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=1000-", 1000)
+
+
+def test_etag_matches():
+    assert etag_matches('"a", "b"', '"b"')
+    assert etag_matches('W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding("gzip; q=0.0, deflate") is None
+    assert choose_encoding("gzip;q=0.000") is None
+    assert choose_encoding("GZIP;Q=0.5") == "gzip"
+    assert choose_encoding("gzip;q=invalid") is None
+    assert choose_encoding("*") is not None
+    assert choose_encoding("*, gzip;q=0, zstd;q=0") is None
+    assert choose_encoding("") is None
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import threading
+from events import EventBus, format_sse
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+def test_events_from_other_threads_are_delivered():
+    bus = EventBus()
+
+    async def main():
+        subscription = bus.subscribe()
+        thread = threading.Thread(
+            target=lambda: [bus.publish("tick", {"i": i}) for i in range(3)]
+        )
+        thread.start()
+        received = [await subscription.get() for _ in range(3)]
+        thread.join()
+        return received
+
+    received = run(main())
+    assert [event.data["i"] for event in received] == [0, 1, 2]
+    assert [event.event_id for event in received] == [1, 2, 3]
+
+
+def test_type_filter_and_replay():
+    bus = EventBus()
+    bus.publish("a", {"i": 1})
+    bus.publish("b", {"i": 2})
+    bus.publish("a", {"i": 3})
+
+    async def main():
+        subscription = bus.subscribe(types={"a"}, last_event_id=1)
+        bus.publish("b", {"i": 4})
+        bus.publish("a", {"i": 5})
+        return [(await subscription.get()).data["i"] for _ in range(2)]
+
+    assert run(main()) == [3, 5]
+
+
+def test_slow_subscriber_loses_oldest_events():
+    bus = EventBus(queue_size=2)
+
+    async def main():
+        subscription = bus.subscribe()
+        for i in range(5):
+            bus.publish("tick", {"i": i})
+        # let the loop run the deliveries
+        await asyncio.sleep(0)
+        received = [(await subscription.get()).data["i"] for _ in range(2)]
+        return received, subscription.events_dropped
+
+    assert run(main()) == ([3, 4], 3)
+
+
+def test_unsubscribe():
+    bus = EventBus()
+
+    async def main():
+        subscription = bus.subscribe()
+        assert bus.has_subscribers()
+        bus.unsubscribe(subscription)
+
+    run(main())
+    assert not bus.has_subscribers()
+
+
+def test_format_sse():
+    event = EventBus().publish("recording_started", {"recording_id": "a"})
+    lines = format_sse(event).split("\n")
+    assert lines[:2] == ["id: 1", "event: recording_started"]
+    assert json.loads(lines[2].removeprefix("data: "))["recording_id"] == "a"
+    assert lines[3:] == ["", ""]
@@ -1,10 +1,44 @@
+import asyncio
 import os
 import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+import httpx
 import pytest
+import uvicorn
 from fastapi.testclient import TestClient
-from fastapi_http_server import app, RECORDINGS_DIR, RecordingStatus, recordings
+import fastapi_http_server
+from fastapi_http_server import RecordingStatus, ServerConfig
+from simulated_recorder import SimulatedRecorder
 
-client = TestClient(app)
+# set by server_app
+RECORDINGS_DIR: str
+app = client = recordings = None
+
+
+@pytest.fixture(scope="module", autouse=True)
+def server_app(tmp_path_factory):
+    # recordings and catalog of the tests stay out of the working directory
+    global RECORDINGS_DIR, app, client, recordings
+    directory = tmp_path_factory.mktemp("server")
+    RECORDINGS_DIR = str(directory / "recordings")
+    app = fastapi_http_server.create_app(
+        ServerConfig(
+            recordings_dir=RECORDINGS_DIR,
+            catalog_path=str(directory / "recordings.sqlite"),
+        )
+    )
+    client = TestClient(app)
+    recordings = fastapi_http_server.recordings
+    yield
+    recordings.close()
+
+
+def simulated_recorder() -> SimulatedRecorder:
+    return SimulatedRecorder(width=32, height=24, recordings_dir=RECORDINGS_DIR)
 
 
 @pytest.fixture(autouse=True)
@@ -32,6 +66,7 @@ def test_start_recording():
     assert data["recording_id"] == "test"
     assert data["status"] == RecordingStatus.RECORDING.value
     assert data["metadata"] == {"key": "value"}
+    assert data["frames_url"].endswith("/files/test.frames.bin")
 
 
 def test_stop_recording():
@@ -45,6 +80,19 @@ def test_stop_recording():
     assert data["recording"]["status"] == RecordingStatus.STOPPED.value
 
 
+def test_stop_recording_twice(monkeypatch):
+    stops = []
+    monkeypatch.setattr(
+        fastapi_http_server, "stop_recording_func", lambda: stops.append(1)
+    )
+    client.post("/recordings/start", json={"filename": "test.mp4"})
+    client.post("/recordings/stop", json={"recording_id": "test"})
+    response = client.post("/recordings/stop", json={"recording_id": "test"})
+    assert response.status_code == 400
+    assert len(stops) == 1
+    assert recordings["test"].status == RecordingStatus.STOPPED
+
+
 def test_add_metadata():
     client.post(
         "/recordings/start", json={"filename": "test.mp4", "metadata": {"key": "value"}}
@@ -89,3 +137,953 @@ def test_list_recordings():
     assert "test2" in data
     assert data["test1"]["status"] == RecordingStatus.STOPPED.value
     assert data["test2"]["status"] == RecordingStatus.STOPPED.value
+
+
+def test_stop_without_waiting_does_not_block_other_requests(monkeypatch):
+    finalised = threading.Event()
+    monkeypatch.setattr(
+        fastapi_http_server, "stop_recording_func", lambda: finalised.wait(5)
+    )
+    client.post("/recordings/start", json={"filename": "slow.mp4"})
+    response = client.post(
+        "/recordings/stop", params={"wait": False}, json={"recording_id": "slow"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["message"] == "Recording stopping"
+    assert data["recording"]["status"] == RecordingStatus.STOPPING.value
+    command_id = data["recording"]["command_id"]
+
+    # the event loop keeps serving requests while the recorder is finalising
+    assert client.get(f"/commands/{command_id}").json()["status"] == "running"
+    assert client.get("/recordings/slow").status_code == 400
+
+    finalised.set()
+    command = client.get(f"/commands/{command_id}", params={"wait": True}).json()
+    assert command["status"] == "done"
+    assert client.get("/recordings/slow").json()["status"] == "stopped"
+
+
+def test_failed_start_is_reported(monkeypatch):
+    def failing_start(filename, **kwargs):
+        raise RuntimeError("no device")
+
+    monkeypatch.setattr(fastapi_http_server, "start_recording_func", failing_start)
+    response = client.post("/recordings/start", json={"filename": "broken.mp4"})
+    assert response.status_code == 500
+    assert "no device" in response.json()["detail"]
+    assert recordings["broken"].status == RecordingStatus.FAILED
+    assert recordings.live() == []
+    listed = client.get("/recordings").json()
+    assert listed["broken"]["status"] == RecordingStatus.FAILED.value
+    # no video file was written, so the next scan removes it
+    recordings.reconcile()
+    assert "broken" not in recordings
+
+
+def test_unknown_command():
+    assert client.get("/commands/does-not-exist").status_code == 404
+
+
+def test_cameras_start_and_stop_all(monkeypatch):
+    from recorder_manager import RecorderManager
+
+    manager = RecorderManager()
+    manager.add_recorder("left", simulated_recorder())
+    manager.add_recorder("right", simulated_recorder())
+    monkeypatch.setattr(fastapi_http_server, "recorder_manager", manager)
+    try:
+        response = client.post("/cameras/start", json={"filename": "session"})
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data["recordings"]) == {"left", "right"}
+        assert data["recordings"]["left"]["recording_id"] == "session_left"
+        assert data["start_skew_ms"] is not None
+        assert recordings["session_right"].status == RecordingStatus.RECORDING
+
+        # a second start on an already recording camera is refused
+        response = client.post("/cameras/left/start", json={"filename": "other"})
+        assert response.status_code == 400
+        cameras = {c["camera_id"]: c for c in client.get("/cameras").json()}
+        assert cameras["left"]["recording_id"] == "session_left"
+
+        response = client.post("/cameras/right/stop")
+        assert response.status_code == 200
+        assert response.json()["recording"]["status"] == RecordingStatus.STOPPED.value
+
+        response = client.post("/cameras/stop")
+        assert response.status_code == 200
+        assert set(response.json()["recordings"]) == {"left"}
+        assert recordings["session_left"].status == RecordingStatus.STOPPED
+        assert not manager.get("left").is_recording()
+    finally:
+        manager.close()
+
+
+def test_single_recording_endpoints_drive_a_manager_camera(monkeypatch):
+    from recorder_manager import RecorderManager
+
+    manager = RecorderManager()
+    manager.add_recorder("left", simulated_recorder())
+    manager.add_recorder("right", simulated_recorder())
+    left = manager.get("left")
+    finalising = threading.Event()
+
+    def stop_left():
+        finalising.wait(5)
+        left.stop_recording()
+
+    # like the headless service, /recordings/* drive the first camera
+    monkeypatch.setattr(fastapi_http_server, "recorder_manager", manager)
+    monkeypatch.setattr(fastapi_http_server, "default_camera_id", "left")
+    monkeypatch.setattr(
+        fastapi_http_server, "start_recording_func", left.start_recording
+    )
+    monkeypatch.setattr(fastapi_http_server, "stop_recording_func", stop_left)
+    try:
+        client.post("/recordings/start", json={"filename": "single"})
+        assert left.is_recording()
+        assert (
+            client.post("/cameras/left/start", json={"filename": "b"}).status_code
+            == 400
+        )
+        assert client.post("/cameras/start", json={"filename": "c"}).status_code == 400
+        cameras = {c["camera_id"]: c for c in client.get("/cameras").json()}
+        assert cameras["left"]["recording_id"] == "single"
+
+        # finalising the left camera's file does not hold up the right camera
+        client.post(
+            "/recordings/stop", params={"wait": False}, json={"recording_id": "single"}
+        )
+        response = client.post("/cameras/right/start", json={"filename": "other"})
+        assert response.json()["status"] == RecordingStatus.RECORDING.value
+        assert recordings["single"].status == RecordingStatus.STOPPING
+        finalising.set()
+        client.post("/cameras/right/stop")
+        while recordings["single"].status != RecordingStatus.STOPPED:
+            time.sleep(0.01)
+    finally:
+        finalising.set()
+        manager.close()
+
+
+def test_cameras_not_configured():
+    assert client.get("/cameras").status_code == 404
+    assert client.post("/cameras/unknown/stop").status_code == 404
+
+
+def test_recordings_on_disk_are_catalogued():
+    with open(os.path.join(RECORDINGS_DIR, "old.mp4"), "wb") as video_file:
+        video_file.write(b"\0")
+    with open(os.path.join(RECORDINGS_DIR, "old.metadata.json"), "w") as f:
+        json.dump({"animal": "m1"}, f)
+    recordings.reconcile()
+    data = client.get("/recordings").json()
+    assert data["old"]["metadata"] == {"animal": "m1"}
+    assert data["old"]["status"] == RecordingStatus.STOPPED.value
+
+
+def add_finished_recordings(count):
+    for i in range(count):
+        client.post(
+            "/recordings/start",
+            json={"filename": f"rec{i:02d}", "metadata": {"parity": str(i % 2)}},
+        )
+        client.post("/recordings/stop", json={"recording_id": f"rec{i:02d}"})
+
+
+def test_list_recordings_pages():
+    add_finished_recordings(5)
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, "order": "desc"}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get("/recordings", params=params)
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        seen += list(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == ["rec04", "rec03", "rec02", "rec01", "rec00"]
+
+    assert client.get("/recordings", params={"cursor": "nonsense"}).status_code == 400
+
+
+def test_list_recordings_filters_and_projection():
+    add_finished_recordings(4)
+    response = client.get(
+        "/recordings",
+        params={"metadata": "parity:1", "fields": "recording_id,metadata"},
+    )
+    assert response.json() == {
+        "rec01": {"recording_id": "rec01", "metadata": {"parity": "1"}},
+        "rec03": {"recording_id": "rec03", "metadata": {"parity": "1"}},
+    }
+    response = client.get("/recordings", params={"metadata": "missing"})
+    assert response.json() == {}
+    # the recordings have no video files, so their modification time is 0
+    response = client.get("/recordings", params={"modified_after": 1})
+    assert response.json() == {}
+    assert client.get("/recordings", params={"fields": "nope"}).status_code == 400
+
+
+def test_stream_recordings():
+    add_finished_recordings(3)
+    response = client.get(
+        "/recordings/stream", params={"fields": "recording_id", "sort": "modified"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [{"recording_id": f"rec{i:02d}"} for i in range(3)]
+
+
+def test_download_ranges_and_etag():
+    content = bytes(range(256)) * 16
+    with open(os.path.join(RECORDINGS_DIR, "clip.mp4"), "wb") as video_file:
+        video_file.write(content)
+
+    response = client.get("/downloads/clip.mp4")
+    assert response.status_code == 200
+    assert response.content == content
+    etag = response.headers["etag"]
+
+    response = client.get("/downloads/clip.mp4", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == content[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(content)}"
+
+    response = client.get("/downloads/clip.mp4", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert client.get("/downloads/missing.mp4").status_code == 404
+    assert client.get("/downloads/..%2Ffastapi_http_server.py").status_code == 404
+
+
+def test_download_growing_file():
+    client.post("/recordings/start", json={"filename": "live.mp4"})
+    path = os.path.join(RECORDINGS_DIR, "live.mp4")
+    with open(path, "wb") as video_file:
+        video_file.write(b"a" * 1000)
+
+    response = client.get("/downloads/live.mp4", headers={"Range": "bytes=900-"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 900-999/*"
+    assert "etag" not in response.headers
+    with open(path, "ab") as video_file:
+        video_file.write(b"b" * 500)
+    response = client.get("/downloads/live.mp4", headers={"Range": "bytes=1000-"})
+    assert response.content == b"b" * 500
+    response = client.get("/downloads/live.mp4", headers={"Range": "bytes=1500-"})
+    assert response.status_code == 416
+
+
+def test_download_file_of_failed_recording(monkeypatch):
+    def failing_start(filename, **kwargs):
+        with open(os.path.join(RECORDINGS_DIR, filename), "wb") as video_file:
+            video_file.write(b"a" * 1000)
+        raise RuntimeError("encoder failed")
+
+    monkeypatch.setattr(fastapi_http_server, "start_recording_func", failing_start)
+    client.post("/recordings/start", json={"filename": "failed.mp4"})
+    response = client.get("/downloads/failed.mp4", headers={"Range": "bytes=900-"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 900-999/1000"
+    assert "etag" in response.headers
+
+
+def test_download_compressed_metadata():
+    client.post(
+        "/recordings/start", json={"filename": "meta.mp4", "metadata": {"a": "b"}}
+    )
+    client.post("/recordings/stop", json={"recording_id": "meta"})
+    response = client.get(
+        "/downloads/meta.metadata.json", headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json() == {"a": "b"}
+    response = client.get(
+        "/downloads/meta.metadata.json",
+        headers={
+            "Accept-Encoding": "gzip",
+            "If-None-Match": response.headers["etag"],
+        },
+    )
+    assert response.status_code == 304
+
+
+def test_segmented_recording_is_one_entry(monkeypatch):
+    started = []
+
+    def start(filename, frame_rate=None, triggered_mode=False, settings=None):
+        started.append(settings)
+        for i in range(3):
+            open(os.path.join(RECORDINGS_DIR, f"long.seg{i:04d}.mp4"), "wb").close()
+
+    monkeypatch.setattr(fastapi_http_server, "start_recording_func", start)
+    client.post("/recordings/start", json={"filename": "long", "segment_seconds": 60})
+    assert started[0].segment_seconds == 60
+    response = client.post("/recordings/stop", json={"recording_id": "long"})
+    recording = response.json()["recording"]
+    assert recording["video_filename"] == "long.seg0000.mp4"
+    assert recording["segments"] == [f"long.seg{i:04d}.mp4" for i in range(3)]
+
+    # rebuilt from disk, the segments still form a single recording
+    recordings.clear()
+    recordings.reconcile()
+    assert list(recordings) == ["long"]
+    assert recordings["long"].segments == recording["segments"]
+    assert recordings["long"].segment_urls[2].endswith("/files/long.seg0002.mp4")
+
+
+def test_raw_segments_are_one_entry(monkeypatch):
+    started = []
+
+    def start(filename, frame_rate=None, triggered_mode=False, settings=None):
+        started.append(filename)
+        for i in range(2):
+            open(os.path.join(RECORDINGS_DIR, f"fast.seg{i:04d}.raw"), "wb").close()
+        # sidecars of the segments are not segments themselves
+        open(os.path.join(RECORDINGS_DIR, "fast.seg0000.json"), "wb").close()
+
+    monkeypatch.setattr(fastapi_http_server, "start_recording_func", start)
+    client.post(
+        "/recordings/start",
+        json={"filename": "fast", "mode": "raw", "segment_seconds": 1},
+    )
+    assert started == ["fast.raw"]
+    response = client.post("/recordings/stop", json={"recording_id": "fast"})
+    recording = response.json()["recording"]
+    assert recording["video_filename"] == "fast.seg0000.raw"
+    assert recording["segments"] == ["fast.seg0000.raw", "fast.seg0001.raw"]
+
+    recordings.clear()
+    recordings.reconcile()
+    assert list(recordings) == ["fast"]
+    assert recordings["fast"].segments == recording["segments"]
+
+
+def wait_for_finishing():
+    # the worker runs one job after the other
+    fastapi_http_server.finishing.submit(lambda: None).result()
+
+
+def test_indexing_does_not_hold_up_the_next_start(monkeypatch):
+    indexing = threading.Event()
+    release = threading.Event()
+
+    def load_frame_index(path):
+        indexing.set()
+        release.wait(5)
+
+    monkeypatch.setattr(fastapi_http_server, "load_frame_index", load_frame_index)
+    try:
+        client.post("/recordings/start", json={"filename": "first.mp4"})
+        client.post("/recordings/stop", json={"recording_id": "first"})
+        assert indexing.wait(5)
+        started = time.perf_counter()
+        response = client.post("/recordings/start", json={"filename": "second.mp4"})
+        assert response.json()["status"] == RecordingStatus.RECORDING.value
+        assert time.perf_counter() - started < 1
+    finally:
+        release.set()
+    client.post("/recordings/stop", json={"recording_id": "second"})
+    wait_for_finishing()
+
+
+def test_finished_recordings_are_offloaded(monkeypatch, tmp_path):
+    from offload import LocalDirectoryTarget, Offloader, OffloadQueue
+
+    offloader = Offloader(
+        OffloadQueue(str(tmp_path / "offload.sqlite")),
+        LocalDirectoryTarget(str(tmp_path / "archive")),
+        RECORDINGS_DIR,
+    )
+    monkeypatch.setattr(fastapi_http_server, "offloader", offloader)
+    client.post("/recordings/start", json={"filename": "test.mp4"})
+    open(os.path.join(RECORDINGS_DIR, "test.mp4"), "wb").close()
+    client.post("/recordings/stop", json={"recording_id": "test"})
+    wait_for_finishing()
+    assert client.get("/offload").json()["files"]["pending"] == 2
+
+    while offloader.process_one():
+        pass
+    assert client.get("/offload").json()["files"]["done"] == 2
+    assert sorted(os.listdir(tmp_path / "archive")) == [
+        "test.metadata.json",
+        "test.mp4",
+    ]
+
+
+def test_deleted_recordings_leave_the_catalog(tmp_path):
+    from offload import LocalDirectoryTarget, Offloader, OffloadQueue
+
+    offloader = Offloader(
+        OffloadQueue(str(tmp_path / "offload.sqlite")),
+        LocalDirectoryTarget(str(tmp_path / "archive")),
+        RECORDINGS_DIR,
+        delete_after_upload=True,
+        on_deleted=fastapi_http_server.offloaded_file_deleted,
+    )
+    client.post("/recordings/start", json={"filename": "test.mp4"})
+    open(os.path.join(RECORDINGS_DIR, "test.mp4"), "wb").close()
+    client.post("/recordings/stop", json={"recording_id": "test"})
+    offloader.enqueue("test", fastapi_http_server.recording_files(recordings["test"]))
+
+    while offloader.process_one():
+        pass
+    assert "test" not in recordings
+    assert client.get("/recordings/test").status_code == 404
+    assert sorted(os.listdir(tmp_path / "archive")) == [
+        "test.metadata.json",
+        "test.mp4",
+    ]
+
+
+def test_offload_not_configured():
+    assert client.get("/offload").status_code == 404
+
+
+def test_status_and_metrics(monkeypatch):
+    from metrics import LatencyHistogram, RecorderStatus
+
+    histogram = LatencyHistogram()
+    histogram.observe_ns(2_000_000)
+    status = RecorderStatus(
+        streaming=True,
+        recording=True,
+        frames_delivered=10,
+        frames_dropped={"writer": 1},
+        stages={
+            "write": histogram.snapshot(),
+            "sink_pop": LatencyHistogram().snapshot(),
+        },
+    )
+    monkeypatch.setattr(fastapi_http_server, "status_func", lambda: status)
+
+    camera = client.get("/status").json()["cameras"]["default"]
+    assert camera["frames_delivered"] == 10
+    assert camera["frames_dropped"] == {"writer": 1}
+    assert 1.0 < camera["stages"]["write"]["p50_ms"] <= 2.5
+    assert camera["stages"]["sink_pop"] == {
+        "count": 0,
+        "mean_ms": None,
+        "p50_ms": None,
+        "p99_ms": None,
+        "max_ms": None,
+    }
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'recorder_frames_delivered_total{camera="default"} 10' in response.text
+
+
+def test_status_without_cameras():
+    assert client.get("/status").json() == {"cameras": {}}
+
+
+@pytest.fixture
+def server_url():
+    # event streams never end, so they are read from a real server that
+    # notices when the client disconnects
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join()
+
+
+def read_events(url, last_event_id, count, **params):
+    received = []
+    headers = {"Last-Event-ID": str(last_event_id)}
+    with httpx.stream(
+        "GET", url, headers=headers, params=params, timeout=5
+    ) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line.removeprefix("event: ")
+            elif line.startswith("data: "):
+                received.append((event, json.loads(line.removeprefix("data: "))))
+                if len(received) == count:
+                    return received
+
+
+def test_recording_events(server_url):
+    last_event_id = fastapi_http_server.events.publish("marker", {}).event_id
+    client.post("/recordings/start", json={"filename": "test.mp4"})
+    client.post("/recordings/stop", json={"recording_id": "test"})
+
+    received = read_events(
+        f"{server_url}/events",
+        last_event_id,
+        2,
+        types=["recording_started", "recording_stopped"],
+    )
+    assert [event for event, _ in received] == [
+        "recording_started",
+        "recording_stopped",
+    ]
+    assert received[1][1]["recording_id"] == "test"
+    assert received[1][1]["status"] == RecordingStatus.STOPPED.value
+
+
+def test_progress_and_drop_events(monkeypatch, server_url):
+    from metrics import RecorderStatus
+
+    status = RecorderStatus(
+        streaming=True,
+        recording=True,
+        frames_delivered=100,
+        frames_written=40,
+        frames_dropped={"sink_underrun": 0},
+    )
+    monkeypatch.setattr(fastapi_http_server, "status_func", lambda: status)
+    client.post("/recordings/start", json={"filename": "test.mp4"})
+
+    last_event_id = fastapi_http_server.events.publish("marker", {}).event_id
+    last_dropped = {}
+    fastapi_http_server.publish_progress(last_dropped)
+    status.frames_dropped = {"sink_underrun": 2}
+    fastapi_http_server.publish_progress(last_dropped)
+
+    received = read_events(f"{server_url}/events", last_event_id, 3)
+    assert [event for event, _ in received] == [
+        "recording_progress",
+        "frames_dropped",
+        "recording_progress",
+    ]
+    assert received[0][1]["recording_id"] == "test"
+    assert received[0][1]["frames_written"] == 40
+    assert received[1][1]["new"] == 2
+
+
+def test_accounting_is_not_overwritten_by_pending_patches(monkeypatch):
+    from threading import Event
+    from metrics import RecorderStatus
+
+    monkeypatch.setattr(
+        fastapi_http_server,
+        "status_func",
+        lambda: RecorderStatus(streaming=True, recording=False, frames_missing=3),
+    )
+    release = Event()
+    monkeypatch.setattr(fastapi_http_server, "stop_recording_func", release.wait)
+    with TestClient(app) as client:
+        client.post("/recordings/start", json={"filename": "test.mp4"})
+        response = client.post(
+            "/recordings/stop?wait=false", json={"recording_id": "test"}
+        )
+        command_id = response.json()["recording"]["command_id"]
+        # queued while stopping, with the metadata from before the stop
+        client.patch("/recordings/test/metadata", json={"metadata": {"b": "2"}})
+        release.set()
+        deadline = time.monotonic() + 5
+        while client.get(f"/commands/{command_id}").json()["status"] != "done":
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        time.sleep(2 * fastapi_http_server.METADATA_FLUSH_INTERVAL_S)
+    with open(os.path.join(RECORDINGS_DIR, "test.metadata.json")) as metadata_file:
+        metadata = json.load(metadata_file)
+    assert metadata["b"] == "2"
+    assert metadata["frames_missing"] == "3"
+
+
+def test_progress_and_accounting_of_a_named_default_camera(monkeypatch):
+    # as in headless with a single camera: no manager, the camera has its id
+    from metrics import RecorderStatus
+
+    status = RecorderStatus(
+        streaming=True, recording=True, frames_written=7, frames_missing=3
+    )
+    monkeypatch.setattr(fastapi_http_server, "status_func", lambda: status)
+    monkeypatch.setattr(fastapi_http_server, "default_camera_id", "12345")
+    assert list(client.get("/status").json()["cameras"]) == ["12345"]
+    client.post("/recordings/start", json={"filename": "test.mp4"})
+
+    published = []
+    monkeypatch.setattr(
+        fastapi_http_server.events,
+        "publish",
+        lambda event, data: published.append((event, data)),
+    )
+    fastapi_http_server.publish_progress({})
+    assert published == [
+        (
+            "recording_progress",
+            {
+                "recording_id": "test",
+                "camera_id": None,
+                "frames_written": 7,
+                "frames_dropped": 0,
+                "frames_per_second": 0.0,
+            },
+        )
+    ]
+    response = client.post("/recordings/stop", json={"recording_id": "test"})
+    assert response.json()["recording"]["metadata"]["frames_missing"] == "3"
+
+
+def test_patch_metadata():
+    # pending writes belong to the app's event loop, which the client keeps
+    # running across requests only inside the with block
+    with TestClient(app) as client:
+        client.post(
+            "/recordings/start", json={"filename": "test.mp4", "metadata": {"a": "1"}}
+        )
+        response = client.patch(
+            "/recordings/test/metadata",
+            json={"metadata": {"b": "2"}, "events": [{"trial": 1}, {"trial": 2}]},
+        )
+        assert response.json() == {
+            "metadata": {"a": "1", "b": "2"},
+            "events_appended": 2,
+        }
+        response = client.patch(
+            "/recordings/test/metadata?flush=true",
+            json={"remove": ["a"], "events": [{"trial": 3}]},
+        )
+        assert response.json()["metadata"] == {"b": "2"}
+
+        with open(os.path.join(RECORDINGS_DIR, "test.metadata.json")) as metadata_file:
+            assert json.load(metadata_file) == {"b": "2"}
+        with open(os.path.join(RECORDINGS_DIR, "test.events.jsonl")) as events_file:
+            assert [json.loads(line)["trial"] for line in events_file] == [1, 2, 3]
+        response = client.post("/recordings/stop", json={"recording_id": "test"})
+        recording = response.json()["recording"]
+    assert recording["events_url"].endswith("/files/test.events.jsonl")
+    assert recordings["test"].metadata == {"b": "2"}
+
+
+def test_patch_metadata_of_unknown_recording():
+    response = client.patch("/recordings/unknown/metadata", json={})
+    assert response.status_code == 404
+
+
+def test_triggered_start_and_frame_accounting_in_metadata(monkeypatch):
+    from metrics import RecorderStatus
+
+    started = []
+
+    def start(filename, frame_rate=None, triggered_mode=False, settings=None):
+        started.append((frame_rate, triggered_mode, settings))
+
+    status = RecorderStatus(
+        streaming=True, recording=False, frames_missing=3, missed_triggers=1
+    )
+    monkeypatch.setattr(fastapi_http_server, "start_recording_func", start)
+    monkeypatch.setattr(fastapi_http_server, "status_func", lambda: status)
+    client.post(
+        "/recordings/start",
+        json={
+            "filename": "test",
+            "metadata": {"a": "1"},
+            "triggered": True,
+            "frame_rate": 30.0,
+            "fill_gaps": True,
+        },
+    )
+    frame_rate, triggered_mode, settings = started[0]
+    assert (frame_rate, triggered_mode, settings.fill_gaps) == (30.0, True, True)
+
+    response = client.post("/recordings/stop", json={"recording_id": "test"})
+    expected = {
+        "a": "1",
+        "frames_missing": "3",
+        "missed_triggers": "1",
+        "placeholder_frames": "0",
+    }
+    assert response.json()["recording"]["metadata"] == expected
+    with open(os.path.join(RECORDINGS_DIR, "test.metadata.json")) as metadata_file:
+        assert json.load(metadata_file) == expected
+
+
+def test_arm_and_fire_recording(monkeypatch):
+    calls = []
+
+    def arm(filename, frame_rate=None, triggered_mode=False, settings=None):
+        calls.append(("arm", filename))
+
+    def fire(at_ns=None, at_frame=None):
+        calls.append(("fire", at_ns, at_frame))
+
+    monkeypatch.setattr(fastapi_http_server, "arm_recording_func", arm)
+    monkeypatch.setattr(fastapi_http_server, "fire_recording_func", fire)
+    response = client.post("/recordings/arm", json={"filename": "test"})
+    assert response.json()["status"] == RecordingStatus.ARMED.value
+    # an armed recording occupies the camera
+    assert client.post("/recordings/start", json={"filename": "b"}).status_code == 400
+
+    response = client.post("/recordings/test/fire", json={"at_frame": 10})
+    assert response.json()["status"] == RecordingStatus.RECORDING.value
+    assert calls == [("arm", "test.mp4"), ("fire", None, 10)]
+    assert client.post("/recordings/test/fire").status_code == 400
+    assert client.post("/recordings/unknown/fire").status_code == 404
+
+
+def test_cameras_arm_and_fire_all(monkeypatch):
+    from recorder_manager import RecorderManager
+
+    manager = RecorderManager()
+    manager.add_recorder("left", simulated_recorder())
+    manager.add_recorder("right", simulated_recorder())
+    monkeypatch.setattr(fastapi_http_server, "recorder_manager", manager)
+    try:
+        assert client.post("/cameras/fire").status_code == 400
+        response = client.post("/cameras/arm", json={"filename": "session"})
+        assert set(response.json()["recordings"]) == {"left", "right"}
+        assert recordings["session_left"].status == RecordingStatus.ARMED
+        assert client.post("/cameras/fire", json={"at_frame": 1}).status_code == 400
+
+        at_ns = time.time_ns()
+        response = client.post("/cameras/fire", json={"at_ns": at_ns})
+        assert response.json()["at_ns"] == at_ns
+        assert recordings["session_right"].status == RecordingStatus.RECORDING
+        for recorder in manager.recorders.values():
+            while not recorder.is_recording():
+                time.sleep(0.01)
+
+        response = client.post("/cameras/stop")
+        assert set(response.json()["recordings"]) == {"left", "right"}
+    finally:
+        manager.close()
+
+
+def test_fire_one_camera_armed_through_cameras(monkeypatch):
+    from recorder_manager import RecorderManager
+
+    def fire_default(at_ns=None, at_frame=None):
+        raise AssertionError("fired the default camera")
+
+    manager = RecorderManager()
+    manager.add_recorder("left", simulated_recorder())
+    manager.add_recorder("right", simulated_recorder())
+    monkeypatch.setattr(fastapi_http_server, "recorder_manager", manager)
+    monkeypatch.setattr(fastapi_http_server, "fire_recording_func", fire_default)
+    try:
+        client.post("/cameras/arm", json={"filename": "session"})
+        response = client.post("/recordings/session_left/fire")
+        assert response.status_code == 200
+        assert recordings["session_left"].status == RecordingStatus.RECORDING
+        assert recordings["session_right"].status == RecordingStatus.ARMED
+        while not manager.get("left").is_recording():
+            time.sleep(0.01)
+        assert manager.get("right").is_armed()
+        client.post("/cameras/stop")
+    finally:
+        manager.close()
+
+
+def test_stop_one_camera_started_through_cameras(monkeypatch):
+    from recorder_manager import RecorderManager
+
+    def stop_default():
+        raise AssertionError("stopped the default camera")
+
+    manager = RecorderManager()
+    manager.add_recorder("left", simulated_recorder())
+    manager.add_recorder("right", simulated_recorder())
+    monkeypatch.setattr(fastapi_http_server, "recorder_manager", manager)
+    monkeypatch.setattr(fastapi_http_server, "default_camera_id", "left")
+    monkeypatch.setattr(fastapi_http_server, "stop_recording_func", stop_default)
+    try:
+        client.post("/cameras/left/start", json={"filename": "first"})
+        client.post("/cameras/right/start", json={"filename": "second"})
+        response = client.post("/recordings/stop", json={"recording_id": "second"})
+        assert response.status_code == 200
+        assert recordings["second"].status == RecordingStatus.STOPPED
+        assert not manager.get("right").is_recording()
+        assert manager.get("left").is_recording()
+        assert recordings["first"].status == RecordingStatus.RECORDING
+        client.post("/cameras/stop")
+    finally:
+        manager.close()
+
+
+def test_import_has_no_side_effects(tmp_path):
+    code = (
+        "import os, sys; os.chdir(sys.argv[1]); import fastapi_http_server; "
+        "assert not os.listdir('.'), os.listdir('.'); "
+        "assert 'imagingcontrol4' not in sys.modules, 'imagingcontrol4'"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code, str(tmp_path)], capture_output=True
+    )
+    assert result.returncode == 0, result.stderr.decode()
+
+
+def test_create_app_with_config(monkeypatch, tmp_path):
+
+    # create_app configures the module, restore it for the other tests
+    for name in (
+        "RECORDINGS_DIR",
+        "HOST",
+        "PORT",
+        "start_recording_func",
+        "stop_recording_func",
+        "status_func",
+    ):
+        monkeypatch.setattr(
+            fastapi_http_server, name, getattr(fastapi_http_server, name)
+        )
+    monkeypatch.setattr(fastapi_http_server, "recordings", recordings)
+    monkeypatch.setattr(fastapi_http_server, "app", app)
+    monkeypatch.setattr(
+        fastapi_http_server.metadata_writer, "directory", RECORDINGS_DIR
+    )
+    data = tmp_path / "data"
+    recorder = SimulatedRecorder(width=32, height=24, recordings_dir=str(data))
+    recorder.start_streaming()
+    config = fastapi_http_server.ServerConfig(
+        recordings_dir=str(data),
+        port=9000,
+        start_func=recorder.start_recording,
+        stop_func=recorder.stop_recording,
+        status=recorder.get_status,
+    )
+    configured = fastapi_http_server.create_app(config)
+    try:
+        client = TestClient(configured)
+        response = client.post("/recordings/start", json={"filename": "test"})
+        assert response.json()["video_url"] == "http://localhost:9000/files/test.mp4"
+        assert recorder.video_writer.file_name == str(data / "test.mp4")
+        time.sleep(0.05)
+        response = client.post("/recordings/stop", json={"recording_id": "test"})
+        recording = response.json()["recording"]
+        assert recording["frames_url"] == "http://localhost:9000/files/test.frames.bin"
+        assert client.get("/files/test.frames.bin").status_code == 200
+        with open(data / "test.metadata.json") as metadata_file:
+            assert "frames_missing" in json.load(metadata_file)
+        assert not os.path.exists(os.path.join(RECORDINGS_DIR, "test.frames.bin"))
+    finally:
+        recorder.stop_streaming()
+        fastapi_http_server.recordings.close()
+
+
+def test_disk_admission(monkeypatch, tmp_path):
+    import shutil
+    from types import SimpleNamespace
+    from disk_admission import DiskAdmission
+
+    disk = DiskAdmission(
+        RECORDINGS_DIR, reserve_bytes=int(1e9), cache_path=str(tmp_path / "disk.json")
+    )
+    disk.cache.put(RECORDINGS_DIR, 100e6)
+    monkeypatch.setattr(fastapi_http_server, "disk_admission", disk)
+    monkeypatch.setattr(
+        fastapi_http_server, "estimate_func", lambda frame_rate, settings: 10e6
+    )
+    free = [100e9]
+    monkeypatch.setattr(
+        shutil, "disk_usage", lambda path: SimpleNamespace(free=free[0])
+    )
+
+    response = client.post("/recordings/preflight", json={"filename": "test"})
+    assert response.json()["ok"]
+    assert response.json()["required_bytes_per_second"] == 10e6
+
+    free[0] = 1.2e9
+    response = client.post("/recordings/start", json={"filename": "test"})
+    assert response.status_code == 507
+    assert "full after 20 s" in response.json()["detail"]
+    assert "test" not in recordings
+
+    # forced recordings start with the refusal as a warning
+    response = client.post(
+        "/recordings/start", json={"filename": "test", "force": True}
+    )
+    assert response.status_code == 200
+    assert response.json()["estimated_bytes_per_second"] == 10e6
+    assert "full after 20 s" in response.json()["warnings"][0]
+
+    # running out of space stops the recording
+    asyncio.run(fastapi_http_server.stop_if_disk_full())
+    assert recordings["test"].status == RecordingStatus.RECORDING
+    free[0] = 1.05e9
+    asyncio.run(fastapi_http_server.stop_if_disk_full())
+    while recordings["test"].status != RecordingStatus.STOPPED:
+        time.sleep(0.01)
+    assert recordings["test"].warnings[-1] == "Stopped, the disk is almost full"
+
+
+def test_raw_recording_is_stopped_when_full(monkeypatch):
+    from metrics import RecorderStatus
+
+    started = []
+
+    def start(filename, frame_rate=None, triggered_mode=False, settings=None):
+        started.append((filename, settings))
+        open(os.path.join(RECORDINGS_DIR, filename), "wb").close()
+
+    status = RecorderStatus(streaming=True, recording=True)
+    monkeypatch.setattr(fastapi_http_server, "start_recording_func", start)
+    monkeypatch.setattr(fastapi_http_server, "status_func", lambda: status)
+    # only raw recordings end with .raw
+    response = client.post("/recordings/start", json={"filename": "fast.raw"})
+    assert response.status_code == 400
+    response = client.post(
+        "/recordings/start", json={"filename": "fast", "mode": "raw", "max_frames": 10}
+    )
+    assert response.json()["video_filename"] == "fast.raw"
+    filename, settings = started[0]
+    assert (filename, settings.max_frames) == ("fast.raw", 10)
+    asyncio.run(fastapi_http_server.stop_full_recordings())
+    assert recordings["fast"].status == RecordingStatus.RECORDING
+    status.recording_full = True
+    asyncio.run(fastapi_http_server.stop_full_recordings())
+    while recordings["fast"].status != RecordingStatus.STOPPED:
+        time.sleep(0.01)
+    assert recordings["fast"].warnings == ["Stopped, the recording is full"]
+    # raw recordings are catalogued like MP4s
+    recordings.clear()
+    recordings.reconcile()
+    assert recordings["fast"].video_filename == "fast.raw"
+
+
+def test_raw_recording_cannot_fill_gaps():
+    response = client.post(
+        "/recordings/start",
+        json={"filename": "gaps", "mode": "raw", "fill_gaps": True},
+    )
+    assert response.status_code == 400
+    assert "gaps" not in recordings
+
+
+def test_preflight_not_configured():
+    response = client.post("/recordings/preflight", json={"filename": "test"})
+    assert response.status_code == 404
+
+
+def test_frame_index_and_frames(monkeypatch):
+    from ffmpeg_writer import ffmpeg_available
+    from test_frame_index import write_mp4
+
+    monkeypatch.setattr(
+        fastapi_http_server,
+        "start_recording_func",
+        lambda filename, **kwargs: write_mp4(os.path.join(RECORDINGS_DIR, filename)),
+    )
+    client.post("/recordings/start", json={"filename": "test"})
+    assert client.get("/recordings/test/frames/0").status_code == 400
+    client.post("/recordings/stop", json={"recording_id": "test"})
+    # indexed when the recording stopped
+    assert os.path.exists(os.path.join(RECORDINGS_DIR, "test.index.bin"))
+    assert "test.index.bin" in fastapi_http_server.recording_files(recordings["test"])
+
+    assert client.get("/recordings/test/frames/10").status_code == 404
+    assert client.get("/recordings/unknown/frames/0").status_code == 404
+    response = client.get("/recordings/test/frames", params={"count": 1000})
+    assert response.status_code == 422
+    if not ffmpeg_available():
+        assert client.get("/recordings/test/frames/0").status_code == 503
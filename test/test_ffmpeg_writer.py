@@ -0,0 +1,95 @@
+import os
+import time
+import imagingcontrol4 as ic4
+import pytest
+from ffmpeg_writer import (
+    FfmpegVideoWriter,
+    ffmpeg_available,
+    ffmpeg_filename,
+    process_cpu_seconds,
+)
+from recorder import RECORDINGS_DIR, EncoderEngine, EncoderStatistics, RecorderSettings
+from simulated_recorder import SimulatedRecorder
+
+
+def test_command():
+    image_type = ic4.ImageType(ic4.PixelFormat.Mono8, 64, 48)
+    writer = FfmpegVideoWriter("h264", preset="ultrafast", threads=4)
+    command = writer.command("out.mp4", image_type, 30.0)
+    assert command[command.index("-pix_fmt") + 1] == "gray"
+    assert command[command.index("-video_size") + 1] == "64x48"
+    assert command[command.index("-preset") + 1] == "ultrafast"
+    assert command[command.index("-threads") + 1] == "4"
+    assert command[-1] == "out.mp4"
+
+    command = FfmpegVideoWriter("ffv1").command("out.mkv", image_type, 30.0)
+    assert "ffv1" in command and "-preset" not in command
+
+
+def test_unsupported_codec_and_pixel_format():
+    with pytest.raises(ValueError):
+        FfmpegVideoWriter("vp9")
+    image_type = ic4.ImageType(ic4.PixelFormat.YUV422_8, 64, 48)
+    with pytest.raises(ValueError):
+        FfmpegVideoWriter().command("out.mp4", image_type, 30.0)
+
+
+def test_ffmpeg_filename():
+    assert ffmpeg_filename("session.mp4", "h264") == "session.mp4"
+    assert ffmpeg_filename("session.mp4", "ffv1") == "session.mkv"
+
+
+def test_encoder_statistics():
+    statistics = EncoderStatistics(frames=100, encode_s=0.5, elapsed_s=2.0)
+    assert statistics.frames_per_second == 200
+    statistics.encode_cpu_s = 0.2
+    statistics.add_process_cpu(1.0)
+    statistics.add_process_cpu(1.0)
+    assert statistics.cpu_percent == pytest.approx(110)
+    assert EncoderStatistics().cpu_percent is None
+
+
+def test_ffmpeg_statistics_include_flush():
+    # pipe writes return before ffmpeg has encoded the frames
+    statistics = EncoderStatistics(
+        EncoderEngine.FFMPEG.value, frames=100, encode_s=0.01, elapsed_s=1.0
+    )
+    assert statistics.frames_per_second == 100
+    statistics.first_write_ns = 0
+    statistics.file_flushed(4_000_000_000)
+    statistics.file_flushed(2_000_000_000)
+    assert statistics.flushed_s == 4.0
+    assert statistics.frames_per_second == 25
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="needs /proc")
+def test_process_cpu_seconds():
+    started = process_cpu_seconds(os.getpid())
+    end = time.process_time() + 0.05
+    while time.process_time() < end:
+        pass
+    assert process_cpu_seconds(os.getpid()) > started
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+@pytest.mark.parametrize("codec", ["h264", "ffv1", "mjpeg"])
+def test_recording(tmp_path, monkeypatch, codec):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+    recorder = SimulatedRecorder(width=64, height=48, frame_rate=200.0)
+    try:
+        settings = RecorderSettings(encoder=EncoderEngine.FFMPEG, codec=codec)
+        recorder.start_recording("encoded.mp4", settings=settings)
+        end = time.perf_counter() + 5
+        while recorder.encoder_statistics.frames < 50:
+            assert time.perf_counter() < end
+            time.sleep(0.01)
+        recorder.stop_recording()
+    finally:
+        recorder.stop_streaming()
+
+    status = recorder.get_status()
+    assert status.encoder == "ffmpeg"
+    assert status.encoder_frames_per_second > 0
+    path = os.path.join(RECORDINGS_DIR, ffmpeg_filename("encoded.mp4", codec))
+    assert os.path.getsize(path) > 0
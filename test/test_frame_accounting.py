@@ -0,0 +1,29 @@
+from frame_accounting import FrameAccounting
+
+
+def test_gaps_are_counted():
+    accounting = FrameAccounting()
+    assert [accounting.frame(n) for n in (10, 11, 14, 15, 17)] == [0, 0, 2, 0, 1]
+    statistics = accounting.statistics
+    assert statistics.frames_recorded == 5
+    assert statistics.frames_missing == 3
+    assert statistics.gaps == 2
+
+
+def test_restarted_frame_counter_is_not_a_gap():
+    accounting = FrameAccounting()
+    accounting.frame(100)
+    assert accounting.frame(1) == 0
+    assert accounting.frame(3) == 1
+    assert accounting.statistics.frames_missing == 1
+
+
+def test_reset():
+    accounting = FrameAccounting()
+    accounting.frame(1)
+    accounting.frame(5)
+    accounting.trigger_missed()
+    accounting.reset()
+    assert accounting.statistics.frames_missing == 0
+    assert accounting.statistics.missed_triggers == 0
+    assert accounting.frame(9) == 0
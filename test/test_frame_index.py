@@ -0,0 +1,179 @@
+import struct
+
+import numpy as np
+import pytest
+from frame_index import (
+    avc_to_annexb,
+    build_frame_index,
+    frame_index_filename,
+    read_frame_index,
+    write_frame_index,
+)
+
+AVCC = (
+    bytes([1, 0x64, 0, 0x1F, 0xFF, 0xE1])
+    + struct.pack(">H", 4)
+    + b"SPS!"
+    + bytes([1])
+    + struct.pack(">H", 3)
+    + b"PPS"
+)
+
+
+def box(box_type: bytes, *payloads: bytes) -> bytes:
+    payload = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type: bytes, *payloads: bytes) -> bytes:
+    return box(box_type, b"\0\0\0\0", *payloads)
+
+
+def sample(i: int, keyframe: bool) -> bytes:
+    # one length-prefixed NAL unit, an IDR or a non-IDR slice
+    nal = bytes([0x65 if keyframe else 0x41]) + f"frame{i}".encode()
+    return struct.pack(">I", len(nal)) + nal
+
+
+def write_mp4(
+    path,
+    frame_count: int = 10,
+    keyframes=(0, 5),
+    composition_offsets=None,
+    samples_per_chunk: int = 3,
+    width: int = 64,
+    height: int = 48,
+):
+    """A minimal MP4 file with the media data before the movie box, like a
+    file written front to back; returns its samples."""
+    samples = [sample(i, i in keyframes) for i in range(frame_count)]
+    ftyp = box(b"ftyp", b"isom\0\0\0\0isom")
+    chunk_offsets = []
+    position = len(ftyp) + 8
+    for i, data in enumerate(samples):
+        if i % samples_per_chunk == 0:
+            chunk_offsets.append(position)
+        position += len(data)
+
+    visual_sample_entry = (
+        b"\0" * 6
+        + struct.pack(">H", 1)
+        + b"\0" * 16
+        + struct.pack(">HH", width, height)
+        + b"\0" * 50
+    )
+    stsc = struct.pack(">I", 1) + struct.pack(">III", 1, samples_per_chunk, 1)
+    if frame_count % samples_per_chunk:
+        stsc = struct.pack(">I", 2) + stsc[4:]
+        stsc += struct.pack(
+            ">III", len(chunk_offsets), frame_count % samples_per_chunk, 1
+        )
+    tables = [
+        full_box(
+            b"stsd",
+            struct.pack(">I", 1),
+            box(b"avc1", visual_sample_entry, box(b"avcC", AVCC)),
+        ),
+        full_box(b"stts", struct.pack(">III", 1, frame_count, 40)),
+        full_box(
+            b"stss",
+            struct.pack(">I", len(keyframes)),
+            *(struct.pack(">I", k + 1) for k in keyframes),
+        ),
+        full_box(b"stsc", stsc),
+        full_box(
+            b"stsz",
+            struct.pack(">II", 0, frame_count),
+            *(struct.pack(">I", len(data)) for data in samples),
+        ),
+        full_box(
+            b"stco",
+            struct.pack(">I", len(chunk_offsets)),
+            *(struct.pack(">I", offset) for offset in chunk_offsets),
+        ),
+    ]
+    if composition_offsets is not None:
+        tables.append(
+            full_box(
+                b"ctts",
+                struct.pack(">I", frame_count),
+                *(struct.pack(">Ii", 1, offset) for offset in composition_offsets),
+            )
+        )
+
+    def track(handler: bytes, *boxes: bytes) -> bytes:
+        hdlr = full_box(b"hdlr", b"\0\0\0\0", handler, b"\0" * 12, b"\0")
+        mdhd = full_box(b"mdhd", struct.pack(">IIII", 0, 0, 1000, 0), b"\0" * 4)
+        return box(b"trak", box(b"mdia", mdhd, hdlr, *boxes))
+
+    moov = box(
+        b"moov",
+        track(b"soun"),
+        track(b"vide", box(b"minf", box(b"stbl", *tables))),
+    )
+    with open(path, "wb") as video_file:
+        video_file.write(ftyp + box(b"mdat", *samples) + moov)
+    return samples
+
+
+def test_build_frame_index(tmp_path):
+    path = tmp_path / "test.mp4"
+    samples = write_mp4(path)
+    index = build_frame_index(str(path))
+    assert (index.width, index.height, index.codec) == (64, 48, b"avc1")
+    assert index.timescale == 1000
+    assert index.extradata == AVCC
+    assert index.frame_count == 10
+    assert list(np.flatnonzero(index.samples["keyframe"])) == [0, 5]
+    assert list(index.samples["pts"]) == list(range(0, 400, 40))
+    assert index.timestamp_ns(2) == 80_000_000
+    data = path.read_bytes()
+    for record, expected in zip(index.samples, samples):
+        offset = int(record["offset"])
+        assert data[offset : offset + int(record["size"])] == expected
+
+
+def test_frame_index_file(tmp_path):
+    write_mp4(tmp_path / "test.mp4")
+    index = build_frame_index(str(tmp_path / "test.mp4"))
+    path = frame_index_filename(str(tmp_path / "test.mp4"))
+    assert path.endswith("test.index.bin")
+    write_frame_index(path, index)
+    read = read_frame_index(path)
+    assert read.extradata == index.extradata
+    assert (read.width, read.height, read.timescale) == (64, 48, 1000)
+    assert np.array_equal(read.samples, index.samples)
+
+    (tmp_path / "other.bin").write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        read_frame_index(str(tmp_path / "other.bin"))
+
+
+def test_reordered_frames(tmp_path):
+    # decode order I P B B I P B B: every P frame is shown after its B frames
+    offsets = [40, 120, 0, 0, 40, 120, 0, 0]
+    write_mp4(tmp_path / "test.mp4", 8, (0, 4), offsets)
+    index = build_frame_index(str(tmp_path / "test.mp4"))
+    assert list(index.ranks) == [0, 3, 1, 2, 4, 7, 5, 6]
+    # a B frame needs the P frame decoded before it
+    assert index.decode_span(1, 1) == (0, 2)
+    assert index.decode_span(3, 3) == (0, 1)
+    assert index.decode_span(5, 6) == (4, 7)
+    assert index.decode_span(2, 4) == (0, 4)
+
+
+def test_file_without_movie_box(tmp_path):
+    (tmp_path / "test.mp4").write_bytes(box(b"ftyp", b"isom") + box(b"mdat", b"x"))
+    with pytest.raises(ValueError):
+        build_frame_index(str(tmp_path / "test.mp4"))
+
+
+def test_avc_to_annexb():
+    stream = avc_to_annexb(AVCC, [sample(0, True), sample(1, False)])
+    assert stream.split(b"\0\0\0\1") == [
+        b"",
+        b"SPS!",
+        b"PPS",
+        b"\x65frame0",
+        b"\x41frame1",
+    ]
@@ -0,0 +1,51 @@
+import os
+import time
+import numpy as np
+import pytest
+from frame_log import FrameLog, read_frame_log
+from recorder import RECORDINGS_DIR
+from simulated_recorder import SimulatedRecorder
+
+
+def test_records_are_flushed_in_batches(tmp_path):
+    path = str(tmp_path / "test.frames.bin")
+    log = FrameLog(path, batch_size=4)
+    for i in range(10):
+        log.append(i, i * 10, i * 100)
+        if i == 4:
+            # only the first full batch has been written so far
+            assert len(read_frame_log(path)) == 4
+    log.close()
+
+    records = read_frame_log(path)
+    assert len(records) == 10
+    assert list(records["frame_number"]) == list(range(10))
+    assert records["device_timestamp_ns"][7] == 70
+    assert records["host_timestamp_ns"][9] == 900
+
+
+def test_not_a_frame_log(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"\x00" * 64)
+    with pytest.raises(ValueError):
+        read_frame_log(str(path))
+
+
+def test_recorder_writes_sidecar(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+    recorder = SimulatedRecorder(width=32, height=24, frame_rate=200.0)
+    before = time.time_ns()
+    recorder.start_recording("session.mp4")
+    end = time.perf_counter() + 5
+    while recorder.get_writer_statistics().frames_written < 20:
+        assert time.perf_counter() < end
+        time.sleep(0.005)
+    recorder.stop_recording()
+    recorder.stop_streaming()
+
+    records = read_frame_log(os.path.join(RECORDINGS_DIR, "session.frames.bin"))
+    assert len(records) == recorder.get_writer_statistics().frames_written
+    assert np.all(np.diff(records["frame_number"].astype(np.int64)) == 1)
+    assert np.all(records["host_timestamp_ns"] >= before)
+    assert np.all(np.diff(records["device_timestamp_ns"].astype(np.int64)) > 0)
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+import numpy as np
+import pytest
+from frame_processing import FrameProcessor, MotionEnergy, RoiMeanIntensity
+from frame_writer import SharedBuffer
+from recorder import RECORDINGS_DIR
+from simulated_recorder import SimulatedRecorder
+
+
+class FakeBuffer:
+    def __init__(self, array):
+        self.array = array
+        self.released = threading.Event()
+
+    def numpy_wrap(self):
+        return self.array
+
+    def release(self):
+        self.released.set()
+
+
+def test_stage_gets_read_only_view_without_copy():
+    array = np.arange(12, dtype=np.uint8).reshape(3, 4, 1)
+    buf = FakeBuffer(array)
+    frame = SharedBuffer(buf)
+    views = []
+    processor = FrameProcessor()
+    processor.register_stage("view", views.append)
+
+    assert processor.submit(frame, 1)
+    frame.release()
+    assert buf.released.wait(timeout=5)
+
+    view = views[0]
+    assert np.shares_memory(view, array)
+    assert not view.flags.writeable
+    processor.shutdown()
+
+
+def test_busy_stage_skips_frames_and_bounds_buffers():
+    gate = threading.Event()
+    processor = FrameProcessor(max_in_flight=1)
+    processor.register_stage("slow", lambda frame: gate.wait(), budget_ms=1e3)
+
+    buffers = [FakeBuffer(np.zeros((2, 2, 1), np.uint8)) for _ in range(3)]
+    frames = [SharedBuffer(buf) for buf in buffers]
+    assert processor.submit(frames[0], 0)
+    assert not processor.submit(frames[1], 1)
+    assert not processor.submit(frames[2], 2)
+    for frame in frames:
+        frame.release()
+
+    assert buffers[1].released.is_set()
+    assert buffers[2].released.is_set()
+    assert not buffers[0].released.is_set()
+
+    gate.set()
+    assert buffers[0].released.wait(timeout=5)
+    stats = processor.get_statistics()["slow"]
+    assert stats.frames_processed == 1
+    assert stats.frames_skipped == 2
+    processor.shutdown()
+
+
+def test_stage_over_budget_is_disabled():
+    processor = FrameProcessor(max_consecutive_overruns=2)
+    processor.register_stage("sleepy", lambda frame: time.sleep(0.01), budget_ms=0.1)
+    for i in range(2):
+        frame = SharedBuffer(FakeBuffer(np.zeros((2, 2, 1), np.uint8)))
+        processor.submit(frame, i)
+        frame.release()
+        while processor._in_flight:
+            time.sleep(0.001)
+
+    stats = processor.get_statistics()["sleepy"]
+    assert stats.budget_overruns == 2
+    assert not stats.enabled
+    processor.shutdown()
+
+
+def test_builtin_stages():
+    frame = np.zeros((8, 8, 1), np.uint8)
+    frame[2:4, 2:4] = 100
+    assert RoiMeanIntensity(2, 2, 2, 2)(frame) == 100.0
+    assert RoiMeanIntensity(0, 0, 2, 2)(frame) == 0.0
+
+    motion = MotionEnergy(subsample=1)
+    assert motion(frame) == 0.0
+    assert motion(frame) == 0.0
+    moved = np.roll(frame, 1, axis=1)
+    assert motion(moved) == pytest.approx(4 * 100 / 64)
+
+
+def test_recorder_runs_stages_and_returns_buffers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+    recorder = SimulatedRecorder(width=64, height=48, frame_rate=200.0)
+    results = []
+    recorder.register_processing_stage(
+        "roi",
+        RoiMeanIntensity(0, 0, 16, 16),
+        on_result=lambda name, n, value: results.append((name, n, value)),
+    )
+    recorder.start_recording("processed.mp4")
+    end = time.perf_counter() + 5
+    while len(results) < 10 and time.perf_counter() < end:
+        time.sleep(0.005)
+    recorder.stop_recording()
+    recorder.unregister_processing_stage("roi")
+    recorder.frame_processor.shutdown()
+
+    assert len(results) >= 10
+    assert all(name == "roi" for name, _, _ in results)
+    frame_numbers = [n for _, n, _ in results]
+    assert frame_numbers == sorted(frame_numbers)
+
+    # pause the camera, then every allocated buffer must be back in the sink
+    recorder.enable_triggered_recording_mode(True)
+    time.sleep(0.05)
+    sink = recorder.sink
+    allocated = len(sink._free) + len(sink._output)
+    recorder.stop_streaming()
+    assert allocated == 4 + recorder.frame_writer.depth + 2 + 2
@@ -0,0 +1,149 @@
+import os
+import struct
+import subprocess
+import time
+import zlib
+
+import frame_reader
+import numpy as np
+import pytest
+from ffmpeg_writer import ffmpeg_available
+from frame_index import frame_index_filename
+from frame_reader import (
+    DecoderUnavailable,
+    FrameCache,
+    RecordingFrames,
+    encode_png,
+    load_frame_index,
+)
+from recorder import RECORDINGS_DIR, EncoderEngine, RecorderSettings
+from simulated_recorder import SimulatedRecorder
+from test_frame_index import write_mp4
+
+
+def read_png(data: bytes) -> tuple[tuple, bytes]:
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    position = 8
+    chunks = {}
+    while position < len(data):
+        (length,) = struct.unpack_from(">I", data, position)
+        chunk_type = data[position + 4 : position + 8]
+        chunk = data[position + 8 : position + 8 + length]
+        (crc,) = struct.unpack_from(">I", data, position + 8 + length)
+        assert crc == zlib.crc32(chunk_type + chunk)
+        chunks[chunk_type] = chunk
+        position += 12 + length
+    return struct.unpack(">IIBBBBB", chunks[b"IHDR"]), zlib.decompress(chunks[b"IDAT"])
+
+
+def test_encode_png():
+    frame = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+    header, pixels = read_png(encode_png(frame))
+    assert header == (3, 2, 8, 2, 0, 0, 0)
+    assert pixels == b"\0" + frame[0].tobytes() + b"\0" + frame[1].tobytes()
+
+    frame = np.array([[[1], [256]]], dtype=np.uint16)
+    header, pixels = read_png(encode_png(frame))
+    assert header[2:4] == (16, 0)
+    assert pixels == b"\0\x00\x01\x01\x00"
+
+
+def test_frame_cache_evicts_least_recently_used():
+    frame = np.zeros(100, np.uint8)
+    cache = FrameCache(max_bytes=250)
+    cache.put(("a", 0), frame)
+    cache.put(("a", 1), frame)
+    assert cache.get(("a", 0)) is frame
+    cache.put(("a", 2), frame)
+    assert cache.get(("a", 1)) is None
+    assert len(cache) == 2 and cache.nbytes == 200
+    assert (cache.hits, cache.misses) == (1, 1)
+    # frames larger than the whole cache are not kept
+    cache.put(("b", 0), np.zeros(300, np.uint8))
+    assert cache.get(("b", 0)) is None
+
+
+def test_index_is_saved_next_to_the_video(tmp_path):
+    path = str(tmp_path / "test.mp4")
+    write_mp4(path)
+    index = load_frame_index(path)
+    index_path = frame_index_filename(path)
+    written = os.stat(index_path).st_mtime_ns
+    assert load_frame_index(path).frame_count == index.frame_count
+    assert os.stat(index_path).st_mtime_ns == written
+
+
+def test_frames_are_numbered_across_segments(tmp_path):
+    paths = [str(tmp_path / f"test.seg{i:03d}.mp4") for i in range(2)]
+    write_mp4(paths[0], 10)
+    write_mp4(paths[1], 4, keyframes=(0,))
+    frames = RecordingFrames(paths)
+    assert frames.frame_count == 14
+    assert frames.locate(9) == (0, 9)
+    assert frames.locate(10) == (1, 0)
+    assert frames.timestamp_ns(13) == 120_000_000
+    with pytest.raises(IndexError):
+        frames.locate(14)
+
+
+@pytest.mark.skipif(ffmpeg_available(), reason="ffmpeg is installed")
+def test_decoding_needs_ffmpeg(tmp_path):
+    write_mp4(tmp_path / "test.mp4")
+    with pytest.raises(DecoderUnavailable):
+        RecordingFrames([str(tmp_path / "test.mp4")]).frames(0)
+
+
+def fake_ffmpeg(monkeypatch, frame_count: int):
+    def run(command, input, capture_output):
+        stdout = np.arange(frame_count * 48 * 64 * 3, dtype=np.uint8).tobytes()
+        return subprocess.CompletedProcess(command, 0, stdout, b"")
+
+    monkeypatch.setattr(frame_reader, "ffmpeg_available", lambda ffmpeg: True)
+    monkeypatch.setattr(frame_reader.subprocess, "run", run)
+
+
+def test_decoded_frames_are_cached_as_copies(tmp_path, monkeypatch):
+    write_mp4(tmp_path / "test.mp4")
+    # frame 6 is decoded from the keyframe 5 on
+    fake_ffmpeg(monkeypatch, 2)
+    cache = FrameCache()
+    frames = RecordingFrames([str(tmp_path / "test.mp4")], cache)
+    (frame,) = frames.frames(6)
+    assert frame.shape == (48, 64, 3)
+    assert frame.base is None
+    assert cache.get((str(tmp_path / "test.mp4"), 5)).base is None
+
+
+def test_missing_decoded_frames_raise(tmp_path, monkeypatch):
+    write_mp4(tmp_path / "test.mp4")
+    fake_ffmpeg(monkeypatch, 2)
+    with pytest.raises(RuntimeError, match="decoded 2 frames of 3"):
+        RecordingFrames([str(tmp_path / "test.mp4")]).frames(6, 2)
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+def test_decode_frames(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+    recorder = SimulatedRecorder(width=64, height=48, frame_rate=200.0)
+    try:
+        settings = RecorderSettings(encoder=EncoderEngine.FFMPEG, codec="h264")
+        recorder.start_recording("encoded.mp4", settings=settings)
+        end = time.perf_counter() + 5
+        while recorder.encoder_statistics.frames < 50:
+            assert time.perf_counter() < end
+            time.sleep(0.01)
+        recorder.stop_recording()
+    finally:
+        recorder.stop_streaming()
+
+    cache = FrameCache()
+    frames = RecordingFrames([os.path.join(RECORDINGS_DIR, "encoded.mp4")], cache)
+    assert frames.frame_count >= 50
+    decoded = frames.frames(20, 3)
+    assert [frame.shape for frame in decoded] == [(48, 64, 3)] * 3
+    # the frames decoded on the way from the keyframe are cached as well
+    hits = cache.hits
+    assert np.array_equal(frames.frames(21)[0], decoded[1])
+    assert frames.frames(10)[0].shape == (48, 64, 3)
+    assert cache.hits == hits + 2
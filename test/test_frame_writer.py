@@ -0,0 +1,104 @@
+import threading
+import pytest
+from frame_writer import FrameWriter, OverflowPolicy
+
+
+class BlockingWrite:
+    def __init__(self):
+        self.written = []
+        self.gate = threading.Event()
+
+    def __call__(self, frame):
+        self.gate.wait()
+        self.written.append(frame)
+
+
+def test_frames_are_written_in_order():
+    written = []
+    released = []
+    writer = FrameWriter(written.append, released.append, depth=4)
+    writer.start()
+    for i in range(10):
+        assert writer.put(i)
+    writer.stop(drain=True)
+
+    assert written == list(range(10))
+    assert released == list(range(10))
+    stats = writer.get_statistics()
+    assert stats.frames_written == 10
+    assert stats.frames_dropped == 0
+    assert stats.queue_depth == 0
+
+
+def test_put_before_start_releases_frame():
+    released = []
+    writer = FrameWriter(lambda f: None, released.append)
+    assert not writer.put(1)
+    assert released == [1]
+
+
+@pytest.mark.parametrize(
+    "policy, expected_written",
+    [
+        (OverflowPolicy.DROP_NEWEST, [0, 1, 2]),
+        (OverflowPolicy.DROP_OLDEST, [0, 4, 5]),
+    ],
+)
+def test_overflow_policies(policy, expected_written):
+    write = BlockingWrite()
+    released = []
+    writer = FrameWriter(write, released.append, depth=2, overflow_policy=policy)
+    writer.start()
+
+    writer.put(0)
+    # wait until the writer thread has taken frame 0 out of the ring
+    while writer.get_statistics().queue_depth:
+        pass
+    for i in range(1, 6):
+        writer.put(i)
+
+    stats = writer.get_statistics()
+    assert stats.queue_depth == 2
+    assert stats.frames_dropped == 3
+
+    write.gate.set()
+    writer.stop(drain=True)
+    assert write.written == expected_written
+    assert sorted(released) == list(range(6))
+
+
+def test_block_policy_waits_for_writer():
+    write = BlockingWrite()
+    writer = FrameWriter(write, depth=1, overflow_policy=OverflowPolicy.BLOCK)
+    writer.start()
+    writer.put(0)
+    writer.put(1)
+
+    producer = threading.Thread(target=writer.put, args=(2,))
+    producer.start()
+    producer.join(timeout=0.1)
+    assert producer.is_alive()
+
+    write.gate.set()
+    producer.join(timeout=5)
+    assert not producer.is_alive()
+    writer.stop(drain=True)
+    assert write.written == [0, 1, 2]
+    assert writer.get_statistics().frames_dropped == 0
+
+
+def test_write_errors_are_counted_and_frames_released():
+    released = []
+
+    def failing_write(frame):
+        raise RuntimeError("encoder failed")
+
+    writer = FrameWriter(failing_write, released.append)
+    writer.start()
+    writer.put(0)
+    writer.stop(drain=True)
+
+    stats = writer.get_statistics()
+    assert stats.write_errors == 1
+    assert stats.frames_written == 0
+    assert released == [0]
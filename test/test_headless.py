@@ -0,0 +1,24 @@
+import subprocess
+import sys
+from headless import DEFAULT_DEVICE_FILE, parse_args
+from recorder import RECORDINGS_DIR
+
+
+def test_parse_args():
+    args = parse_args([])
+    assert args.device_state == [DEFAULT_DEVICE_FILE]
+    assert args.codec_config is None
+    assert args.recordings_dir == RECORDINGS_DIR
+
+    args = parse_args(["--device-state", "a.json", "b.json", "--port", "9000"])
+    assert args.device_state == ["a.json", "b.json"]
+    assert args.port == 9000
+
+    args = parse_args(["--recordings-dir", "/data/recordings"])
+    assert args.recordings_dir == "/data/recordings"
+
+
+def test_does_not_import_qt():
+    code = "import sys, headless; assert 'PySide6' not in sys.modules, 'PySide6'"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True)
+    assert result.returncode == 0, result.stderr.decode()
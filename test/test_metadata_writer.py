@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import pytest
+import metadata_writer
+from metadata_writer import MetadataWriter
+
+
+def read_lines(path):
+    with open(path) as lines_file:
+        return [json.loads(line) for line in lines_file]
+
+
+def test_updates_are_coalesced(tmp_path, monkeypatch):
+    writes = []
+    write_json_atomic = metadata_writer.write_json_atomic
+
+    async def counting_write(path, data):
+        writes.append(data)
+        await write_json_atomic(path, data)
+
+    monkeypatch.setattr(metadata_writer, "write_json_atomic", counting_write)
+    writer = MetadataWriter(str(tmp_path), flush_interval_s=0.05)
+
+    async def main():
+        for i in range(100):
+            writer.update("a", {"trial": str(i)}, [{"trial": i}])
+        assert writer.has_pending("a")
+        await asyncio.sleep(0.2)
+
+    asyncio.run(main())
+    assert writes == [{"trial": "99"}]
+    assert not writer.has_pending("a")
+    with open(writer.metadata_path("a")) as metadata_file:
+        assert json.load(metadata_file) == {"trial": "99"}
+    assert read_lines(writer.events_path("a")) == [{"trial": i} for i in range(100)]
+    assert not os.path.exists(writer.metadata_path("a") + ".tmp")
+
+
+def test_flush_writes_immediately(tmp_path):
+    writer = MetadataWriter(str(tmp_path), flush_interval_s=60)
+
+    async def main():
+        writer.update("a", events=[{"i": 1}])
+        writer.update("b", {"key": "value"})
+        await asyncio.wait_for(writer.flush(), 5)
+        writer.update("a", events=[{"i": 2}])
+        await asyncio.wait_for(writer.flush("a"), 5)
+
+    asyncio.run(main())
+    assert read_lines(writer.events_path("a")) == [{"i": 1}, {"i": 2}]
+    assert not os.path.exists(writer.metadata_path("a"))
+    with open(writer.metadata_path("b")) as metadata_file:
+        assert json.load(metadata_file) == {"key": "value"}
+
+
+def test_failed_writes_are_retried_and_kept(tmp_path, monkeypatch, caplog):
+    failures = [OSError("disk full"), OSError("disk full")]
+    write_json_atomic = metadata_writer.write_json_atomic
+
+    async def failing_write(path, data):
+        if failures:
+            raise failures.pop()
+        await write_json_atomic(path, data)
+
+    monkeypatch.setattr(metadata_writer, "write_json_atomic", failing_write)
+    writer = MetadataWriter(
+        str(tmp_path), flush_interval_s=60, max_attempts=1, retry_interval_s=0
+    )
+
+    async def main():
+        writer.update("a", {"trial": "1"}, [{"i": 1}])
+        assert not await asyncio.wait_for(writer.flush("a"), 5)
+        assert writer.has_pending("a")
+        # a newer update replaces the metadata and keeps the order of events
+        writer.update("a", {"trial": "2"}, [{"i": 2}])
+        assert not await asyncio.wait_for(writer.flush("a"), 5)
+        writer.max_attempts = 3
+        assert await asyncio.wait_for(writer.flush("a"), 5)
+
+    asyncio.run(main())
+    assert not writer.has_pending("a")
+    assert "disk full" in caplog.text
+    with open(writer.metadata_path("a")) as metadata_file:
+        assert json.load(metadata_file) == {"trial": "2"}
+    assert read_lines(writer.events_path("a")) == [{"i": 1}, {"i": 2}]
+
+
+def test_write_raises_when_it_fails(tmp_path):
+    writer = MetadataWriter(
+        str(tmp_path / "missing"), max_attempts=2, retry_interval_s=0
+    )
+
+    async def main():
+        with pytest.raises(OSError):
+            await asyncio.wait_for(writer.write("a", {"key": "value"}), 5)
+        assert writer.has_pending("a")
+
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+import math
+import time
+import pytest
+from metrics import (
+    CounterRate,
+    EventRate,
+    LatencyHistogram,
+    PeriodicSampler,
+    RecorderStatus,
+    format_prometheus,
+)
+
+MS = 1_000_000
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = LatencyHistogram(bounds_s=(0.001, 0.01, 0.1))
+    for _ in range(90):
+        histogram.observe_ns(MS // 2)
+    for _ in range(10):
+        histogram.observe_ns(50 * MS)
+    histogram.observe_ns(2000 * MS)
+
+    snapshot = histogram.snapshot()
+    assert snapshot.counts == [90, 0, 10, 1]
+    assert snapshot.count == 101
+    assert snapshot.max_s == pytest.approx(2.0)
+    assert snapshot.quantile(0.5) < 0.001
+    assert 0.01 < snapshot.quantile(0.95) <= 0.1
+    assert snapshot.quantile(1.0) == pytest.approx(2.0)
+    assert math.isnan(LatencyHistogram().snapshot().quantile(0.5))
+
+
+def test_event_rate_is_windowed():
+    rate = EventRate(window_s=1.0, resolution_s=0.1)
+    # 100 events per second for 2 s, then nothing
+    for i in range(200):
+        rate.add(now_ns=i * 10 * MS)
+    assert rate.rate(now_ns=2000 * MS) == pytest.approx(100, rel=0.1)
+    assert rate.rate(now_ns=3500 * MS) == 0.0
+
+    rate.reset()
+    assert rate.rate(now_ns=4000 * MS) == 0.0
+
+
+def test_counter_rate():
+    rate = CounterRate(window_s=1.0)
+    assert rate.sample(0, now_ns=0) == 0.0
+    assert rate.sample(10, now_ns=500 * MS) == pytest.approx(20)
+    assert rate.rate() == pytest.approx(20)
+    assert rate.sample(10, now_ns=3000 * MS) == pytest.approx(0)
+    # a reset counter starts over
+    assert rate.sample(2, now_ns=3100 * MS) == 0.0
+
+
+def test_periodic_sampler():
+    samples = []
+    sampler = PeriodicSampler(lambda: samples.append(time.monotonic()), 0.01)
+    sampler.start()
+    deadline = time.monotonic() + 5
+    while len(samples) < 3:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    sampler.stop()
+    count = len(samples)
+    time.sleep(0.05)
+    assert len(samples) == count
+
+
+def test_format_prometheus():
+    histogram = LatencyHistogram(bounds_s=(0.001, 0.01))
+    histogram.observe_ns(MS // 2)
+    histogram.observe_ns(5 * MS)
+    status = RecorderStatus(
+        streaming=True,
+        recording=False,
+        frames_delivered=42,
+        frames_dropped={"sink_underrun": 3},
+        frames_per_second=99.5,
+        encoder="ffmpeg",
+        encoder_frames_per_second=250.0,
+        encoder_cpu_percent=150.0,
+        stages={"write": histogram.snapshot()},
+    )
+    text = format_prometheus({'cam "1"': status})
+    lines = text.splitlines()
+    assert "# TYPE recorder_stage_latency_seconds histogram" in lines
+    assert 'recorder_frames_delivered_total{camera="cam \\"1\\""} 42' in lines
+    assert (
+        'recorder_frames_dropped_total{camera="cam \\"1\\"",reason="sink_underrun"} 3'
+        in lines
+    )
+    assert (
+        'recorder_encoder_cpu_ratio{camera="cam \\"1\\"",engine="ffmpeg"} 1.5' in lines
+    )
+    bucket = 'recorder_stage_latency_seconds_bucket{camera="cam \\"1\\"",stage="write"'
+    assert f'{bucket},le="0.001"}} 1' in lines
+    assert f'{bucket},le="0.01"}} 2' in lines
+    assert f'{bucket},le="+Inf"}} 2' in lines
+    assert (
+        'recorder_stage_latency_seconds_count{camera="cam \\"1\\"",stage="write"} 2'
+        in lines
+    )
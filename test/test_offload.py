@@ -0,0 +1,282 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+import httpx
+import pytest
+from offload import (
+    CHUNK_SIZE,
+    PART_SUFFIX,
+    JobStatus,
+    LocalDirectoryTarget,
+    Offloader,
+    OffloadQueue,
+    TokenBucket,
+    WebDAVTarget,
+    add_offload_arguments,
+    file_sha256,
+    offloader_from_args,
+)
+
+WEBDAV_URL = "http://archive.test/dav"
+
+
+class FakeWebDAV:
+    """In-memory WebDAV server for WebDAVTarget, optionally damaging uploads."""
+
+    def __init__(self, corrupt: bool = False):
+        self.files: dict[str, bytes] = {}
+        self.corrupt = corrupt
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if request.method == "PUT":
+            data = request.read()
+            if self.corrupt and data:
+                data = bytes([data[0] ^ 0xFF]) + data[1:]
+            self.files[path] = data
+            return httpx.Response(201)
+        if path not in self.files:
+            return httpx.Response(404)
+        if request.method == "GET":
+            return httpx.Response(200, content=self.files[path])
+        if request.method == "MOVE":
+            destination = httpx.URL(request.headers["Destination"]).path
+            self.files[destination] = self.files.pop(path)
+            return httpx.Response(201)
+        if request.method == "DELETE":
+            del self.files[path]
+            return httpx.Response(204)
+        return httpx.Response(405)
+
+
+@pytest.fixture
+def directory(tmp_path):
+    directory = tmp_path / "recordings"
+    directory.mkdir()
+    return directory
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return tmp_path / "archive"
+
+
+def write_file(directory, name, size):
+    path = directory / name
+    path.write_bytes(os.urandom(size))
+    return path
+
+
+def make_offloader(tmp_path, directory, archive, **kwargs):
+    queue = OffloadQueue(str(tmp_path / "offload.sqlite"), retry_delay_s=0)
+    return Offloader(
+        queue, LocalDirectoryTarget(str(archive)), str(directory), **kwargs
+    )
+
+
+def test_transfer_and_verify(tmp_path, directory, archive):
+    source = write_file(directory, "a.mp4", 3 * CHUNK_SIZE + 10)
+    offloader = make_offloader(tmp_path, directory, archive)
+    (job_id,) = offloader.enqueue("a", ["a.mp4"])
+
+    assert offloader.process_one()
+    assert not offloader.process_one()
+
+    job = offloader.queue.get(job_id)
+    assert job.status == JobStatus.DONE
+    assert job.size == source.stat().st_size
+    assert job.sha256 == file_sha256(str(source))
+    assert file_sha256(str(archive / "a.mp4")) == job.sha256
+    assert not (archive / ("a.mp4" + PART_SUFFIX)).exists()
+    assert source.exists()
+
+
+def test_delete_after_upload(tmp_path, directory, archive):
+    source = write_file(directory, "a.mp4", 100)
+    deleted = []
+    offloader = make_offloader(
+        tmp_path,
+        directory,
+        archive,
+        delete_after_upload=True,
+        on_deleted=lambda job: deleted.append((job.recording_id, job.filename)),
+    )
+    offloader.enqueue("a", ["a.mp4"])
+    offloader.process_one()
+    assert not source.exists()
+    assert (archive / "a.mp4").exists()
+    assert deleted == [("a", "a.mp4")]
+
+
+def test_webdav_transfer(tmp_path, directory):
+    source = write_file(directory, "a.mp4", 2 * CHUNK_SIZE + 10)
+    server = FakeWebDAV()
+    offloader = Offloader(
+        OffloadQueue(str(tmp_path / "offload.sqlite")),
+        WebDAVTarget(WEBDAV_URL, transport=httpx.MockTransport(server.handle)),
+        str(directory),
+    )
+    (job_id,) = offloader.enqueue("a", ["a.mp4"])
+    offloader.process_one()
+    assert offloader.queue.get(job_id).status == JobStatus.DONE
+    assert server.files == {"/dav/a.mp4": source.read_bytes()}
+
+
+def test_webdav_verifies_content(tmp_path, directory):
+    write_file(directory, "a.mp4", 100)
+    # same size, different bytes
+    server = FakeWebDAV(corrupt=True)
+    offloader = Offloader(
+        OffloadQueue(str(tmp_path / "offload.sqlite"), retry_delay_s=0),
+        WebDAVTarget(WEBDAV_URL, transport=httpx.MockTransport(server.handle)),
+        str(directory),
+    )
+    (job_id,) = offloader.enqueue("a", ["a.mp4"])
+    offloader.process_one()
+    job = offloader.queue.get(job_id)
+    assert job.status == JobStatus.PENDING
+    assert "Verification" in job.error
+    assert server.files == {}
+
+
+def test_offloader_from_args(tmp_path, directory, archive):
+    parser = argparse.ArgumentParser()
+    add_offload_arguments(parser)
+    assert offloader_from_args(parser.parse_args([]), str(directory), bool) is None
+
+    args = parser.parse_args(["--offload-dir", str(archive), "--offload-delete"])
+    offloader = offloader_from_args(args, str(directory), bool)
+    assert offloader.delete_after_upload
+    assert offloader.directory == str(directory)
+    assert (tmp_path / "recordings-offload.sqlite").exists()
+    offloader.queue.close()
+
+
+def test_resume_after_restart(tmp_path, directory, archive):
+    source = write_file(directory, "a.mp4", 2 * CHUNK_SIZE + 10)
+    offloader = make_offloader(tmp_path, directory, archive)
+    (job_id,) = offloader.enqueue("a", ["a.mp4"])
+    # a transfer interrupted after the first chunk
+    assert offloader.queue.claim().job_id == job_id
+    (archive / ("a.mp4" + PART_SUFFIX)).write_bytes(source.read_bytes()[:CHUNK_SIZE])
+    offloader.queue.close()
+
+    restarted = make_offloader(tmp_path, directory, archive)
+    assert restarted.queue.get(job_id).status == JobStatus.PENDING
+    assert restarted.process_one()
+    assert restarted.queue.get(job_id).status == JobStatus.DONE
+    assert (archive / "a.mp4").read_bytes() == source.read_bytes()
+
+
+def test_failed_verification_is_retried(tmp_path, directory, archive):
+    write_file(directory, "a.mp4", 100)
+    offloader = make_offloader(tmp_path, directory, archive)
+    offloader.queue.max_attempts = 2
+    verify = offloader.target.verify
+    offloader.target.verify = lambda *args: False
+    (job_id,) = offloader.enqueue("a", ["a.mp4"])
+
+    offloader.process_one()
+    job = offloader.queue.get(job_id)
+    assert job.status == JobStatus.PENDING
+    assert "Verification" in job.error
+    assert not (archive / ("a.mp4" + PART_SUFFIX)).exists()
+
+    offloader.process_one()
+    assert offloader.queue.get(job_id).status == JobStatus.FAILED
+
+    offloader.target.verify = verify
+    (job_id,) = offloader.enqueue("a", ["a.mp4"])
+    offloader.process_one()
+    assert offloader.queue.get(job_id).status == JobStatus.DONE
+
+
+def test_missing_file_fails(tmp_path, directory, archive):
+    offloader = make_offloader(tmp_path, directory, archive)
+    (job_id,) = offloader.enqueue("a", ["missing.mp4"])
+    offloader.process_one()
+    assert offloader.queue.get(job_id).error
+    assert offloader.queue.counts() == {
+        "pending": 1,
+        "running": 0,
+        "done": 0,
+        "failed": 0,
+    }
+
+
+def test_file_deleted_during_upload(tmp_path, directory, archive):
+    source = write_file(directory, "a.mp4", 100)
+    deleted = []
+
+    class DeletingTarget(LocalDirectoryTarget):
+        def commit(self, name):
+            super().commit(name)
+            source.unlink()
+
+    offloader = Offloader(
+        OffloadQueue(str(tmp_path / "offload.sqlite")),
+        DeletingTarget(str(archive)),
+        str(directory),
+        delete_after_upload=True,
+        on_deleted=deleted.append,
+    )
+    (job_id,) = offloader.enqueue("a", ["a.mp4"])
+    assert offloader.process_one()
+    assert offloader.queue.get(job_id).status == JobStatus.DONE
+    assert [job.job_id for job in deleted] == [job_id]
+
+
+def test_worker_survives_errors(tmp_path, directory, archive):
+    write_file(directory, "b.mp4", 100)
+    offloader = make_offloader(tmp_path, directory, archive, poll_interval_s=0.01)
+    claim = offloader.queue.claim
+    calls = []
+
+    def failing_claim():
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return claim()
+
+    offloader.queue.claim = failing_claim
+    (job_id,) = offloader.enqueue("b", ["b.mp4"])
+    offloader.start()
+    try:
+        deadline = time.monotonic() + 5
+        while offloader.queue.get(job_id).status != JobStatus.DONE:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        offloader.stop()
+
+
+def test_paused_while_busy(tmp_path, directory, archive):
+    write_file(directory, "a.mp4", 100)
+    busy = threading.Event()
+    busy.set()
+    offloader = make_offloader(
+        tmp_path, directory, archive, is_busy=busy.is_set, poll_interval_s=0.01
+    )
+    (job_id,) = offloader.enqueue("a", ["a.mp4"])
+    offloader.start()
+    try:
+        time.sleep(0.2)
+        assert offloader.queue.get(job_id).status == JobStatus.RUNNING
+        busy.clear()
+        deadline = time.monotonic() + 5
+        while offloader.queue.get(job_id).status != JobStatus.DONE:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        offloader.stop()
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=1000, burst=100)
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.consume(100)
+    # the burst is free, the rest takes 200 bytes / 1000 bytes/s
+    assert time.monotonic() - start >= 0.18
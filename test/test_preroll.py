@@ -0,0 +1,95 @@
+import os
+import time
+import pytest
+from frame_log import read_frame_log
+from frame_writer import FrameWriter, OverflowPolicy, SharedBuffer
+from preroll import PrerollBuffer
+from recorder import RECORDINGS_DIR
+from simulated_recorder import SimulatedRecorder
+
+
+class FakeBuffer:
+    def __init__(self):
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+def make_frame(host_timestamp_s: float) -> SharedBuffer:
+    return SharedBuffer(FakeBuffer(), int(host_timestamp_s * 1e9))
+
+
+def test_capacity_from_limits():
+    assert PrerollBuffer(max_seconds=2.0).configure(1000, 100.0) == 201
+    assert PrerollBuffer(max_bytes=10_000).configure(1000, 100.0) == 10
+    assert PrerollBuffer(max_seconds=2.0, max_bytes=10_000).configure(1000, 100.0) == 10
+    assert PrerollBuffer(max_seconds=2.0).configure(1000, None) == 0
+    with pytest.raises(ValueError):
+        PrerollBuffer()
+
+
+def test_oldest_frames_are_evicted():
+    preroll = PrerollBuffer(max_bytes=3)
+    preroll.configure(1, 10.0)
+    frames = [make_frame(i * 0.1) for i in range(5)]
+    for frame in frames:
+        preroll.push(frame)
+
+    assert len(preroll) == 3
+    assert frames[0].buffer.released and frames[1].buffer.released
+    assert preroll.drain() == frames[2:]
+    assert len(preroll) == 0
+
+
+def test_frames_older_than_max_seconds_are_evicted():
+    preroll = PrerollBuffer(max_seconds=0.5)
+    preroll.configure(1, 100.0)
+    frames = [make_frame(t) for t in (0.0, 0.2, 0.4, 0.6, 0.8)]
+    for frame in frames:
+        preroll.push(frame)
+    assert preroll.drain() == frames[2:]
+
+
+def test_prefilled_frames_do_not_count_against_depth():
+    written = []
+    writer = FrameWriter(
+        written.append, depth=1, overflow_policy=OverflowPolicy.DROP_NEWEST
+    )
+    writer.start()
+    assert writer.prefill([0, 1, 2, 3]) == 4
+    writer.put(4)
+    writer.stop(drain=True)
+    assert written[:4] == [0, 1, 2, 3]
+    assert writer.get_statistics().frames_dropped + len(written) == 5
+
+
+def test_recording_starts_with_preroll(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+    recorder = SimulatedRecorder(
+        width=32, height=24, frame_rate=200.0, preroll_seconds=0.1
+    )
+    recorder.start_streaming()
+    assert recorder.preroll.capacity == 21
+    time.sleep(0.3)
+
+    start_ns = time.time_ns()
+    recorder.start_recording("preroll.mp4")
+    started_ns = time.time_ns()
+    assert recorder.preroll_frames_written >= 15
+    time.sleep(0.05)
+    writer_queue = recorder.get_status().stages["writer_queue"]
+    recorder.stop_recording()
+    # the time frames spent in the pre-roll is not writer queue latency
+    assert writer_queue.count <= recorder.video_writer.frames_written - (
+        recorder.preroll_frames_written
+    )
+    assert writer_queue.max_s < 0.05
+    recorder.stop_streaming()
+
+    records = read_frame_log(os.path.join(RECORDINGS_DIR, "preroll.frames.bin"))
+    pre = records[: recorder.preroll_frames_written]
+    assert (pre["host_timestamp_ns"] < started_ns).all()
+    assert start_ns - pre["host_timestamp_ns"][0] <= 0.1e9 + 0.02e9
+    assert (records["frame_number"][1:] - records["frame_number"][:-1] == 1).all()
@@ -0,0 +1,90 @@
+import time
+import imagingcontrol4 as ic4
+import numpy as np
+import pytest
+from frame_writer import SharedBuffer
+from preview import PreviewRenderer
+from simulated_recorder import SimulatedRecorder
+
+
+@pytest.fixture(scope="module", autouse=True)
+def library():
+    # the preview copies frames into buffers from an ic4 BufferPool
+    with ic4.Library.init_context():
+        yield
+
+
+class FakeDisplay:
+    def __init__(self, render_time=0.0):
+        self.render_time = render_time
+        self.shapes = []
+
+    def display_buffer(self, buffer):
+        if buffer is not None:
+            self.shapes.append(buffer.numpy_wrap().shape)
+            time.sleep(self.render_time)
+
+
+class FakeBuffer:
+    def __init__(self, array, pixel_format):
+        self.array = array
+        self.image_type = ic4.ImageType(pixel_format, array.shape[1], array.shape[0])
+        self.released = False
+
+    def numpy_wrap(self):
+        return self.array
+
+    def release(self):
+        self.released = True
+
+
+def test_preview_is_throttled_and_subsampled():
+    recorder = SimulatedRecorder(
+        width=64, height=48, frame_rate=200.0, preview_max_fps=20.0, preview_subsample=2
+    )
+    display = FakeDisplay()
+    recorder.start_streaming(display)
+    time.sleep(0.5)
+    stats = recorder.get_preview_statistics()
+    recorder.stop_streaming()
+
+    assert 5 <= stats.frames_shown <= 12
+    assert stats.frames_skipped > stats.frames_shown
+    assert stats.cpu_time_s > 0
+    assert display.shapes[0] == (24, 32, 1)
+    assert not recorder.preview.is_running()
+
+
+def test_preview_stops_after_device_lost():
+    recorder = SimulatedRecorder(width=64, height=48, preview_max_fps=20.0)
+    recorder.start_streaming(FakeDisplay())
+    recorder.grabber.simulate_device_lost()
+    recorder.stop_streaming()
+    assert not recorder.preview.is_running()
+
+
+def test_slow_display_does_not_starve_sink():
+    recorder = SimulatedRecorder(
+        width=64, height=48, frame_rate=200.0, preview_max_fps=100.0
+    )
+    recorder.start_streaming(FakeDisplay(render_time=0.1))
+    time.sleep(0.5)
+    stats = recorder.grabber.stream_statistics
+    recorder.stop_streaming()
+    assert stats.sink_delivered > 50
+    assert stats.sink_underrun == 0
+
+
+def test_bayer_subsample_keeps_cells():
+    image = np.arange(8 * 8, dtype=np.uint8).reshape(8, 8, 1)
+    buffer = FakeBuffer(image, ic4.PixelFormat.BayerRG8)
+    preview = PreviewRenderer(subsample=2)
+    preview.start(FakeDisplay())
+    try:
+        copy = preview._copy(SharedBuffer(buffer)).numpy_wrap().copy()
+    finally:
+        preview.stop()
+    assert copy.shape == (4, 4, 1)
+    # every other 2x2 cell, in both directions
+    np.testing.assert_array_equal(copy[:2, :2, 0], image[:2, :2, 0])
+    np.testing.assert_array_equal(copy[2:, 2:, 0], image[4:6, 4:6, 0])
@@ -0,0 +1,119 @@
+import os
+import time
+import numpy as np
+import pytest
+import imagingcontrol4 as ic4
+from raw_recording import RawRecording, RawRecordingFull, RawVideoWriter
+from recorder import RECORDINGS_DIR, RecorderSettings, RecordingMode
+from simulated_recorder import SimulatedRecorder
+
+
+class FakeBuffer:
+    def __init__(self, array, frame_number):
+        self.array = array
+        self.meta_data = ic4.ImageBuffer.MetaData(frame_number, frame_number * 1000)
+
+    def numpy_wrap(self):
+        return self.array
+
+
+def test_write_and_read_back(tmp_path):
+    path = str(tmp_path / "test.raw")
+    image_type = ic4.ImageType(ic4.PixelFormat.Mono16, 8, 6)
+    writer = RawVideoWriter(max_frames=10)
+    writer.begin_file(path, image_type, 50.0)
+    frames = [np.full((6, 8, 1), i, np.uint16) for i in range(4)]
+    for i, frame in enumerate(frames):
+        writer.add_frame(FakeBuffer(frame, i + 100))
+    writer.finish_file()
+
+    recording = RawRecording(path)
+    assert len(recording) == 4
+    assert recording.capacity == 10
+    assert recording.pixel_format == "Mono16"
+    assert recording.frame_rate == 50.0
+    assert isinstance(recording.frames, np.memmap)
+    assert recording.frames.shape == (4, 6, 8, 1)
+    np.testing.assert_array_equal(recording[2], frames[2])
+    assert list(recording.index["frame_number"]) == [100, 101, 102, 103]
+    assert recording.index["device_timestamp_ns"][3] == 103000
+    # the file is truncated after the last frame
+    assert os.path.getsize(path) == (
+        recording.frames.offset + 4 * recording.frames[0].nbytes
+    )
+
+
+def test_full_recording_raises(tmp_path):
+    image_type = ic4.ImageType(ic4.PixelFormat.Mono8, 4, 4)
+    writer = RawVideoWriter(max_frames=1)
+    writer.begin_file(str(tmp_path / "full.raw"), image_type, 10.0)
+    writer.add_frame(FakeBuffer(np.zeros((4, 4, 1), np.uint8), 0))
+    with pytest.raises(RawRecordingFull):
+        writer.add_frame(FakeBuffer(np.zeros((4, 4, 1), np.uint8), 1))
+    writer.finish_file()
+    assert len(RawRecording(str(tmp_path / "full.raw"))) == 1
+
+
+def test_empty_recording(tmp_path):
+    path = str(tmp_path / "empty.raw")
+    writer = RawVideoWriter(max_frames=5)
+    writer.begin_file(path, ic4.ImageType(ic4.PixelFormat.BGR8, 4, 2), 10.0)
+    writer.finish_file()
+    recording = RawRecording(path)
+    assert len(recording) == 0
+    assert recording.frames.shape == (0, 2, 4, 3)
+
+
+def test_recorder_raw_mode(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+    recorder = SimulatedRecorder(width=32, height=24, frame_rate=200.0)
+    recorder.start_recording(
+        "session.mp4",
+        settings=RecorderSettings(mode=RecordingMode.RAW, max_frames=1000),
+    )
+    assert recorder.get_filename() == "session.raw"
+    end = time.perf_counter() + 5
+    while recorder.get_writer_statistics().frames_written < 20:
+        assert time.perf_counter() < end
+        time.sleep(0.005)
+    recorder.stop_recording()
+    recorder.stop_streaming()
+
+    recording = RawRecording(os.path.join(RECORDINGS_DIR, "session.raw"))
+    assert len(recording) == recorder.get_writer_statistics().frames_written
+    assert np.all(np.diff(recording.index["frame_number"].astype(np.int64)) == 1)
+
+
+def test_raw_recording_cannot_fill_gaps(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+    recorder = SimulatedRecorder(width=32, height=24)
+    settings = RecorderSettings(mode=RecordingMode.RAW, fill_gaps=True)
+    try:
+        with pytest.raises(ValueError):
+            recorder.start_recording("gaps.mp4", settings=settings)
+        assert not recorder.is_recording()
+    finally:
+        recorder.stop_streaming()
+
+
+def test_recorder_stops_capturing_when_full(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+    recorder = SimulatedRecorder(width=32, height=24, frame_rate=200.0)
+    recorder.start_recording(
+        "full.mp4", settings=RecorderSettings(mode=RecordingMode.RAW, max_frames=5)
+    )
+    end = time.perf_counter() + 5
+    while not recorder.get_status().recording_full:
+        assert time.perf_counter() < end
+        time.sleep(0.005)
+    # the recording keeps its file open until it is stopped
+    assert recorder.is_recording()
+    errors = recorder.get_writer_statistics().write_errors
+    time.sleep(0.05)
+    assert recorder.get_writer_statistics().write_errors == errors
+    recorder.stop_recording()
+    recorder.stop_streaming()
+    assert len(RawRecording(os.path.join(RECORDINGS_DIR, "full.raw"))) == 5
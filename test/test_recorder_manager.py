@@ -0,0 +1,90 @@
+import json
+import os
+import time
+import pytest
+from recorder import RECORDINGS_DIR
+from recorder_manager import (
+    RecorderManager,
+    camera_id_from_state_file,
+    file_name_for_camera,
+)
+from simulated_recorder import SimulatedRecorder
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+    manager = RecorderManager()
+    for camera_id in ("left", "right", "top"):
+        manager.add_recorder(camera_id, SimulatedRecorder(width=32, height=24))
+    yield manager
+    manager.close()
+
+
+def test_file_name_for_camera():
+    assert file_name_for_camera("session.mp4", "left") == "session_left.mp4"
+    assert file_name_for_camera("session", "left") == "session_left.mp4"
+
+
+def test_camera_id_from_state_file(tmp_path):
+    with_serial = tmp_path / "a.json"
+    with_serial.write_text(json.dumps({"device": {"serial": "12345"}}))
+    assert camera_id_from_state_file(str(with_serial)) == "12345"
+    assert camera_id_from_state_file(str(tmp_path / "device.json")) == "device"
+
+
+def test_duplicate_camera(manager):
+    with pytest.raises(ValueError):
+        manager.add_recorder("left", SimulatedRecorder())
+
+
+def test_start_and_stop_all(manager):
+    result = manager.start_all("session.mp4")
+    assert set(result.cameras) == {"left", "right", "top"}
+    for camera in result.cameras.values():
+        assert camera.error is None
+        assert camera.started_ns is not None
+        assert camera.first_frame_ns >= camera.started_ns
+        assert manager.get(camera.camera_id).is_recording()
+    assert result.start_skew_ms is not None
+    assert result.start_skew_ms < 1000
+
+    time.sleep(0.1)
+    assert manager.stop_all() == {"left": None, "right": None, "top": None}
+    for camera_id, recorder in manager.recorders.items():
+        assert not recorder.is_recording()
+        assert recorder.filename == f"session_{camera_id}.mp4"
+        assert recorder.video_writer.frames_written > 0
+
+
+def test_failing_camera_does_not_stop_others(manager):
+    def fail(*args, **kwargs):
+        raise RuntimeError("no device")
+
+    manager.get("right").start_recording = fail
+    result = manager.start_all("session.mp4")
+    assert result.cameras["right"].error == "no device"
+    assert manager.get("left").is_recording()
+    assert manager.get("top").is_recording()
+    assert set(manager.stop_all()) == {"left", "top"}
+
+
+def test_arm_and_fire_all(manager):
+    result = manager.arm_all("session.mp4")
+    for camera in result.cameras.values():
+        assert camera.error is None
+        assert manager.get(camera.camera_id).is_armed()
+
+    at_ns = manager.fire_all()
+    time.sleep(0.1)
+    assert manager.stop_all() == {"left": None, "right": None, "top": None}
+    for recorder in manager.recorders.values():
+        assert recorder.fire_statistics.first_frame_ns >= at_ns
+        assert recorder.video_writer.frames_written > 0
+
+
+def test_estimate_bytes_per_second(manager):
+    rates = manager.estimate_bytes_per_second(frame_rate=10.0)
+    assert set(rates) == {"left", "right", "top"}
+    assert all(rate > 0 for rate in rates.values())
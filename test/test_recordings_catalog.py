@@ -0,0 +1,138 @@
+import os
+import pytest
+from pydantic import BaseModel
+from recordings_catalog import CatalogQuery, RecordingsCatalog
+
+
+class Entry(BaseModel):
+    recording_id: str
+    video_filename: str
+    status: str = "stopped"
+    note: str = ""
+    metadata: dict = {}
+
+
+@pytest.fixture
+def directory(tmp_path):
+    directory = tmp_path / "recordings"
+    directory.mkdir()
+    return directory
+
+
+def open_catalog(tmp_path, directory, loaded=None):
+    def load(filename):
+        if loaded is not None:
+            loaded.append(filename)
+        return Entry(recording_id=filename[:-4], video_filename=filename)
+
+    return RecordingsCatalog(
+        str(tmp_path / "recordings.sqlite"),
+        str(directory),
+        Entry,
+        load,
+        is_persistent=lambda entry: entry.status == "stopped",
+    )
+
+
+def test_live_and_stored_entries(tmp_path, directory):
+    catalog = open_catalog(tmp_path, directory)
+    live = Entry(recording_id="a", video_filename="a.mp4", status="recording")
+    catalog["a"] = live
+    assert catalog["a"] is live
+    assert catalog.live() == [live]
+    assert list(catalog.stored()) == []
+
+    live.status = "stopped"
+    catalog["a"] = live
+    assert catalog.live() == []
+    assert catalog["a"] == live
+    assert catalog["a"] is not live
+    assert "a" in catalog and "b" not in catalog
+    assert len(catalog) == 1
+    catalog.close()
+
+    catalog = open_catalog(tmp_path, directory)
+    assert catalog["a"].video_filename == "a.mp4"
+    del catalog["a"]
+    assert len(catalog) == 0
+    with pytest.raises(KeyError):
+        catalog["a"]
+
+
+def test_reconcile_only_loads_changed_files(tmp_path, directory):
+    for name in ("a.mp4", "b.mp4", "notes.txt"):
+        (directory / name).write_bytes(b"x")
+    loaded = []
+    catalog = open_catalog(tmp_path, directory, loaded)
+    assert loaded == []
+
+    assert catalog.reconcile() == 2
+    assert sorted(loaded) == ["a.mp4", "b.mp4"]
+    assert sorted(catalog) == ["a", "b"]
+
+    loaded.clear()
+    assert catalog.reconcile() == 0
+    assert loaded == []
+    # rewritten in place, which does not change the directory's mtime
+    directory_mtime = os.stat(directory).st_mtime_ns
+    (directory / "a.mp4").write_bytes(b"xy")
+    os.utime(directory / "a.mp4", ns=(1, 1))
+    assert os.stat(directory).st_mtime_ns == directory_mtime
+    assert catalog.reconcile() == 1
+    assert loaded == ["a.mp4"]
+
+    (directory / "b.mp4").unlink()
+    (directory / "c.mp4").write_bytes(b"x")
+    assert catalog.reconcile() == 2
+    assert sorted(catalog) == ["a", "c"]
+
+
+def test_reconcile_skips_live_recordings(tmp_path, directory):
+    (directory / "a.mp4").write_bytes(b"x")
+    catalog = open_catalog(tmp_path, directory)
+    live = Entry(recording_id="a", video_filename="a.mp4", status="recording")
+    catalog["a"] = live
+    catalog.reconcile()
+    assert catalog["a"] is live
+    assert list(catalog) == ["a"]
+
+
+def test_persistent_entries_without_video_file_are_removed(tmp_path, directory):
+    catalog = open_catalog(tmp_path, directory)
+    catalog["a"] = Entry(recording_id="a", video_filename="a.mp4")
+    assert "a" in catalog
+    assert catalog.reconcile() == 1
+    assert "a" not in catalog
+
+
+def test_page_by_modification_time(tmp_path, directory):
+    for i, name in enumerate(["c", "a", "d", "b"]):
+        (directory / f"{name}.mp4").write_bytes(b"x")
+        os.utime(directory / f"{name}.mp4", ns=(i * 10**9, i * 10**9))
+    catalog = open_catalog(tmp_path, directory)
+    catalog.reconcile()
+
+    query = CatalogQuery(sort="modified", modified_after_ns=10**9)
+    rows, cursor = catalog.page(query, limit=2)
+    assert [recording_id for recording_id, _ in rows] == ["a", "d"]
+    rows, cursor = catalog.page(query, cursor, limit=2)
+    assert [recording_id for recording_id, _ in rows] == ["b"]
+    assert cursor is None
+    assert Entry.model_validate_json(rows[0][1]).video_filename == "b.mp4"
+
+
+def test_page_by_metadata_value(tmp_path, directory):
+    catalog = open_catalog(tmp_path, directory)
+    for recording_id, metadata in [
+        ("a", {"trial": 3, "animal": "m1"}),
+        ("b", {"trial": "3"}),
+        ("c", {"trial": 4}),
+    ]:
+        entry = Entry(recording_id=recording_id, video_filename=f"{recording_id}.mp4")
+        entry.metadata = metadata
+        catalog[recording_id] = entry
+
+    rows, _ = catalog.page(CatalogQuery(metadata={"trial": "3"}))
+    assert [recording_id for recording_id, _ in rows] == ["a", "b"]
+    rows, _ = catalog.page(CatalogQuery(metadata={"animal": None}))
+    assert [recording_id for recording_id, _ in rows] == ["a"]
@@ -0,0 +1,148 @@
+import os
+import time
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import imagingcontrol4 as ic4
+from frame_log import FRAME_LOG_SUFFIX, read_frame_log
+from raw_recording import RawRecording
+from recorder import RECORDINGS_DIR, RecorderSettings, RecordingMode
+from segmented_recording import SegmentedVideoWriter, segment_filename
+from simulated_recorder import SimulatedRecorder
+
+
+class FileWriter:
+    """Writes `frame_size` bytes per frame and records the frame numbers it got."""
+
+    writers = []
+
+    def __init__(self, frame_size=100):
+        self.frame_size = frame_size
+        self.frames = []
+        self.finished = False
+        FileWriter.writers.append(self)
+
+    def begin_file(self, path, image_type, frame_rate):
+        self.path = path
+        self.file = open(path, "wb")
+
+    def add_frame(self, buf):
+        self.file.write(b"\0" * self.frame_size)
+        self.file.flush()
+        # buffers are reused once released, so keep the number only
+        self.frames.append(
+            buf if isinstance(buf, int) else buf.meta_data.device_frame_number
+        )
+
+    def finish_file(self):
+        self.file.close()
+        self.finished = True
+
+
+@pytest.fixture(autouse=True)
+def clear_writers():
+    FileWriter.writers = []
+
+
+def test_segment_filename():
+    assert segment_filename("a/b.mp4", 3) == "a/b.seg0003.mp4"
+
+
+def write_frames(writer, path, count):
+    writer.begin_file(path, ic4.ImageType(ic4.PixelFormat.Mono8, 4, 4), 10.0)
+    for i in range(count):
+        writer.add_frame(i)
+    writer.finish_file()
+
+
+def test_rollover_by_frames(tmp_path):
+    path = str(tmp_path / "rec.mp4")
+    writer = SegmentedVideoWriter(FileWriter, max_frames=3)
+    write_frames(writer, path, 7)
+    assert writer.segments == [segment_filename(path, i) for i in range(3)]
+    used = [w for w in FileWriter.writers if w.frames]
+    assert [w.frames for w in used] == [[0, 1, 2], [3, 4, 5], [6]]
+    assert all(w.finished for w in FileWriter.writers)
+    # the segment prepared ahead of time is removed again
+    assert sorted(os.listdir(tmp_path)) == [
+        os.path.basename(s) for s in writer.segments
+    ]
+
+
+def test_rollover_by_bytes(tmp_path):
+    writer = SegmentedVideoWriter(FileWriter, max_bytes=250)
+    write_frames(writer, str(tmp_path / "rec.mp4"), 7)
+    assert [os.path.getsize(s) for s in writer.segments] == [300, 300, 100]
+
+
+def test_rollover_by_device_timestamps(tmp_path):
+    writer = SegmentedVideoWriter(FileWriter, max_seconds=0.1)
+    writer.begin_file(
+        str(tmp_path / "rec.mp4"), ic4.ImageType(ic4.PixelFormat.Mono8, 4, 4), 10.0
+    )
+    for i in range(10):
+        # 40 frames per second, faster than the nominal frame rate
+        buf = SimpleNamespace(
+            meta_data=ic4.ImageBuffer.MetaData(i, 10**9 + i * 25_000_000)
+        )
+        writer.add_frame(buf)
+    writer.finish_file()
+    used = [w for w in FileWriter.writers if w.frames]
+    assert [w.frames for w in used] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_rollover_by_frame_rate_without_timestamps(tmp_path):
+    writer = SegmentedVideoWriter(FileWriter, max_seconds=0.3)
+    write_frames(writer, str(tmp_path / "rec.mp4"), 7)
+    used = [w for w in FileWriter.writers if w.frames]
+    assert [w.frames for w in used] == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_needs_a_limit():
+    with pytest.raises(ValueError):
+        SegmentedVideoWriter(FileWriter)
+
+
+@pytest.fixture
+def recordings_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+
+
+def record(recorder, settings, frames):
+    recorder.start_recording("session.mp4", settings=settings)
+    end = time.perf_counter() + 5
+    while recorder.get_writer_statistics().frames_written < frames:
+        assert time.perf_counter() < end
+        time.sleep(0.005)
+    recorder.stop_recording()
+    recorder.stop_streaming()
+
+
+def test_recorder_segments_without_dropping_frames(recordings_dir):
+    recorder = SimulatedRecorder(width=32, height=24, frame_rate=200.0)
+    recorder._create_segment_writer = FileWriter
+    record(recorder, RecorderSettings(segment_frames=20), 70)
+
+    used = [w for w in FileWriter.writers if w.frames]
+    assert len(used) >= 4
+    assert all(len(w.frames) == 20 for w in used[:-1])
+    frame_numbers = [number for w in used for number in w.frames]
+    assert np.all(np.diff(frame_numbers) == 1)
+    log = read_frame_log(os.path.join(RECORDINGS_DIR, "session" + FRAME_LOG_SUFFIX))
+    assert list(log["frame_number"]) == frame_numbers
+    assert recorder.get_writer_statistics().frames_dropped == 0
+
+
+def test_raw_recording_segments(recordings_dir):
+    recorder = SimulatedRecorder(width=32, height=24, frame_rate=200.0)
+    settings = RecorderSettings(mode=RecordingMode.RAW, segment_frames=25)
+    record(recorder, settings, 60)
+
+    segments = sorted(f for f in os.listdir(RECORDINGS_DIR) if ".seg" in f)
+    assert segments[0] == "session.seg0000.raw"
+    parts = [RawRecording(os.path.join(RECORDINGS_DIR, s)) for s in segments]
+    assert all(len(part) == 25 for part in parts[:-1])
+    frame_numbers = np.concatenate([p.index["frame_number"] for p in parts])
+    assert len(frame_numbers) == recorder.get_writer_statistics().frames_written
+    assert np.all(np.diff(frame_numbers.astype(np.int64)) == 1)
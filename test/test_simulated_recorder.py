@@ -0,0 +1,199 @@
+import os
+import time
+import pytest
+from frame_log import read_frame_log
+from frame_writer import OverflowPolicy
+from recorder import RECORDINGS_DIR, RecorderSettings
+from simulated_recorder import NullVideoWriter, SimulatedRecorder
+
+DEVICE_STATE_FILE = os.path.join(
+    os.path.dirname(__file__), "..", "default_config", "device.json"
+)
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end:
+            raise TimeoutError
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def recordings_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RECORDINGS_DIR)
+
+
+@pytest.fixture
+def recorder(recordings_dir):
+    recorder = SimulatedRecorder(width=64, height=48, frame_rate=200.0)
+    yield recorder
+    recorder.stop_streaming()
+
+
+def test_load_state_from_file():
+    recorder = SimulatedRecorder()
+    recorder.load_state_from_file(DEVICE_STATE_FILE)
+    recorder.start_streaming()
+    try:
+        image_type = recorder.sink.output_image_type
+        assert image_type.pixel_format.name == "Mono8"
+        assert (image_type.width, image_type.height) == (720, 484)
+        assert recorder.get_frame_rate() == pytest.approx(100.436)
+    finally:
+        recorder.stop_streaming()
+
+
+def test_free_running_recording(recorder):
+    recorder.start_recording("simulated.mp4")
+    assert recorder.is_streaming()
+    assert recorder.is_recording()
+    wait_for(lambda: recorder.video_writer.frames_written >= 20)
+    recorder.stop_recording()
+
+    assert not recorder.is_recording()
+    stats = recorder.get_writer_statistics()
+    assert stats.frames_written >= 20
+    assert stats.frames_dropped == 0
+    assert recorder.video_writer.frame_rate == 200.0
+    assert recorder.video_writer.frames_written == stats.frames_written
+
+
+def test_software_trigger(recorder):
+    recorder.start_recording("triggered.mp4", triggered_mode=True)
+    assert recorder.get_triggered_record_mode()
+    for _ in range(5):
+        recorder.software_trigger()
+    wait_for(lambda: recorder.get_number_of_written_frames() == 5)
+    recorder.stop_recording()
+    assert recorder.video_writer.frames_written == 5
+
+
+def test_slow_writer_drops_frames(recordings_dir):
+    recorder = SimulatedRecorder(
+        width=64,
+        height=48,
+        frame_rate=500.0,
+        video_writer=NullVideoWriter(encode_time=0.02),
+        writer_queue_depth=2,
+        writer_overflow_policy=OverflowPolicy.DROP_OLDEST,
+    )
+    recorder.start_recording("slow.mp4")
+    wait_for(lambda: recorder.get_writer_statistics().frames_dropped > 0)
+    # sampled in the background, not by reading the status
+    wait_for(lambda: recorder.get_status().drops_per_second > 0)
+    recorder.stop_recording()
+    recorder.stop_streaming()
+
+    stats = recorder.get_writer_statistics()
+    assert stats.max_queue_depth == 2
+    assert recorder.grabber.stream_statistics.sink_underrun == 0
+
+
+def test_status_reports_stage_latencies(recorder):
+    recorder.start_recording("instrumented.mp4")
+    wait_for(lambda: recorder.video_writer.frames_written >= 50)
+    status = recorder.get_status()
+    recorder.stop_recording()
+
+    assert status.streaming and status.recording
+    assert status.frames_delivered >= 50
+    assert 50 <= status.frames_written <= status.frames_delivered
+    assert sum(status.frames_dropped.values()) == 0
+    assert status.frames_per_second == pytest.approx(200, rel=0.5)
+    for stage in ("sink_pop", "chunkdata", "writer_queue", "write"):
+        assert status.stages[stage].count > 0
+
+
+@pytest.mark.parametrize("fill_gaps", [False, True])
+def test_triggered_recording_accounts_for_missing_frames(recorder, fill_gaps):
+    recorder.start_recording(
+        "gaps.mp4",
+        frame_rate=30.0,
+        triggered_mode=True,
+        settings=RecorderSettings(fill_gaps=fill_gaps),
+    )
+    for _ in range(3):
+        recorder.software_trigger()
+    wait_for(lambda: recorder.get_writer_statistics().frames_written == 3)
+    # frames 4 and 5 are lost on the way, then the camera ignores a trigger
+    recorder.grabber.simulate_lost_frames(2)
+    for _ in range(3):
+        recorder.software_trigger()
+    recorder.grabber.simulate_missed_trigger()
+    recorder.software_trigger()
+    wait_for(lambda: recorder.get_writer_statistics().frames_written == 5)
+    recorder.stop_recording()
+
+    status = recorder.get_status()
+    assert status.frames_missing == 2
+    assert status.missed_triggers == 1
+    assert recorder.video_writer.frame_rate == 30.0
+    log = read_frame_log(os.path.join(RECORDINGS_DIR, "gaps.frames.bin"))
+    if fill_gaps:
+        assert status.placeholder_frames == 2
+        assert recorder.video_writer.frames_written == 7
+        assert recorder.encoder_statistics.frames == 7
+        assert list(log["frame_number"]) == [1, 2, 3, 4, 5, 6, 7]
+        assert list(log["device_timestamp_ns"] == 0) == [0, 0, 0, 1, 1, 0, 0]
+    else:
+        assert status.placeholder_frames == 0
+        assert recorder.video_writer.frames_written == 5
+        assert list(log["frame_number"]) == [1, 2, 3, 6, 7]
+
+
+def test_arm_then_fire(recorder):
+    recorder.arm("armed.mp4")
+    assert recorder.is_armed() and not recorder.is_recording()
+    assert recorder.get_status().arm_duration_ms > 0
+    time.sleep(0.05)
+    assert recorder.video_writer.frames_written == 0
+
+    recorder.fire()
+    assert recorder.is_recording() and not recorder.is_armed()
+    wait_for(lambda: recorder.video_writer.frames_written >= 5)
+    recorder.stop_recording()
+    assert 0 <= recorder.get_status().first_frame_latency_ms < 1000
+
+
+def test_fire_at_frame_number(recorder):
+    recorder.arm("scheduled.mp4", triggered_mode=True)
+    recorder.fire(at_frame=3)
+    for _ in range(4):
+        recorder.software_trigger()
+    wait_for(lambda: recorder.get_number_of_written_frames() == 4)
+    recorder.stop_recording()
+    assert recorder.video_writer.frames_written == 2
+
+
+def test_fire_at_host_time(recorder):
+    recorder.arm("scheduled.mp4")
+    at_ns = time.time_ns() + 100_000_000
+    recorder.fire(at_ns=at_ns)
+    time.sleep(0.05)
+    assert recorder.video_writer.frames_written == 0
+    wait_for(lambda: recorder.video_writer.frames_written > 0)
+    recorder.stop_recording()
+    assert recorder.fire_statistics.first_frame_ns >= at_ns
+
+
+def test_stop_while_armed(recorder):
+    recorder.arm("unused.mp4")
+    recorder.stop_recording()
+    assert not recorder.is_armed() and not recorder.is_recording()
+    with pytest.raises(RuntimeError):
+        recorder.fire()
+
+
+def test_status_reports_encoder_statistics(recorder):
+    recorder.start_recording("encoded.mp4")
+    wait_for(lambda: recorder.video_writer.frames_written >= 20)
+    recorder.stop_recording()
+    status = recorder.get_status()
+    assert status.encoder == "ic4"
+    assert status.encoder_frames_per_second > 0
+    assert status.encoder_cpu_percent is not None
+    statistics = recorder.encoder_statistics
+    assert statistics.frames == recorder.video_writer.frames_written
+    assert statistics.bytes == statistics.frames * 64 * 48